@@ -0,0 +1,27 @@
+#######
+########## IMPORTS
+####
+
+from storage import migrate_uploads_layout, UPLOADS_DIR, UPLOADS_FANOUT
+from pathlib import Path
+import argparse
+
+
+
+#######
+########## MAIN
+####
+
+#feltöltött fájlok áthelyezése a beállított (UPLOADS_FANOUT) almappás elrendezésbe, a szerver leállítása nélkül:
+#a szerver a fájlokat a régi és az új helyükön is megtalálja, a migráció többször is futtatható
+#(előbb az új elrendezést használó szervert kell elindítani, hogy új fájl már ne a régi helyre kerüljön)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move uploaded files into the sharded directory layout.")
+    parser.add_argument("--uploads-dir", type=Path, default=UPLOADS_DIR)
+    parser.add_argument("--fanout", type=int, default=UPLOADS_FANOUT, help="must match the servers' UPLOADS_FANOUT")
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep after each moved file (limits disk load)")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    stats = migrate_uploads_layout(args.uploads_dir, args.fanout, dry_run=args.dry_run, pause=args.pause)
+    print(f"{stats['moved']} fájl áthelyezve, {stats['in_place']} már a helyén, {stats['conflicts']} ütközés")
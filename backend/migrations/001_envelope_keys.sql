@@ -0,0 +1,18 @@
+-- Supabase (PostgreSQL) séma frissítése: Supabase/SQL Editor-ban futtatandó, egyszer
+-- (többször futtatva sem módosít semmit; SQLite esetén a backend maga adja hozzá az oszlopokat)
+
+-- fájlonkénti adatkulcs a felhasználó kulcsával becsomagolva (NULL: régi, közvetlenül a titkos kulccsal titkosított fájl)
+alter table public.files add column if not exists wrapped_key text;
+
+-- a fájl titkosítási algoritmusa (NULL: régi sor, a user algoritmusával titkosítva)
+alter table public.files add column if not exists algo text;
+
+-- sima fájl tartalmának hash-e (a letöltés ETag-je)
+alter table public.files add column if not exists content_hash text;
+
+-- a user fájl listájának verziója (a /api/files ETag-je), minden módosításkor lép
+alter table public."user" add column if not exists files_version integer not null default 0;
+
+-- a lekérdezések indexei (uuid szerinti keresés, lapozás létrehozás ideje szerint)
+create index if not exists files_user_id_uuid on public.files (user_id, uuid);
+create index if not exists files_user_id_created_at on public.files (user_id, created_at, id);
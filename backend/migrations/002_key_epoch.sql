@@ -0,0 +1,29 @@
+-- kulcs epoch: a titkos kulcs cseréjekor lép, a becsomagolt adatkulcs mellett a csomagoló kulcs epoch-ja tárolódik
+-- (Supabase/SQL Editor-ban futtatandó, egyszer, az 001 után; SQLite esetén a backend maga hozza létre)
+
+alter table public."user" add column if not exists key_epoch integer not null default 0;
+alter table public.files add column if not exists key_epoch integer not null default 0;
+
+-- becsomagolt adatkulcs csak a user aktuális kulcs epoch-jával kerülhet be: a kulcscsere után a régi kulccsal
+-- csomagolt írás (folyamatban lévő feltöltés vagy átalakítás, egy másik worker elavult kulcsa) hibával leáll
+create or replace function public.check_file_key_epoch() returns trigger
+language plpgsql as $$
+declare
+    current_epoch integer;
+begin
+    if new.wrapped_key is null then
+        return new;
+    end if;
+    -- a user sor megosztott zárolása: a kulcscsere (key_epoch léptetése) megvárja a folyamatban lévő írást, és fordítva
+    select key_epoch into current_epoch from public."user" where id = new.user_id for share;
+    if new.key_epoch is distinct from current_epoch then
+        raise exception 'stale key epoch';
+    end if;
+    return new;
+end;
+$$;
+
+drop trigger if exists files_key_epoch on public.files;
+create trigger files_key_epoch
+    before insert or update of wrapped_key, key_epoch on public.files
+    for each row execute function public.check_file_key_epoch();
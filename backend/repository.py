@@ -0,0 +1,1061 @@
+#######
+########## IMPORTS
+####
+
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Awaitable, Callable, List, Optional, Tuple
+from collections import OrderedDict
+import threading
+import time
+import asyncio
+import random
+import sqlite3
+
+
+
+#######
+########## GLOBALS
+####
+
+#írható oszlopok (insert/update csak ezeket engedi)
+USER_COLUMNS = {'name', 'email', 'password_hash', 'algo', 'has_key', 'secret_key_hash'}
+FILE_COLUMNS = {'filename', 'user_id', 'encrypted', 'uuid', 'wrapped_key', 'algo', 'content_hash', 'key_epoch'}
+
+#aszinkron Supabase kapcsolat alapértékei
+SUPABASE_MAX_CONNECTIONS = 20
+SUPABASE_MAX_KEEPALIVE = 10
+SUPABASE_KEEPALIVE_EXPIRY = 30.0 # másodperc
+SUPABASE_TIMEOUT = 10.0 # másodperc
+SUPABASE_RETRIES = 2
+RETRY_BASE_DELAY = 0.1 # másodperc, próbálkozásonként duplázódik
+VERSION_BUMP_ATTEMPTS = 10 # files_version léptetése (compare-and-set) egyidejű írások esetén
+
+#fájl lista: rendezhető és lekérhető oszlopok
+FILE_SORT_COLUMNS = ('created_at', 'filename')
+FILE_LIST_COLUMNS = ('id', 'filename', 'encrypted', 'created_at', 'algo')
+
+#egy IN szűrőbe kerülő értékek maximális száma (URL hossz / SQLite paraméter korlát)
+IN_FILTER_CHUNK = 200
+
+#metaadat cache alapértékei
+CACHE_MAX_ENTRIES = 10000
+CACHE_TTL = 30 # másodperc (több worker esetén ennyi ideig láthat elavult adatot egy másik processz)
+
+
+
+#######
+########## INTERFACE
+####
+
+def _chunks(items: List, size: int = IN_FILTER_CHUNK) -> List[List]:
+    return [items[i:i + size] for i in range(0, len(items), size)] or [[]]
+
+class Repository(ABC):
+    #felhasználók és fájlok metaadatainak tárolása (a fájlok tartalma a fájlrendszerben van)
+
+    #felhasználók
+    @abstractmethod
+    def get_user(self, user_id: int) -> Optional[dict]: ...
+
+    @abstractmethod
+    def get_user_by_email(self, email: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    def email_exists(self, email: str, exclude_user_id: int) -> bool: ...
+
+    @abstractmethod
+    def create_user(self, data: dict) -> Optional[dict]: ...
+
+    @abstractmethod
+    def update_user(self, user_id: int, data: dict) -> Optional[dict]: ...
+
+    #a user fájl listájának aktuális verziója, mindig az adatbázisból (feltételes lekéréshez); None, ha nincs ilyen user
+    @abstractmethod
+    def get_files_version(self, user_id: int) -> Optional[int]: ...
+
+    #a user fájl listájának verziója (files_version) eggyel nő, az új értéket adja vissza
+    @abstractmethod
+    def bump_files_version(self, user_id: int) -> Optional[int]: ...
+
+    #kulcscsere: új kulcs hash és a kulcs epoch-jának (key_epoch) léptetése, csak ha az epoch még a megadott (compare-and-set)
+    #az új epoch-ot adja vissza, None, ha közben más lépett; becsomagolt adatkulcs csak a user aktuális epoch-jával írható
+    @abstractmethod
+    def advance_key_epoch(self, user_id: int, key_epoch: int, secret_key_hash: str) -> Optional[int]: ...
+
+    #user és a megadott nevű fájljai egyetlen lekérdezéssel
+    @abstractmethod
+    def get_user_with_files(self, user_id: int, filenames: List[str]) -> Tuple[Optional[dict], List[dict]]: ...
+
+    #fájlok
+    @abstractmethod
+    def list_files(self, user_id: int) -> List[dict]: ...
+
+    @abstractmethod
+    def list_encrypted_files(self, user_id: int) -> List[dict]: ...
+
+    #egy oldal a fájl listából (keyset lapozás: a (rendezési érték, id) pár utáni sorok)
+    @abstractmethod
+    def list_files_page(self, user_id: int, columns: List[str], sort: str, descending: bool, after: Optional[tuple], limit: int) -> List[dict]: ...
+
+    @abstractmethod
+    def get_file(self, user_id: int, filename: str) -> Optional[dict]: ...
+
+    #a megadott uuid-ú fájl sorok, mindig az adatbázisból (pl. egy bizonytalan kimenetelű beszúrás ellenőrzésére)
+    @abstractmethod
+    def get_files_by_uuid(self, user_id: int, uuids: List[str]) -> List[dict]: ...
+
+    @abstractmethod
+    def create_file(self, data: dict) -> Optional[dict]: ...
+
+    #több fájl sor beszúrása egyetlen utasítással (mind vagy egyik sem)
+    @abstractmethod
+    def create_files(self, rows: List[dict]) -> List[dict]: ...
+
+    @abstractmethod
+    def delete_file(self, user_id: int, filename: str) -> bool: ...
+
+    #feltételes frissítés: csak ha a sor még a megadott uuid-ra mutat
+    @abstractmethod
+    def update_file(self, user_id: int, uuid: str, data: dict) -> bool: ...
+
+    #algoritmus nélküli (régi) titkosított sorok kitöltése
+    @abstractmethod
+    def fill_missing_file_algo(self, user_id: int, algo: str): ...
+
+
+
+#######
+########## SUPABASE
+####
+
+def _postgrest_value(value) -> str:
+    #PostgREST or= szűrőben idézőjelezett érték (vessző, zárójel a fájlnévben)
+    text = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{text}"'
+
+def _files_page_query(query, user_id: int, columns: List[str], sort: str, descending: bool, after: Optional[tuple], limit: int):
+    query = query.select(",".join(columns)).eq("user_id", user_id)
+    if after:
+        value, file_id = after
+        op = "lt" if descending else "gt"
+        query = query.or_(f"{sort}.{op}.{_postgrest_value(value)},and({sort}.eq.{_postgrest_value(value)},id.{op}.{file_id})")
+    return query.order(sort, desc=descending).order("id", desc=descending).limit(limit)
+
+class SupabaseRepository(Repository):
+    def __init__(self, client):
+        self.client = client
+
+    def get_user(self, user_id: int) -> Optional[dict]:
+        users = self.client.table("user").select("*").eq("id", user_id).execute().data
+        return users[0] if len(users) == 1 else None
+
+    def get_user_by_email(self, email: str) -> Optional[dict]:
+        users = self.client.table("user").select("*").eq("email", email).execute().data
+        return users[0] if len(users) == 1 else None
+
+    def email_exists(self, email: str, exclude_user_id: int) -> bool:
+        response = self.client.table("user").select("id").eq("email", email).neq("id", exclude_user_id).execute()
+        return len(response.data) > 0
+
+    def create_user(self, data: dict) -> Optional[dict]:
+        users = self.client.table("user").insert(data).execute().data
+        return users[0] if users else None
+
+    def update_user(self, user_id: int, data: dict) -> Optional[dict]:
+        users = self.client.table("user").update(data).eq("id", user_id).execute().data
+        return users[0] if users else None
+
+    def get_files_version(self, user_id: int) -> Optional[int]:
+        users = self.client.table("user").select("files_version").eq("id", user_id).execute().data
+        return (users[0]["files_version"] or 0) if users else None
+
+    def bump_files_version(self, user_id: int) -> Optional[int]:
+        #PostgREST-ben nincs atomi növelés: feltételes frissítés a beolvasott értékre, ütközésnél újra
+        for _ in range(VERSION_BUMP_ATTEMPTS):
+            users = self.client.table("user").select("files_version").eq("id", user_id).execute().data
+            if not users:
+                return None
+            version = users[0]["files_version"] or 0
+            updated = self.client.table("user").update({"files_version": version + 1}).eq("id", user_id).eq("files_version", version).execute().data
+            if updated:
+                return version + 1
+        raise RuntimeError("files_version update conflict")
+
+    def advance_key_epoch(self, user_id: int, key_epoch: int, secret_key_hash: str) -> Optional[int]:
+        updated = self.client.table("user").update({"secret_key_hash": secret_key_hash, "key_epoch": key_epoch + 1}).eq("id", user_id).eq("key_epoch", key_epoch).execute().data
+        return key_epoch + 1 if updated else None
+
+    def get_user_with_files(self, user_id: int, filenames: List[str]) -> Tuple[Optional[dict], List[dict]]:
+        #beágyazott (join-olt) lekérdezés a files.user_id idegen kulcson keresztül
+        chunks = _chunks(filenames)
+        users = self.client.table("user").select("*, files(*)").eq("id", user_id).in_("files.filename", chunks[0]).execute().data
+        if len(users) != 1:
+            return None, []
+        user = users[0]
+        files = user.pop("files", None) or []
+
+        #sok fájlnév esetén a maradék külön IN lekérdezésekben
+        for chunk in chunks[1:]:
+            files += self.client.table("files").select("*").eq("user_id", user_id).in_("filename", chunk).execute().data
+        return user, files
+
+    def list_files(self, user_id: int) -> List[dict]:
+        return self.client.table("files").select("*").eq("user_id", user_id).execute().data
+
+    def list_encrypted_files(self, user_id: int) -> List[dict]:
+        return self.client.table("files").select("*").eq("user_id", user_id).eq("encrypted", True).execute().data
+
+    def list_files_page(self, user_id: int, columns: List[str], sort: str, descending: bool, after: Optional[tuple], limit: int) -> List[dict]:
+        return _files_page_query(self.client.table("files"), user_id, columns, sort, descending, after, limit).execute().data
+
+    def get_file(self, user_id: int, filename: str) -> Optional[dict]:
+        files = self.client.table("files").select("*").eq("user_id", user_id).eq("filename", filename).execute().data
+        return files[0] if files else None
+
+    def get_files_by_uuid(self, user_id: int, uuids: List[str]) -> List[dict]:
+        files = []
+        for chunk in _chunks(uuids):
+            files += self.client.table("files").select("*").eq("user_id", user_id).in_("uuid", chunk).execute().data
+        return files
+
+    def create_file(self, data: dict) -> Optional[dict]:
+        files = self.client.table("files").insert(data).execute().data
+        return files[0] if files else None
+
+    def create_files(self, rows: List[dict]) -> List[dict]:
+        return self.client.table("files").insert(rows).execute().data if rows else []
+
+    def delete_file(self, user_id: int, filename: str) -> bool:
+        response = self.client.table("files").delete().eq("user_id", user_id).eq("filename", filename).execute()
+        return bool(response.data)
+
+    def update_file(self, user_id: int, uuid: str, data: dict) -> bool:
+        response = self.client.table("files").update(data).eq("user_id", user_id).eq("uuid", uuid).execute()
+        return bool(response.data)
+
+    def fill_missing_file_algo(self, user_id: int, algo: str):
+        self.client.table("files").update({"algo": algo}).eq("user_id", user_id).eq("encrypted", True).is_("algo", "null").execute()
+
+
+
+#######
+########## SQLITE
+####
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS "user" (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL,
+    algo TEXT NOT NULL,
+    has_key INTEGER NOT NULL DEFAULT 0,
+    secret_key_hash TEXT,
+    files_version INTEGER NOT NULL DEFAULT 0,
+    key_epoch INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES "user"(id) ON DELETE CASCADE,
+    filename TEXT NOT NULL,
+    encrypted INTEGER NOT NULL DEFAULT 0,
+    uuid TEXT NOT NULL,
+    wrapped_key TEXT,
+    algo TEXT,
+    content_hash TEXT,
+    key_epoch INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+);
+CREATE UNIQUE INDEX IF NOT EXISTS files_user_id_filename ON files(user_id, filename);
+CREATE INDEX IF NOT EXISTS files_user_id_encrypted ON files(user_id, encrypted);
+CREATE INDEX IF NOT EXISTS files_user_id_uuid ON files(user_id, uuid);
+CREATE INDEX IF NOT EXISTS files_user_id_created_at ON files(user_id, created_at, id);
+"""
+
+#korábban létrehozott adatbázisfájlokhoz utólag hozzáadott oszlopok
+SQLITE_ADDED_COLUMNS = (
+    ('user', 'files_version', 'INTEGER NOT NULL DEFAULT 0'),
+    ('files', 'content_hash', 'TEXT'),
+    ('user', 'key_epoch', 'INTEGER NOT NULL DEFAULT 0'),
+    ('files', 'key_epoch', 'INTEGER NOT NULL DEFAULT 0'),
+)
+
+#becsomagolt adatkulcs csak a user aktuális kulcs epoch-jával kerülhet be (a kulcscsere után a régi kulccsal
+#csomagolt írás, pl. egy félbemaradt átalakítás vagy egy másik worker elavult kulcsa, hibával leáll)
+#az oszlopok hozzáadása után jön létre (régi adatbázisfájloknál még nincs key_epoch)
+SQLITE_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS files_key_epoch_insert BEFORE INSERT ON files
+WHEN NEW.wrapped_key IS NOT NULL AND NEW.key_epoch IS NOT (SELECT key_epoch FROM "user" WHERE id = NEW.user_id)
+BEGIN SELECT RAISE(ABORT, 'stale key epoch'); END;
+CREATE TRIGGER IF NOT EXISTS files_key_epoch_update BEFORE UPDATE OF wrapped_key, key_epoch ON files
+WHEN NEW.wrapped_key IS NOT NULL AND NEW.key_epoch IS NOT (SELECT key_epoch FROM "user" WHERE id = NEW.user_id)
+BEGIN SELECT RAISE(ABORT, 'stale key epoch'); END;
+"""
+
+USER_FIELDS = ('id', 'name', 'email', 'password_hash', 'algo', 'has_key', 'secret_key_hash', 'files_version', 'key_epoch', 'created_at')
+FILE_FIELDS = ('id', 'user_id', 'filename', 'encrypted', 'uuid', 'wrapped_key', 'algo', 'content_hash', 'key_epoch', 'created_at')
+
+class SQLiteRepository(Repository):
+    #beágyazott adatbázis egy node-os telepítéshez és offline teszteléshez
+    #WAL módban az olvasások nem várnak az írásokra; szálanként külön kapcsolat
+    def __init__(self, path: str):
+        self.path = str(path)
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._connection().executescript(SQLITE_SCHEMA)
+        self._add_missing_columns()
+        self._connection().executescript(SQLITE_TRIGGERS)
+
+    def _add_missing_columns(self):
+        connection = self._connection()
+        for table, column, definition in SQLITE_ADDED_COLUMNS:
+            existing = {row["name"] for row in connection.execute(f'PRAGMA table_info("{table}")')}
+            if column not in existing:
+                connection.execute(f'ALTER TABLE "{table}" ADD COLUMN {column} {definition}')
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            self._local.connection = connection
+        return connection
+
+    def _query(self, sql: str, params: tuple = ()) -> List[dict]:
+        rows = self._connection().execute(sql, params).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        return self._connection().execute(sql, params)
+
+    @staticmethod
+    def _to_dict(row) -> dict:
+        #logikai oszlopok a Supabase-zel megegyező formában
+        data = dict(row)
+        for column in ('has_key', 'encrypted'):
+            if column in data:
+                data[column] = bool(data[column])
+        return data
+
+    @staticmethod
+    def _columns(data: dict, allowed: set) -> List[str]:
+        columns = list(data)
+        unknown = set(columns) - allowed
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(sorted(unknown))}")
+        return columns
+
+    def get_user(self, user_id: int) -> Optional[dict]:
+        users = self._query('SELECT * FROM "user" WHERE id = ?', (user_id,))
+        return users[0] if users else None
+
+    def get_user_by_email(self, email: str) -> Optional[dict]:
+        users = self._query('SELECT * FROM "user" WHERE email = ?', (email,))
+        return users[0] if users else None
+
+    def email_exists(self, email: str, exclude_user_id: int) -> bool:
+        return bool(self._query('SELECT id FROM "user" WHERE email = ? AND id != ?', (email, exclude_user_id)))
+
+    def create_user(self, data: dict) -> Optional[dict]:
+        columns = self._columns(data, USER_COLUMNS)
+        cursor = self._execute(
+            f'INSERT INTO "user" ({", ".join(columns)}) VALUES ({", ".join("?" for _ in columns)})',
+            tuple(data[column] for column in columns),
+        )
+        return self.get_user(cursor.lastrowid)
+
+    def update_user(self, user_id: int, data: dict) -> Optional[dict]:
+        columns = self._columns(data, USER_COLUMNS)
+        cursor = self._execute(
+            f'UPDATE "user" SET {", ".join(f"{column} = ?" for column in columns)} WHERE id = ?',
+            tuple(data[column] for column in columns) + (user_id,),
+        )
+        return self.get_user(user_id) if cursor.rowcount else None
+
+    def get_files_version(self, user_id: int) -> Optional[int]:
+        rows = self._query('SELECT files_version FROM "user" WHERE id = ?', (user_id,))
+        return rows[0]['files_version'] if rows else None
+
+    def bump_files_version(self, user_id: int) -> Optional[int]:
+        rows = self._query('UPDATE "user" SET files_version = files_version + 1 WHERE id = ? RETURNING files_version', (user_id,))
+        return rows[0]['files_version'] if rows else None
+
+    def advance_key_epoch(self, user_id: int, key_epoch: int, secret_key_hash: str) -> Optional[int]:
+        rows = self._query(
+            'UPDATE "user" SET secret_key_hash = ?, key_epoch = key_epoch + 1 WHERE id = ? AND key_epoch = ? RETURNING key_epoch',
+            (secret_key_hash, user_id, key_epoch),
+        )
+        return rows[0]['key_epoch'] if rows else None
+
+    def get_user_with_files(self, user_id: int, filenames: List[str]) -> Tuple[Optional[dict], List[dict]]:
+        chunks = _chunks(filenames)
+        columns = [f'u.{field} AS "u.{field}"' for field in USER_FIELDS] + [f'f.{field} AS "f.{field}"' for field in FILE_FIELDS]
+        rows = self._connection().execute(
+            f'SELECT {", ".join(columns)} FROM "user" u '
+            f'LEFT JOIN files f ON f.user_id = u.id AND f.filename IN ({", ".join("?" for _ in chunks[0])}) '
+            f'WHERE u.id = ?',
+            tuple(chunks[0]) + (user_id,),
+        ).fetchall()
+        if not rows:
+            return None, []
+        user = self._to_dict({field: rows[0][f"u.{field}"] for field in USER_FIELDS})
+        files = [self._to_dict({field: row[f"f.{field}"] for field in FILE_FIELDS}) for row in rows if row["f.id"] is not None]
+
+        #sok fájlnév esetén a maradék külön IN lekérdezésekben
+        for chunk in chunks[1:]:
+            files += self._query(
+                f'SELECT * FROM files WHERE user_id = ? AND filename IN ({", ".join("?" for _ in chunk)})',
+                (user_id,) + tuple(chunk),
+            )
+        return user, files
+
+    def list_files(self, user_id: int) -> List[dict]:
+        return self._query("SELECT * FROM files WHERE user_id = ? ORDER BY id", (user_id,))
+
+    def list_encrypted_files(self, user_id: int) -> List[dict]:
+        return self._query("SELECT * FROM files WHERE user_id = ? AND encrypted = 1 ORDER BY id", (user_id,))
+
+    def list_files_page(self, user_id: int, columns: List[str], sort: str, descending: bool, after: Optional[tuple], limit: int) -> List[dict]:
+        if sort not in FILE_SORT_COLUMNS or not set(columns) <= set(FILE_LIST_COLUMNS):
+            raise ValueError("Invalid sort or columns")
+        op, direction = ("<", "DESC") if descending else (">", "ASC")
+        where, params = "user_id = ?", [user_id]
+        if after:
+            where += f" AND ({sort} {op} ? OR ({sort} = ? AND id {op} ?))"
+            params += [after[0], after[0], after[1]]
+        return self._query(
+            f"SELECT {', '.join(columns)} FROM files WHERE {where} ORDER BY {sort} {direction}, id {direction} LIMIT ?",
+            tuple(params) + (limit,),
+        )
+
+    def get_file(self, user_id: int, filename: str) -> Optional[dict]:
+        files = self._query("SELECT * FROM files WHERE user_id = ? AND filename = ?", (user_id, filename))
+        return files[0] if files else None
+
+    def get_files_by_uuid(self, user_id: int, uuids: List[str]) -> List[dict]:
+        files = []
+        for chunk in _chunks(uuids):
+            files += self._query(f'SELECT * FROM files WHERE user_id = ? AND uuid IN ({", ".join("?" for _ in chunk)})', (user_id,) + tuple(chunk))
+        return files
+
+    def create_file(self, data: dict) -> Optional[dict]:
+        columns = self._columns(data, FILE_COLUMNS)
+        cursor = self._execute(
+            f'INSERT INTO files ({", ".join(columns)}) VALUES ({", ".join("?" for _ in columns)})',
+            tuple(data[column] for column in columns),
+        )
+        files = self._query("SELECT * FROM files WHERE id = ?", (cursor.lastrowid,))
+        return files[0] if files else None
+
+    def create_files(self, rows: List[dict]) -> List[dict]:
+        if not rows:
+            return []
+        connection = self._connection()
+        ids = []
+        #egy tranzakcióban: hiba esetén egyik sor sem marad meg
+        connection.execute("BEGIN")
+        try:
+            for data in rows:
+                columns = self._columns(data, FILE_COLUMNS)
+                cursor = connection.execute(
+                    f'INSERT INTO files ({", ".join(columns)}) VALUES ({", ".join("?" for _ in columns)})',
+                    tuple(data[column] for column in columns),
+                )
+                ids.append(cursor.lastrowid)
+            connection.execute("COMMIT")
+        except:
+            connection.execute("ROLLBACK")
+            raise
+        files = []
+        for chunk in _chunks(ids):
+            files += self._query(f'SELECT * FROM files WHERE id IN ({", ".join("?" for _ in chunk)}) ORDER BY id', tuple(chunk))
+        return files
+
+    def delete_file(self, user_id: int, filename: str) -> bool:
+        cursor = self._execute("DELETE FROM files WHERE user_id = ? AND filename = ?", (user_id, filename))
+        return cursor.rowcount > 0
+
+    def update_file(self, user_id: int, uuid: str, data: dict) -> bool:
+        columns = self._columns(data, FILE_COLUMNS)
+        cursor = self._execute(
+            f'UPDATE files SET {", ".join(f"{column} = ?" for column in columns)} WHERE user_id = ? AND uuid = ?',
+            tuple(data[column] for column in columns) + (user_id, uuid),
+        )
+        return cursor.rowcount > 0
+
+    def fill_missing_file_algo(self, user_id: int, algo: str):
+        self._execute("UPDATE files SET algo = ? WHERE user_id = ? AND encrypted = 1 AND algo IS NULL", (algo, user_id))
+
+
+
+#######
+########## ASYNC
+####
+
+class AsyncRepository:
+    #a Repository aszinkron változata az event loop-ból való használatra
+    #alapértelmezetten a szinkron repository metódusait futtatja a megadott executor-on (pl. SQLite)
+    def __init__(self, repo: Repository, run_io: Callable[..., Awaitable]):
+        self.repo = repo
+        self.run_io = run_io
+
+    async def close(self):
+        pass
+
+    async def get_user(self, user_id: int) -> Optional[dict]:
+        return await self.run_io(self.repo.get_user, user_id)
+
+    async def get_user_by_email(self, email: str) -> Optional[dict]:
+        return await self.run_io(self.repo.get_user_by_email, email)
+
+    async def email_exists(self, email: str, exclude_user_id: int) -> bool:
+        return await self.run_io(self.repo.email_exists, email, exclude_user_id)
+
+    async def create_user(self, data: dict) -> Optional[dict]:
+        return await self.run_io(self.repo.create_user, data)
+
+    async def update_user(self, user_id: int, data: dict) -> Optional[dict]:
+        return await self.run_io(self.repo.update_user, user_id, data)
+
+    async def get_files_version(self, user_id: int) -> Optional[int]:
+        return await self.run_io(self.repo.get_files_version, user_id)
+
+    async def bump_files_version(self, user_id: int) -> Optional[int]:
+        return await self.run_io(self.repo.bump_files_version, user_id)
+
+    async def advance_key_epoch(self, user_id: int, key_epoch: int, secret_key_hash: str) -> Optional[int]:
+        return await self.run_io(self.repo.advance_key_epoch, user_id, key_epoch, secret_key_hash)
+
+    async def get_user_with_files(self, user_id: int, filenames: List[str]) -> Tuple[Optional[dict], List[dict]]:
+        return await self.run_io(self.repo.get_user_with_files, user_id, filenames)
+
+    async def list_files(self, user_id: int) -> List[dict]:
+        return await self.run_io(self.repo.list_files, user_id)
+
+    async def list_encrypted_files(self, user_id: int) -> List[dict]:
+        return await self.run_io(self.repo.list_encrypted_files, user_id)
+
+    async def list_files_page(self, user_id: int, columns: List[str], sort: str, descending: bool, after: Optional[tuple], limit: int) -> List[dict]:
+        return await self.run_io(self.repo.list_files_page, user_id, columns, sort, descending, after, limit)
+
+    async def get_file(self, user_id: int, filename: str) -> Optional[dict]:
+        return await self.run_io(self.repo.get_file, user_id, filename)
+
+    async def get_files_by_uuid(self, user_id: int, uuids: List[str]) -> List[dict]:
+        return await self.run_io(self.repo.get_files_by_uuid, user_id, uuids)
+
+    async def create_file(self, data: dict) -> Optional[dict]:
+        return await self.run_io(self.repo.create_file, data)
+
+    async def create_files(self, rows: List[dict]) -> List[dict]:
+        return await self.run_io(self.repo.create_files, rows)
+
+    async def delete_file(self, user_id: int, filename: str) -> bool:
+        return await self.run_io(self.repo.delete_file, user_id, filename)
+
+    async def update_file(self, user_id: int, uuid: str, data: dict) -> bool:
+        return await self.run_io(self.repo.update_file, user_id, uuid, data)
+
+    async def fill_missing_file_algo(self, user_id: int, algo: str):
+        return await self.run_io(self.repo.fill_missing_file_algo, user_id, algo)
+
+    #gyorsítótárazott változatnál a user fájljainak eldobása (pl. egy másik processz módosíthatta)
+    def invalidate_files(self, user_id: int):
+        pass
+
+class AsyncSupabaseRepository(AsyncRepository):
+    #nem blokkoló Supabase elérés: közös, korlátos méretű HTTP kapcsolat pool keep-alive-val,
+    #hívásonkénti időkorlát és újrapróbálás véletlen várakozással (jitter)
+    def __init__(
+        self, repo: Repository, run_io: Callable[..., Awaitable], supabase_url: str, supabase_key: str,
+        max_connections: int = SUPABASE_MAX_CONNECTIONS, max_keepalive: int = SUPABASE_MAX_KEEPALIVE,
+        keepalive_expiry: float = SUPABASE_KEEPALIVE_EXPIRY, timeout: float = SUPABASE_TIMEOUT, retries: int = SUPABASE_RETRIES,
+    ):
+        super().__init__(repo, run_io)
+        self.supabase_url = supabase_url
+        self.supabase_key = supabase_key
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.retries = retries
+        self._clients = {}   # event loop -> (Supabase kliens, httpx kliens)
+        self._clients_lock = threading.Lock()
+
+    def _get_client(self):
+        #a kliens (és a kapcsolat pool) az event loop-hoz kötött, loop-onként első használatkor jön létre
+        loop = asyncio.get_running_loop()
+        with self._clients_lock:
+            entry = self._clients.get(loop)
+            if entry is None:
+                #lezárt loop-ok kliensei: a kapcsolataik már nem használhatók, a hivatkozás eldobásával felszabadulnak
+                for closed_loop in [old_loop for old_loop in self._clients if old_loop.is_closed()]:
+                    del self._clients[closed_loop]
+
+                import httpx
+                from supabase import AsyncClient, AsyncClientOptions
+                http_client = httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_keepalive,
+                        keepalive_expiry=self.keepalive_expiry,
+                    ),
+                    timeout=httpx.Timeout(self.timeout),
+                )
+                entry = (AsyncClient(self.supabase_url, self.supabase_key, AsyncClientOptions(httpx_client=http_client)), http_client)
+                self._clients[loop] = entry
+        return entry[0]
+
+    async def close(self):
+        #a futó loop-hoz tartozó kapcsolat pool lezárása (leálláskor)
+        with self._clients_lock:
+            entry = self._clients.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await entry[1].aclose()
+
+    async def _execute(self, build_query: Callable, idempotent: bool = True) -> List[dict]:
+        import httpx
+        for attempt in range(self.retries + 1):
+            try:
+                response = await asyncio.wait_for(build_query(self._get_client()).execute(), self.timeout)
+                return response.data
+            except (httpx.TransportError, asyncio.TimeoutError) as e:
+                #nem idempotens kérés csak akkor ismételhető, ha biztosan nem ment ki
+                retryable = idempotent or isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+                if not retryable or attempt == self.retries:
+                    raise
+                #exponenciális várakozás teljes jitter-rel
+                await asyncio.sleep(random.uniform(0, RETRY_BASE_DELAY * 2 ** attempt))
+
+    async def get_user(self, user_id: int) -> Optional[dict]:
+        users = await self._execute(lambda client: client.table("user").select("*").eq("id", user_id))
+        return users[0] if len(users) == 1 else None
+
+    async def get_user_by_email(self, email: str) -> Optional[dict]:
+        users = await self._execute(lambda client: client.table("user").select("*").eq("email", email))
+        return users[0] if len(users) == 1 else None
+
+    async def email_exists(self, email: str, exclude_user_id: int) -> bool:
+        users = await self._execute(lambda client: client.table("user").select("id").eq("email", email).neq("id", exclude_user_id))
+        return len(users) > 0
+
+    async def create_user(self, data: dict) -> Optional[dict]:
+        users = await self._execute(lambda client: client.table("user").insert(data), idempotent=False)
+        return users[0] if users else None
+
+    async def update_user(self, user_id: int, data: dict) -> Optional[dict]:
+        users = await self._execute(lambda client: client.table("user").update(data).eq("id", user_id))
+        return users[0] if users else None
+
+    async def get_files_version(self, user_id: int) -> Optional[int]:
+        users = await self._execute(lambda client: client.table("user").select("files_version").eq("id", user_id))
+        return (users[0]["files_version"] or 0) if users else None
+
+    async def bump_files_version(self, user_id: int) -> Optional[int]:
+        #feltételes frissítés a beolvasott értékre, ütközésnél újra (egy újraküldött kérés legfeljebb egy felesleges léptetést okoz)
+        for _ in range(VERSION_BUMP_ATTEMPTS):
+            users = await self._execute(lambda client: client.table("user").select("files_version").eq("id", user_id))
+            if not users:
+                return None
+            version = users[0]["files_version"] or 0
+            updated = await self._execute(lambda client: client.table("user").update({"files_version": version + 1}).eq("id", user_id).eq("files_version", version))
+            if updated:
+                return version + 1
+        raise RuntimeError("files_version update conflict")
+
+    async def advance_key_epoch(self, user_id: int, key_epoch: int, secret_key_hash: str) -> Optional[int]:
+        updated = await self._execute(lambda client: client.table("user").update({"secret_key_hash": secret_key_hash, "key_epoch": key_epoch + 1}).eq("id", user_id).eq("key_epoch", key_epoch))
+        return key_epoch + 1 if updated else None
+
+    async def get_user_with_files(self, user_id: int, filenames: List[str]) -> Tuple[Optional[dict], List[dict]]:
+        chunks = _chunks(filenames)
+        users = await self._execute(lambda client: client.table("user").select("*, files(*)").eq("id", user_id).in_("files.filename", chunks[0]))
+        if len(users) != 1:
+            return None, []
+        user = users[0]
+        files = user.pop("files", None) or []
+
+        #sok fájlnév esetén a maradék külön IN lekérdezésekben
+        for chunk in chunks[1:]:
+            files += await self._execute(lambda client, chunk=chunk: client.table("files").select("*").eq("user_id", user_id).in_("filename", chunk))
+        return user, files
+
+    async def list_files(self, user_id: int) -> List[dict]:
+        return await self._execute(lambda client: client.table("files").select("*").eq("user_id", user_id))
+
+    async def list_encrypted_files(self, user_id: int) -> List[dict]:
+        return await self._execute(lambda client: client.table("files").select("*").eq("user_id", user_id).eq("encrypted", True))
+
+    async def list_files_page(self, user_id: int, columns: List[str], sort: str, descending: bool, after: Optional[tuple], limit: int) -> List[dict]:
+        return await self._execute(lambda client: _files_page_query(client.table("files"), user_id, columns, sort, descending, after, limit))
+
+    async def get_file(self, user_id: int, filename: str) -> Optional[dict]:
+        files = await self._execute(lambda client: client.table("files").select("*").eq("user_id", user_id).eq("filename", filename))
+        return files[0] if files else None
+
+    async def get_files_by_uuid(self, user_id: int, uuids: List[str]) -> List[dict]:
+        files = []
+        for chunk in _chunks(uuids):
+            files += await self._execute(lambda client, chunk=chunk: client.table("files").select("*").eq("user_id", user_id).in_("uuid", chunk))
+        return files
+
+    async def create_file(self, data: dict) -> Optional[dict]:
+        files = await self._execute(lambda client: client.table("files").insert(data), idempotent=False)
+        return files[0] if files else None
+
+    async def create_files(self, rows: List[dict]) -> List[dict]:
+        if not rows:
+            return []
+        return await self._execute(lambda client: client.table("files").insert(rows), idempotent=False)
+
+    async def delete_file(self, user_id: int, filename: str) -> bool:
+        files = await self._execute(lambda client: client.table("files").delete().eq("user_id", user_id).eq("filename", filename))
+        return bool(files)
+
+    async def update_file(self, user_id: int, uuid: str, data: dict) -> bool:
+        files = await self._execute(lambda client: client.table("files").update(data).eq("user_id", user_id).eq("uuid", uuid))
+        return bool(files)
+
+    async def fill_missing_file_algo(self, user_id: int, algo: str):
+        await self._execute(lambda client: client.table("files").update({"algo": algo}).eq("user_id", user_id).eq("encrypted", True).is_("algo", "null"))
+
+
+
+#######
+########## CACHE
+####
+
+class MetadataCache:
+    #folyamaton belüli LRU + TTL cache a user sorokhoz és a userenkénti fájlnév -> fájl sor táblákhoz
+    #az írások a kulcs generációját léptetik: az invalidálás előtt elindult betöltés eredménye nem kerül be
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._stats = {kind: {'hits': 0, 'misses': 0} for kind in ('user', 'files')}
+        self.evictions = 0
+
+    def get(self, key: tuple):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] <= self.ttl:
+                self._entries.move_to_end(key)
+                self._stats[key[0]]['hits'] += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self._stats[key[0]]['misses'] += 1
+            return None
+
+    def generation(self, key: tuple) -> int:
+        with self._lock:
+            return self._generations.get(key, 0)
+
+    def set(self, key: tuple, value, generation: int):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            #közben érkezett írás: az adat már elavult lehet
+            if self._generations.get(key, 0) != generation:
+                return
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: tuple):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **{kind: dict(counters) for kind, counters in self._stats.items()},
+                'entries': len(self._entries),
+                'evictions': self.evictions,
+            }
+
+def _copy_rows(rows: List[dict]) -> List[dict]:
+    #a hívók módosíthatják a kapott sorokat, a cache tartalma nem változhat
+    return [dict(row) for row in rows]
+
+class CachedRepository(Repository):
+    #szinkron repository gyorsítótárral (a háttérszálakon futó írások is invalidálnak)
+    def __init__(self, repo: Repository, cache: MetadataCache):
+        self.repo = repo
+        self.cache = cache
+
+    def _files(self, user_id: int) -> dict:
+        key = ('files', user_id)
+        files = self.cache.get(key)
+        if files is None:
+            generation = self.cache.generation(key)
+            files = {file['filename']: file for file in self.repo.list_files(user_id)}
+            self.cache.set(key, files, generation)
+        return files
+
+    def get_user(self, user_id: int) -> Optional[dict]:
+        key = ('user', user_id)
+        user = self.cache.get(key)
+        if user is None:
+            generation = self.cache.generation(key)
+            user = self.repo.get_user(user_id)
+            if user is None:
+                return None
+            self.cache.set(key, user, generation)
+        return dict(user)
+
+    def get_user_by_email(self, email: str) -> Optional[dict]:
+        return self.repo.get_user_by_email(email)
+
+    def email_exists(self, email: str, exclude_user_id: int) -> bool:
+        return self.repo.email_exists(email, exclude_user_id)
+
+    def create_user(self, data: dict) -> Optional[dict]:
+        return self.repo.create_user(data)
+
+    def update_user(self, user_id: int, data: dict) -> Optional[dict]:
+        try:
+            return self.repo.update_user(user_id, data)
+        finally:
+            self.cache.invalidate(('user', user_id))
+
+    def get_files_version(self, user_id: int) -> Optional[int]:
+        #nem a gyorsítótárból: egy másik worker írása után a gyorsítótárazott user sor még a régi verziót mutathatja
+        return self.repo.get_files_version(user_id)
+
+    def bump_files_version(self, user_id: int) -> Optional[int]:
+        try:
+            return self.repo.bump_files_version(user_id)
+        finally:
+            self.cache.invalidate(('user', user_id))
+
+    def advance_key_epoch(self, user_id: int, key_epoch: int, secret_key_hash: str) -> Optional[int]:
+        try:
+            return self.repo.advance_key_epoch(user_id, key_epoch, secret_key_hash)
+        finally:
+            self.cache.invalidate(('user', user_id))
+
+    def get_user_with_files(self, user_id: int, filenames: List[str]) -> Tuple[Optional[dict], List[dict]]:
+        #mindkettő a gyorsítótárban: nincs lekérdezés
+        user, files = self.cache.get(('user', user_id)), self.cache.get(('files', user_id))
+        if user is not None and files is not None:
+            return dict(user), _copy_rows(files[name] for name in dict.fromkeys(filenames) if name in files)
+
+        #egyébként egyetlen join-olt lekérdezés, csak a kért fájlokkal (a user bekerül a gyorsítótárba;
+        #a fájl tábla nem, az csak a kért sorokat látta)
+        generation = self.cache.generation(('user', user_id))
+        user, matched = self.repo.get_user_with_files(user_id, filenames)
+        if user is not None:
+            self.cache.set(('user', user_id), user, generation)
+            user = dict(user)
+        return user, matched
+
+    def list_files(self, user_id: int) -> List[dict]:
+        return _copy_rows(self._files(user_id).values())
+
+    def list_encrypted_files(self, user_id: int) -> List[dict]:
+        return _copy_rows(file for file in self._files(user_id).values() if file['encrypted'])
+
+    def list_files_page(self, user_id: int, columns: List[str], sort: str, descending: bool, after: Optional[tuple], limit: int) -> List[dict]:
+        return self.repo.list_files_page(user_id, columns, sort, descending, after, limit)
+
+    #egy fájl: a gyorsítótárban lévő fájl táblából, ha nincs ott, célzott lekérdezéssel (nem tölti be a teljes listát)
+    def get_file(self, user_id: int, filename: str) -> Optional[dict]:
+        files = self.cache.get(('files', user_id))
+        if files is None:
+            return self.repo.get_file(user_id, filename)
+        file = files.get(filename)
+        return dict(file) if file else None
+
+    def get_files_by_uuid(self, user_id: int, uuids: List[str]) -> List[dict]:
+        return self.repo.get_files_by_uuid(user_id, uuids)
+
+    def create_file(self, data: dict) -> Optional[dict]:
+        try:
+            return self.repo.create_file(data)
+        finally:
+            self.cache.invalidate(('files', data['user_id']))
+
+    def create_files(self, rows: List[dict]) -> List[dict]:
+        try:
+            return self.repo.create_files(rows)
+        finally:
+            for user_id in {data['user_id'] for data in rows}:
+                self.cache.invalidate(('files', user_id))
+
+    def delete_file(self, user_id: int, filename: str) -> bool:
+        try:
+            return self.repo.delete_file(user_id, filename)
+        finally:
+            self.cache.invalidate(('files', user_id))
+
+    def update_file(self, user_id: int, uuid: str, data: dict) -> bool:
+        try:
+            return self.repo.update_file(user_id, uuid, data)
+        finally:
+            self.cache.invalidate(('files', user_id))
+
+    def fill_missing_file_algo(self, user_id: int, algo: str):
+        try:
+            return self.repo.fill_missing_file_algo(user_id, algo)
+        finally:
+            self.cache.invalidate(('files', user_id))
+
+class CachedAsyncRepository(AsyncRepository):
+    #az aszinkron repository gyorsítótárazott változata, ugyanazzal a cache-sel, mint a CachedRepository
+    def __init__(self, db: AsyncRepository, cache: MetadataCache):
+        self.db = db
+        self.cache = cache
+
+    async def _files(self, user_id: int) -> dict:
+        key = ('files', user_id)
+        files = self.cache.get(key)
+        if files is None:
+            generation = self.cache.generation(key)
+            files = {file['filename']: file for file in await self.db.list_files(user_id)}
+            self.cache.set(key, files, generation)
+        return files
+
+    async def get_user(self, user_id: int) -> Optional[dict]:
+        key = ('user', user_id)
+        user = self.cache.get(key)
+        if user is None:
+            generation = self.cache.generation(key)
+            user = await self.db.get_user(user_id)
+            if user is None:
+                return None
+            self.cache.set(key, user, generation)
+        return dict(user)
+
+    async def get_user_by_email(self, email: str) -> Optional[dict]:
+        return await self.db.get_user_by_email(email)
+
+    async def email_exists(self, email: str, exclude_user_id: int) -> bool:
+        return await self.db.email_exists(email, exclude_user_id)
+
+    async def create_user(self, data: dict) -> Optional[dict]:
+        return await self.db.create_user(data)
+
+    async def update_user(self, user_id: int, data: dict) -> Optional[dict]:
+        try:
+            return await self.db.update_user(user_id, data)
+        finally:
+            self.cache.invalidate(('user', user_id))
+
+    async def get_files_version(self, user_id: int) -> Optional[int]:
+        #nem a gyorsítótárból: egy másik worker írása után a gyorsítótárazott user sor még a régi verziót mutathatja
+        return await self.db.get_files_version(user_id)
+
+    async def bump_files_version(self, user_id: int) -> Optional[int]:
+        try:
+            return await self.db.bump_files_version(user_id)
+        finally:
+            self.cache.invalidate(('user', user_id))
+
+    async def advance_key_epoch(self, user_id: int, key_epoch: int, secret_key_hash: str) -> Optional[int]:
+        try:
+            return await self.db.advance_key_epoch(user_id, key_epoch, secret_key_hash)
+        finally:
+            self.cache.invalidate(('user', user_id))
+
+    async def get_user_with_files(self, user_id: int, filenames: List[str]) -> Tuple[Optional[dict], List[dict]]:
+        #mindkettő a gyorsítótárban: nincs lekérdezés
+        user, files = self.cache.get(('user', user_id)), self.cache.get(('files', user_id))
+        if user is not None and files is not None:
+            return dict(user), _copy_rows(files[name] for name in dict.fromkeys(filenames) if name in files)
+
+        #egyébként egyetlen join-olt lekérdezés, csak a kért fájlokkal (a user bekerül a gyorsítótárba;
+        #a fájl tábla nem, az csak a kért sorokat látta)
+        generation = self.cache.generation(('user', user_id))
+        user, matched = await self.db.get_user_with_files(user_id, filenames)
+        if user is not None:
+            self.cache.set(('user', user_id), user, generation)
+            user = dict(user)
+        return user, matched
+
+    async def list_files(self, user_id: int) -> List[dict]:
+        return _copy_rows((await self._files(user_id)).values())
+
+    async def list_encrypted_files(self, user_id: int) -> List[dict]:
+        return _copy_rows(file for file in (await self._files(user_id)).values() if file['encrypted'])
+
+    #lapozott lista: nem a gyorsítótárból (nagy fájl listáknál ne kerüljön egyben a memóriába)
+    async def list_files_page(self, user_id: int, columns: List[str], sort: str, descending: bool, after: Optional[tuple], limit: int) -> List[dict]:
+        return await self.db.list_files_page(user_id, columns, sort, descending, after, limit)
+
+    async def get_file(self, user_id: int, filename: str) -> Optional[dict]:
+        files = self.cache.get(('files', user_id))
+        if files is None:
+            return await self.db.get_file(user_id, filename)
+        file = files.get(filename)
+        return dict(file) if file else None
+
+    async def get_files_by_uuid(self, user_id: int, uuids: List[str]) -> List[dict]:
+        return await self.db.get_files_by_uuid(user_id, uuids)
+
+    async def create_file(self, data: dict) -> Optional[dict]:
+        try:
+            return await self.db.create_file(data)
+        finally:
+            self.cache.invalidate(('files', data['user_id']))
+
+    async def create_files(self, rows: List[dict]) -> List[dict]:
+        try:
+            return await self.db.create_files(rows)
+        finally:
+            for user_id in {data['user_id'] for data in rows}:
+                self.cache.invalidate(('files', user_id))
+
+    async def delete_file(self, user_id: int, filename: str) -> bool:
+        try:
+            return await self.db.delete_file(user_id, filename)
+        finally:
+            self.cache.invalidate(('files', user_id))
+
+    async def update_file(self, user_id: int, uuid: str, data: dict) -> bool:
+        try:
+            return await self.db.update_file(user_id, uuid, data)
+        finally:
+            self.cache.invalidate(('files', user_id))
+
+    async def fill_missing_file_algo(self, user_id: int, algo: str):
+        try:
+            return await self.db.fill_missing_file_algo(user_id, algo)
+        finally:
+            self.cache.invalidate(('files', user_id))
+
+    def invalidate_files(self, user_id: int):
+        self.cache.invalidate(('files', user_id))
+
+    async def close(self):
+        await self.db.close()
+
+
+
+#######
+########## FACTORY
+####
+
+def create_repository(backend: str, supabase_url: str = None, supabase_key: str = None, sqlite_path: str = None) -> Repository:
+    if backend == "sqlite":
+        return SQLiteRepository(sqlite_path)
+    if backend == "supabase":
+        from supabase import create_client
+        return SupabaseRepository(create_client(supabase_url, supabase_key))
+    raise ValueError(f"Unknown DB_BACKEND: {backend}")
+
+def create_async_repository(backend: str, repo: Repository, run_io: Callable[..., Awaitable], supabase_url: str = None, supabase_key: str = None, **supabase_options) -> AsyncRepository:
+    if backend == "supabase":
+        return AsyncSupabaseRepository(repo, run_io, supabase_url, supabase_key, **supabase_options)
+    return AsyncRepository(repo, run_io)
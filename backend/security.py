@@ -5,12 +5,19 @@
 
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
 from itsdangerous import URLSafeTimedSerializer
 from fastapi import HTTPException, Response
 from dotenv import load_dotenv
+from typing import BinaryIO, Iterator, Optional
+from collections import OrderedDict
 from io import BytesIO
+import threading
 import bcrypt
+import hashlib
+import struct
+import hmac
+import time
 import os
 
 
@@ -22,7 +29,33 @@ import os
 load_dotenv()
 SESSION_KEY = os.getenv('SESSION_KEY')
 SESSION_EXPIRY = 3600 # 1 órra
-serializer = URLSafeTimedSerializer(SESSION_KEY)
+STREAM_CHUNK_SIZE = 1024 * 1024 # 1 MiB-os blokkok folyamos titkosításhoz
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS') or 12) # induláskor kalibrálható (calibrate_bcrypt_rounds)
+BCRYPT_MIN_ROUNDS = 10
+BCRYPT_MAX_ROUNDS = 16
+
+#szegmentált konténer formátum:
+#   header:     MAGIC (4) | VERSION (1) | ALGO_ID (1) | SEGMENT_SIZE (4, big-endian) | BASE_NONCE (12)
+#   szegmensek: [titkosított adat (SEGMENT_SIZE, az utolsó lehet rövidebb) | tag (16)] ...
+#minden szegmens külön hitelesített: nonce = BASE_NONCE XOR szegmens index, AAD = header | utolsó szegmens jelző
+CONTAINER_MAGIC = b"SZKD"
+CONTAINER_VERSION = 1
+CONTAINER_HEADER = struct.Struct(">4sBBI12s")
+CONTAINER_ALGOS = {1: "AES-256", 2: "ChaCha20"}
+SEGMENT_SIZE = 64 * 1024 # 64 KiB
+MAX_SEGMENT_SIZE = 16 * 1024 * 1024
+TAG_SIZE = 16
+DATA_KEY_AAD = b"szakdolgozat-data-key:"
+
+#titkos kulcs ellenőrző érték (key-check value): HMAC-SHA256 a kulccsal egy rögzített címkén
+#a kulcs 256 bit véletlen, ezért lassú KDF (bcrypt) nem szükséges hozzá
+SECRET_KEY_CHECK_PREFIX = "hmac-sha256$"
+SECRET_KEY_CHECK_LABEL = b"szakdolgozat-secret-key-check"
+_serializer: Optional[URLSafeTimedSerializer] = None
+
+#feloldott titkos kulcsok (session-önként, csak memóriában)
+KEY_VAULT_MAX_ENTRIES = int(os.getenv('KEY_VAULT_MAX_ENTRIES') or 1000)
+KEY_VAULT_IDLE_TTL = int(os.getenv('KEY_VAULT_IDLE_TTL') or 900) # 15 perc tétlenség után zárol
 
 
 
@@ -31,20 +64,71 @@ serializer = URLSafeTimedSerializer(SESSION_KEY)
 ####
 
 def hash_password(password: str) -> str:
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     return bcrypt.hashpw(password.encode("utf-8"), salt).decode("utf-8")
 
 def verify_password(password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(password.encode("utf-8"), hashed_password.encode("utf-8"))
 
+def calibrate_bcrypt_rounds(target_ms: int) -> int:
+    #a legnagyobb költség, aminél egy hash még belefér a célidőbe (minden +1 kör kétszeres idő)
+    global BCRYPT_ROUNDS
+    rounds = BCRYPT_MIN_ROUNDS
+    start = time.perf_counter()
+    bcrypt.hashpw(b"calibration", bcrypt.gensalt(rounds=rounds))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    while rounds < BCRYPT_MAX_ROUNDS and elapsed_ms * 2 <= target_ms:
+        rounds += 1
+        elapsed_ms *= 2
+    BCRYPT_ROUNDS = rounds
+    return rounds
+
+def hash_secret_key(key_hex: str) -> str:
+    key_check = hmac.new(bytes.fromhex(key_hex), SECRET_KEY_CHECK_LABEL, hashlib.sha256).hexdigest()
+    return SECRET_KEY_CHECK_PREFIX + key_check
+
+def verify_secret_key(key_hex: str, secret_key_hash: str) -> bool:
+    if not key_hex or not secret_key_hash:
+        return False
+
+    #gyors ellenőrzés: key-check value
+    if secret_key_hash.startswith(SECRET_KEY_CHECK_PREFIX):
+        try:
+            return hmac.compare_digest(hash_secret_key(key_hex), secret_key_hash)
+        except ValueError:
+            return False
+
+    #régi, bcrypt-tel hashelt kulcs
+    try:
+        return verify_password(key_hex, secret_key_hash)
+    except ValueError:
+        return False
+
+def secret_key_needs_upgrade(secret_key_hash: str) -> bool:
+    return not secret_key_hash.startswith(SECRET_KEY_CHECK_PREFIX)
+
 
 
 #######
 ########## SESSION FUNCTIONS
 ####
 
+def configure_session_key(session_key: Optional[str]):
+    #az alkalmazás beállításaiból (create_app); a serializer első használatkor jön létre
+    global SESSION_KEY, _serializer
+    SESSION_KEY = session_key
+    _serializer = None
+
+def get_serializer() -> URLSafeTimedSerializer:
+    global _serializer
+    if _serializer is None:
+        if not SESSION_KEY:
+            raise HTTPException(status_code=500, detail="Session key is not configured")
+        _serializer = URLSafeTimedSerializer(SESSION_KEY)
+    return _serializer
+
 def create_session(user_id: int) -> str:
-    return serializer.dumps({"user_id": user_id})
+    return get_serializer().dumps({"user_id": user_id})
 
 def set_session_cookie(response: Response, user_id: int):
     session_token = create_session(user_id)
@@ -60,7 +144,7 @@ def set_session_cookie(response: Response, user_id: int):
 
 def verify_session(session_token: str):
     try:
-        return serializer.loads(session_token, max_age=SESSION_EXPIRY)
+        return get_serializer().loads(session_token, max_age=SESSION_EXPIRY)
     except:
         return None
     
@@ -89,6 +173,75 @@ def authenticate_user(session_token: str) -> int:
 
 
 
+#######
+########## KEY VAULT
+####
+
+class KeyVault:
+    #feloldott titkos kulcsok tárolója: session -> (user_id, key_hex, kulcs epoch, utolsó használat)
+    #kulcscsere után (más epoch) a bejegyzés érvénytelen, akkor is, ha egy másik worker cserélte a kulcsot
+    #a kulcsot a session_token hash-e azonosítja, maga a token nem kerül tárolásra
+    #LRU: a legrégebben használt bejegyzés esik ki, ha betelt; tétlenség után lejár
+    def __init__(self, max_entries: int = KEY_VAULT_MAX_ENTRIES, idle_ttl: int = KEY_VAULT_IDLE_TTL):
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _session_id(session_token: str) -> str:
+        return hashlib.sha256(session_token.encode("utf-8")).hexdigest()
+
+    def unlock(self, session_token: str, user_id: int, key_hex: str, key_epoch: int):
+        if not session_token:
+            return
+        session_id = self._session_id(session_token)
+        with self._lock:
+            self._entries[session_id] = (user_id, key_hex, key_epoch, time.monotonic())
+            self._entries.move_to_end(session_id)
+            #legrégebben használt bejegyzések eldobása
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, session_token: str, user_id: int, key_epoch: int) -> Optional[str]:
+        if not session_token:
+            return None
+        session_id = self._session_id(session_token)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            entry_user_id, key_hex, entry_key_epoch, last_used = entry
+            #lejárt, más felhasználóhoz tartozik, vagy azóta lecserélték a kulcsot
+            if now - last_used > self.idle_ttl or entry_user_id != user_id or entry_key_epoch != key_epoch:
+                del self._entries[session_id]
+                return None
+            #használat frissíti a lejáratot
+            self._entries[session_id] = (entry_user_id, key_hex, entry_key_epoch, now)
+            self._entries.move_to_end(session_id)
+            return key_hex
+
+    def lock(self, session_token: str):
+        if not session_token:
+            return
+        with self._lock:
+            self._entries.pop(self._session_id(session_token), None)
+
+    def lock_user(self, user_id: int):
+        #a user összes session-jének feloldott kulcsa (pl. kulcscsere után)
+        with self._lock:
+            for session_id in [session_id for session_id, entry in self._entries.items() if entry[0] == user_id]:
+                del self._entries[session_id]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+key_vault = KeyVault()
+
+
+
 #######
 ########## ENCRYPTION-DECRYPTION
 ####
@@ -97,25 +250,30 @@ def authenticate_user(session_token: str) -> int:
 def generate_key():
     return os.urandom(32)
 
+#adatkulcs becsomagolása a felhasználó kulcsával (envelope encryption)
+#formátum: ALGO_ID (1) | nonce (12) | titkosított adatkulcs + tag (48), hex-ként tárolva
+#az AAD a fájl azonosítója, így a becsomagolt kulcs nem cserélhető fel két fájl között
+def wrap_data_key(data_key: bytes, key: bytes, algo: str, file_id: str) -> str:
+    nonce = os.urandom(12)
+    wrapped = _container_aead(algo, key).encrypt(nonce, data_key, DATA_KEY_AAD + file_id.encode("utf-8"))
+    return (bytes([_container_algo_id(algo)]) + nonce + wrapped).hex()
+
+#adatkulcs kicsomagolása (az algoritmus a becsomagolt kulcs első bájtjából derül ki)
+def unwrap_data_key(wrapped_key: str, key: bytes, file_id: str) -> bytes:
+    raw = bytes.fromhex(wrapped_key)
+    algo = CONTAINER_ALGOS.get(raw[0]) if raw else None
+    if algo is None:
+        raise ValueError("Invalid wrapped key.")
+    return _container_aead(algo, key).decrypt(raw[1:13], raw[13:], DATA_KEY_AAD + file_id.encode("utf-8"))
+
+#AES titkosítás folyamként (szegmentált konténer formátumban)
+def aes_encrypt_stream(input_file: BinaryIO, output_file: BinaryIO, key: bytes, segment_size: int = SEGMENT_SIZE):
+    container_encrypt_stream(input_file, output_file, key, "AES-256", segment_size)
+
 #AES titkosítás
 def aes_encrypt_file(file: BytesIO, key: bytes):
-    #random inicializációs vektor generálás
-    iv = os.urandom(12)
-    cipher = Cipher(algorithms.AES(key), modes.GCM(iv), backend=default_backend())
-    encryptor = cipher.encryptor()
     encrypted_file = BytesIO()
-
-    #inicializációs vektor hozzáadása
-    encrypted_file.write(iv)
-
-    #fájl titkosítása blokkokban
-    while chunk := file.read(1024):
-        encrypted_chunk = encryptor.update(chunk)
-        encrypted_file.write(encrypted_chunk)
-    encrypted_file.write(encryptor.finalize())
-    
-    #tag hozzáadása
-    encrypted_file.write(encryptor.tag)
+    aes_encrypt_stream(file, encrypted_file, key)
 
     #fájlmutatót visszaállítása
     encrypted_file.seek(0)
@@ -123,48 +281,95 @@ def aes_encrypt_file(file: BytesIO, key: bytes):
     #titkosított fájl visszaadása
     return encrypted_file
 
-#AES visszafejtés
-def aes_decrypt_file(encrypted_file: BytesIO, key: bytes) -> BytesIO:
+#AES visszafejtés folyamként (blokkonként adja vissza a visszafejtett adatot)
+def aes_decrypt_stream(encrypted_file: BinaryIO, key: bytes) -> Iterator[bytes]:
+    #header alapján eldönthető, hogy szegmentált konténer vagy régi, egyben titkosított fájl
+    header = read_container_header(encrypted_file)
+    if header is not None:
+        yield from container_decrypt_stream(encrypted_file, key, header)
+    else:
+        yield from _aes_decrypt_legacy_stream(encrypted_file, key)
+
+#régi formátum: iv | titkosított adat | tag
+#a tag csak a teljes adat után ellenőrizhető: először egy kimenet nélküli menet ellenőrzi (a fájl kétszer kerül
+#beolvasásra), a visszafejtett adat csak utána, hitelesített adatból kerül kiadásra
+def _aes_decrypt_legacy_stream(encrypted_file: BinaryIO, key: bytes, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
     #inicializációs vektor kiolvasása
     iv = encrypted_file.read(12)
 
-    #fájl tartalmának olvasása
-    content = encrypted_file.read()
+    #titkosított adat méretének meghatározása (iv és tag nélkül)
+    data_start = encrypted_file.tell()
+    encrypted_file.seek(0, os.SEEK_END)
+    data_size = encrypted_file.tell() - data_start - 16
 
     #fájl méretének ellenőrzése
-    if len(content) < 16:
+    if len(iv) < 12 or data_size < 0:
         raise ValueError("Encrypted data too short.")
 
-    #titkosított adat és tag meghatározása
-    encrypted_data = content[:-16]
-    tag = content[-16:]
-
+    #tag kiolvasása a fájl végéről
+    encrypted_file.seek(data_start + data_size)
+    tag = encrypted_file.read(16)
+    encrypted_file.seek(data_start)
 
     cipher = Cipher(algorithms.AES(key), modes.GCM(iv, tag), backend=default_backend())
-    decryptor = cipher.decryptor()
 
+    def decrypted_chunks() -> Iterator[bytes]:
+        #visszafejtés blokkokban, a végén a tag ellenőrzése (hibás tag esetén InvalidTag)
+        encrypted_file.seek(data_start)
+        decryptor = cipher.decryptor()
+        remaining = data_size
+        while remaining > 0:
+            chunk = encrypted_file.read(min(chunk_size, remaining))
+            if not chunk:
+                raise ValueError("Encrypted data truncated.")
+            remaining -= len(chunk)
+            yield decryptor.update(chunk)
+        final = decryptor.finalize()
+        if final:
+            yield final
+
+    #első menet: csak a tag ellenőrzése, a visszafejtett blokkok eldobásával
+    for _ in decrypted_chunks():
+        pass
+
+    #második menet: a már hitelesített adat visszafejtése
+    yield from decrypted_chunks()
+
+#AES visszafejtés
+def aes_decrypt_file(encrypted_file: BytesIO, key: bytes) -> BytesIO:
     #visszafejtett fájl létrehozása
     decrypted_file = BytesIO()
-    decrypted_file.write(decryptor.update(encrypted_data))
-    decrypted_file.write(decryptor.finalize())
+    for chunk in aes_decrypt_stream(encrypted_file, key):
+        decrypted_file.write(chunk)
     decrypted_file.seek(0)
 
     #visszafejtett fájl visszaadása
     return decrypted_file
 
-#ChaCha20 titkosítás
-def chacha20_encrypt_file(file: BytesIO, key: bytes) -> BytesIO:
-    #ChaCha20-Poly1305 96 bites nonce generálás
-    nonce = os.urandom(12) 
+#ChaCha20 titkosítás folyamként (szegmentált konténer formátumban)
+def chacha20_encrypt_stream(input_file: BinaryIO, output_file: BinaryIO, key: bytes, segment_size: int = SEGMENT_SIZE):
+    container_encrypt_stream(input_file, output_file, key, "ChaCha20", segment_size)
+
+#ChaCha20 visszafejtés folyamként
+def chacha20_decrypt_stream(encrypted_file: BinaryIO, key: bytes) -> Iterator[bytes]:
+    #header alapján eldönthető, hogy szegmentált konténer vagy régi, egyben titkosított fájl
+    header = read_container_header(encrypted_file)
+    if header is not None:
+        yield from container_decrypt_stream(encrypted_file, key, header)
+        return
+
+    #régi formátum: nonce | titkosított adat + tag, csak egyben fejthető vissza
+    nonce = encrypted_file.read(12)
+    ciphertext = encrypted_file.read()
 
-    plaintext = file.read() #nem biztos, hogy kell
     aead_cipher = ChaCha20Poly1305(key)
-    ciphertext = aead_cipher.encrypt(nonce, plaintext, None)
+    yield aead_cipher.decrypt(nonce, ciphertext, None)
 
+#ChaCha20 titkosítás
+def chacha20_encrypt_file(file: BytesIO, key: bytes) -> BytesIO:
     #titkosított fájl létrehozása
     encrypted_file = BytesIO()
-    encrypted_file.write(nonce)
-    encrypted_file.write(ciphertext)
+    chacha20_encrypt_stream(file, encrypted_file, key)
     encrypted_file.seek(0)
 
     #titkosított fájl visszaadása
@@ -172,17 +377,170 @@ def chacha20_encrypt_file(file: BytesIO, key: bytes) -> BytesIO:
 
 #ChaCha20 visszafejtés
 def chacha20_decrypt_file(encrypted_file: BytesIO, key: bytes) -> BytesIO:
-    #nonce és a titkosított adat kiolvasása
-    nonce = encrypted_file.read(12)
-    ciphertext = encrypted_file.read()
-
-    aead_cipher = ChaCha20Poly1305(key)
-    plaintext = aead_cipher.decrypt(nonce, ciphertext, None)
-
     #visszafejtett fájl létrehozása
     decrypted_file = BytesIO()
-    decrypted_file.write(plaintext)
+    for chunk in chacha20_decrypt_stream(encrypted_file, key):
+        decrypted_file.write(chunk)
     decrypted_file.seek(0)
 
     #visszafejtett fájl visszaadása
-    return decrypted_file
\ No newline at end of file
+    return decrypted_file
+
+
+
+#######
+########## SEGMENTED CONTAINER
+####
+
+def _container_aead(algo: str, key: bytes):
+    if algo == "AES-256":
+        return AESGCM(key)
+    if algo == "ChaCha20":
+        return ChaCha20Poly1305(key)
+    raise ValueError(f"Unsupported algorithm: {algo}")
+
+def _container_algo_id(algo: str) -> int:
+    for algo_id, name in CONTAINER_ALGOS.items():
+        if name == algo:
+            return algo_id
+    raise ValueError(f"Unsupported algorithm: {algo}")
+
+def _segment_nonce(base_nonce: bytes, index: int) -> bytes:
+    #az index a nonce utolsó 8 bájtjába kerül XOR-ral
+    counter = (int.from_bytes(base_nonce[4:], "big") ^ index).to_bytes(8, "big")
+    return base_nonce[:4] + counter
+
+def _read_exact(file: BinaryIO, size: int) -> bytes:
+    #addig olvas, amíg meg nem lesz a kért méret, vagy vége nincs a fájlnak
+    data = file.read(size)
+    while data and len(data) < size:
+        more = file.read(size - len(data))
+        if not more:
+            break
+        data += more
+    return data
+
+def read_container_header(encrypted_file: BinaryIO):
+    #header kiolvasása, ha nem konténer, a fájlmutató visszaáll az elejére
+    start = encrypted_file.tell()
+    raw = _read_exact(encrypted_file, CONTAINER_HEADER.size)
+
+    if len(raw) == CONTAINER_HEADER.size:
+        magic, version, algo_id, segment_size, base_nonce = CONTAINER_HEADER.unpack(raw)
+        if (
+            magic == CONTAINER_MAGIC
+            and version == CONTAINER_VERSION
+            and algo_id in CONTAINER_ALGOS
+            and 0 < segment_size <= MAX_SEGMENT_SIZE
+        ):
+            return {
+                "raw": raw,
+                "algo": CONTAINER_ALGOS[algo_id],
+                "segment_size": segment_size,
+                "base_nonce": base_nonce,
+            }
+
+    encrypted_file.seek(start)
+    return None
+
+def container_plaintext_size(encrypted_size: int, segment_size: int) -> int:
+    #szegmensek száma: ceil(törzs / (szegmens + tag)), mindegyik egy taggel hosszabb
+    body_size = encrypted_size - CONTAINER_HEADER.size
+    segments = -(-body_size // (segment_size + TAG_SIZE))
+    return body_size - segments * TAG_SIZE
+
+def container_segment_offset(segment_size: int, index: int) -> int:
+    #az index-edik titkosított szegmens kezdete a fájlban
+    return CONTAINER_HEADER.size + index * (segment_size + TAG_SIZE)
+
+def container_encrypt_stream(input_file: BinaryIO, output_file: BinaryIO, key: bytes, algo: str, segment_size: int = SEGMENT_SIZE):
+    for chunk in container_encrypt_chunks(input_file, key, algo, segment_size):
+        output_file.write(chunk)
+
+#titkosítás blokkonként (header, majd szegmensenként), az írás a hívónál (pl. egy másik szálon)
+def container_encrypt_chunks(input_file: BinaryIO, key: bytes, algo: str, segment_size: int = SEGMENT_SIZE) -> Iterator[bytes]:
+    aead_cipher = _container_aead(algo, key)
+    algo_id = _container_algo_id(algo)
+
+    #header
+    base_nonce = os.urandom(12)
+    header = CONTAINER_HEADER.pack(CONTAINER_MAGIC, CONTAINER_VERSION, algo_id, segment_size, base_nonce)
+    yield header
+
+    #szegmensek titkosítása, egy szegmenssel előre olvasva, hogy az utolsó megjelölhető legyen
+    index = 0
+    segment = _read_exact(input_file, segment_size)
+    while True:
+        next_segment = _read_exact(input_file, segment_size) if len(segment) == segment_size else b""
+        last = not next_segment
+        yield aead_cipher.encrypt(_segment_nonce(base_nonce, index), segment, header + bytes([last]))
+        if last:
+            break
+        segment = next_segment
+        index += 1
+
+def container_decrypt_stream(encrypted_file: BinaryIO, key: bytes, header: dict) -> Iterator[bytes]:
+    aead_cipher = _container_aead(header["algo"], key)
+    encrypted_segment_size = header["segment_size"] + TAG_SIZE
+
+    #szegmensek visszafejtése, egy szegmenssel előre olvasva (csonkolás és hozzáfűzés is kiderül)
+    index = 0
+    segment = _read_exact(encrypted_file, encrypted_segment_size)
+    while True:
+        if len(segment) < TAG_SIZE:
+            raise ValueError("Encrypted data truncated.")
+        next_segment = _read_exact(encrypted_file, encrypted_segment_size) if len(segment) == encrypted_segment_size else b""
+        last = not next_segment
+        yield aead_cipher.decrypt(_segment_nonce(header["base_nonce"], index), segment, header["raw"] + bytes([last]))
+        if last:
+            break
+        segment = next_segment
+        index += 1
+
+def container_segment_count(encrypted_size: int, segment_size: int) -> int:
+    body_size = encrypted_size - CONTAINER_HEADER.size
+    return -(-body_size // (segment_size + TAG_SIZE))
+
+def container_decrypt_range(encrypted_file: BinaryIO, key: bytes, header: dict, encrypted_size: int, start: int, end: int) -> Iterator[bytes]:
+    #csak a [start, end] (zárt) bájttartományt lefedő szegmensek visszafejtése
+    aead_cipher = _container_aead(header["algo"], key)
+    segment_size = header["segment_size"]
+    encrypted_segment_size = segment_size + TAG_SIZE
+    last_index = container_segment_count(encrypted_size, segment_size) - 1
+
+    first = start // segment_size
+    last = end // segment_size
+    if start > end or last > last_index:
+        raise ValueError("Range out of bounds.")
+
+    #ugrás az első érintett szegmensre
+    encrypted_file.seek(container_segment_offset(segment_size, first))
+    for index in range(first, last + 1):
+        segment = _read_exact(encrypted_file, encrypted_segment_size)
+        if len(segment) < TAG_SIZE:
+            raise ValueError("Encrypted data truncated.")
+        plaintext = aead_cipher.decrypt(_segment_nonce(header["base_nonce"], index), segment, header["raw"] + bytes([index == last_index]))
+
+        #a szegmens tartományon kívüli részeinek levágása
+        offset = index * segment_size
+        yield plaintext[max(start - offset, 0):end - offset + 1]
+
+
+
+#######
+########## WARM-UP
+####
+
+#titkosító backend-ek (OpenSSL) betöltése és önteszt induláskor, hogy ne az első kérés fizesse meg
+def warm_up_ciphers():
+    key = generate_key()
+    for algo in CONTAINER_ALGOS.values():
+        data_key = generate_key()
+        if unwrap_data_key(wrap_data_key(data_key, key, algo, "warm-up"), key, "warm-up") != data_key:
+            raise ValueError(f"{algo} self-test failed")
+        encrypted_file = BytesIO()
+        container_encrypt_stream(BytesIO(b"warm-up"), encrypted_file, data_key, algo)
+        encrypted_file.seek(0)
+        if b"".join(container_decrypt_stream(encrypted_file, data_key, read_container_header(encrypted_file))) != b"warm-up":
+            raise ValueError(f"{algo} self-test failed")
+
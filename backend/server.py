@@ -1,19 +1,22 @@
-
 #######
 ########## IMPORTS
 ####
 
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
-from supabase import create_client, Client
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from repository import Repository, AsyncRepository, MetadataCache, CachedRepository, CachedAsyncRepository, create_repository, create_async_repository, FILE_SORT_COLUMNS
+from storage import BlobStore, create_blob_store, UPLOADS_DIR, S3_PART_SIZE, S3_UPLOAD_CONCURRENCY, S3_READ_SIZE
 from pydantic import BaseModel, EmailStr
-from security import hash_password, verify_password, set_session_cookie, delete_session_cookie, generate_key, authenticate_user
-from services import decrypt_file, encrypt_file, is_email_taken, is_filename_taken, get_user_by_id, get_user_by_email, encrypt_user_files, decrypt_user_files, lifespan
-from fastapi import FastAPI, HTTPException, Response, Request, UploadFile, File
+from security import hash_password, verify_password, hash_secret_key, set_session_cookie, delete_session_cookie, generate_key, authenticate_user, configure_session_key, key_vault, KEY_VAULT_IDLE_TTL
+from services import decrypt_file_stream, decrypt_file_range, decrypted_size, read_file_header, parse_range_header, download_headers, guess_media_type, new_data_key, file_key_hex, rewrap_file_keys, file_algo, migrate_file, check_secret_key, resolve_secret_key, is_email_taken, get_user_by_id, get_files_version, get_user_with_files, get_user_by_email, start_switch_algo_job, find_unfinished_job, cancel_job, load_job, job_progress, JOBS_DIR, lifespan, warm_up, run_cpu, run_io, iterate_decrypted, decrypt_read_ahead, encrypt_upload, save_upload, run_bcrypt, bcrypt_stats, parse_file_fields, decode_cursor, list_files_page, iterate_files, files_json_array, files_ndjson, FILES_PAGE_SIZE, FILES_MAX_PAGE_SIZE, files_etag, content_etag, etag_matches, maintenance, iterate_on_io, blob_size, read_blob_range
+from fastapi import APIRouter, FastAPI, HTTPException, Response, Request, UploadFile, File
+from contextlib import asynccontextmanager
 from pathlib import Path
 from dotenv import load_dotenv
 from typing import Optional, List
-import shutil
+import threading
+import asyncio
 import uuid
 import os
 
@@ -23,20 +26,61 @@ import os
 ########## GLOBALS
 ####
 
-load_dotenv()
-SUPABASE_URL    = os.getenv('SUPABASE_URL')
-SUPABASE_KEY    = os.getenv('SUPABASE_KEY')
 DEFAULT_ALGO    = 'AES-256'
 ALGOS           = [{'name': 'AES-256'}, {'name': 'ChaCha20'}]
-UPLOADS_DIR     = Path("uploads")
-TEMP_DIR        = Path("temp")
 
 
 
 #######
-########## SCHEMAS
+########## SETTINGS
 ####
 
+class Settings(BaseModel):
+    supabase_url: Optional[str] = None
+    supabase_key: Optional[str] = None
+    session_key: Optional[str] = None
+    db_backend: str = 'supabase'                    # 'supabase' vagy 'sqlite'
+    sqlite_path: str = 'data/szakdolgozat.db'
+    supabase_max_connections: int = 20              # HTTP kapcsolat pool mérete
+    supabase_max_keepalive: int = 10                # nyitva tartott kapcsolatok
+    supabase_keepalive_expiry: float = 30           # tétlen kapcsolat lezárása (mp)
+    supabase_timeout: float = 10                    # hívásonkénti időkorlát (mp)
+    supabase_retries: int = 2                       # újrapróbálások száma hálózati hibánál
+    cache_max_entries: int = 10000                  # gyorsítótárazott user-ek és fájllisták száma
+    cache_ttl: float = 30                           # gyorsítótár élettartama (mp), 0: kikapcsolva
+    upload_concurrency: int = 4                     # egy feltöltési kérésen belül egyszerre feldolgozott fájlok száma
+    reencrypt_workers: int = os.cpu_count() or 1    # algoritmusváltáskor párhuzamosan újratitkosító processzek száma
+    storage_backend: str = 'local'                  # fájlok tárolása: 'local' (uploads mappa) vagy 's3'
+    s3_bucket: Optional[str] = None
+    s3_prefix: str = ''                             # kulcs előtag a bucket-en belül
+    s3_endpoint_url: Optional[str] = None           # S3-kompatibilis tároló (pl. MinIO) címe, AWS-nél üres
+    s3_region: Optional[str] = None
+    s3_access_key_id: Optional[str] = None          # üresen a boto3 szokásos forrásai (AWS_* változók, IAM szerep)
+    s3_secret_access_key: Optional[str] = None
+    s3_part_size: int = S3_PART_SIZE                # multipart feltöltés részmérete (min. 5 MiB)
+    s3_upload_concurrency: int = S3_UPLOAD_CONCURRENCY  # egy feltöltésből egyszerre küldött részek
+    s3_read_size: int = S3_READ_SIZE                # tartományos GET mérete olvasáskor
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        #környezeti változókból (és a .env fájlból), a nem megadottak (és az üresen hagyottak) alapértéke marad
+        load_dotenv()
+        values = {field: os.getenv(field.upper()) for field in cls.model_fields}
+        return cls(**{field: value for field, value in values.items() if value})
+
+_settings: Optional[Settings] = None
+
+def get_settings() -> Settings:
+    global _settings
+    if _settings is None:
+        _settings = Settings.from_env()
+    return _settings
+
+
+
+#######
+########## SCHEMAS
+####
 class RegisterRequest(BaseModel):
     name: str
     email: EmailStr
@@ -65,22 +109,108 @@ class AlgoChangeRequest(BaseModel):
     algo: str
     key_hex: Optional[str] = ""
 
+class RotateKeyRequest(BaseModel):
+    key_hex: Optional[str] = ""
+
 
 
 #######
 ########## SETUP
 ####
 
-app = FastAPI(lifespan=lifespan)
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+#metaadat gyorsítótár és repository-k: első használatkor jönnek létre, processzenként (fork után újra)
+#szinkron (háttérszálak) és aszinkron (route-ok) elérés, közös gyorsítótárral
+_resources: Optional[dict] = None
+_resources_lock = threading.Lock()
+
+def _get_resources() -> dict:
+    global _resources
+    with _resources_lock:
+        if _resources is None:
+            settings = get_settings()
+            metadata_cache = MetadataCache(settings.cache_max_entries, settings.cache_ttl)
+            base_repo = create_repository(settings.db_backend, supabase_url=settings.supabase_url, supabase_key=settings.supabase_key, sqlite_path=settings.sqlite_path)
+            db = create_async_repository(
+                settings.db_backend, base_repo, run_io, supabase_url=settings.supabase_url, supabase_key=settings.supabase_key,
+                max_connections=settings.supabase_max_connections, max_keepalive=settings.supabase_max_keepalive,
+                keepalive_expiry=settings.supabase_keepalive_expiry, timeout=settings.supabase_timeout, retries=settings.supabase_retries,
+            )
+            store = create_blob_store(
+                settings.storage_backend, UPLOADS_DIR, settings.s3_bucket, prefix=settings.s3_prefix, endpoint_url=settings.s3_endpoint_url,
+                region=settings.s3_region, access_key_id=settings.s3_access_key_id, secret_access_key=settings.s3_secret_access_key,
+                part_size=settings.s3_part_size, upload_concurrency=settings.s3_upload_concurrency, read_size=settings.s3_read_size,
+            )
+            _resources = {
+                'metadata_cache': metadata_cache,
+                'repo': CachedRepository(base_repo, metadata_cache),
+                'db': CachedAsyncRepository(db, metadata_cache),
+                'store': store,
+            }
+        return _resources
+
+def get_repo() -> Repository:
+    return _get_resources()['repo']
+
+def get_db() -> AsyncRepository:
+    return _get_resources()['db']
+
+def get_metadata_cache() -> MetadataCache:
+    return _get_resources()['metadata_cache']
+
+def get_store() -> BlobStore:
+    return _get_resources()['store']
+
+def _reset_after_fork():
+    global _resources, _resources_lock
+    _resources = None
+    _resources_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+@asynccontextmanager
+async def app_lifespan(app: FastAPI):
+    #a bemelegítés a háttérben fut, a szerver közben már fogad kéréseket (a readiness végpont addig 503)
+    async with lifespan(app):
+        async def run_warm_up():
+            await warm_up(get_repo(), get_db())
+            app.state.ready = True
+        warm_up_task = asyncio.create_task(run_warm_up())
+        yield
+        warm_up_task.cancel()
+        if _resources is not None:
+            await _resources['db'].close()
+            _resources['store'].close()
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    #importáláskor nem jön létre kliens és pool: minden a beállításokból, első használatkor
+    global _settings, _resources
+    _settings = settings or Settings.from_env()
+    _resources = None
+    configure_session_key(_settings.session_key)
+
+    app = FastAPI(lifespan=app_lifespan)
+    app.state.ready = False
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://localhost:3000"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "ETag"],
+    )
+    app.include_router(router)
+    return app
+
+def __getattr__(name: str):
+    #"uvicorn server:app" és "from server import app": az alkalmazás az első hivatkozáskor jön létre
+    #(előre forkolt workereknél: uvicorn server:create_app --factory)
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+router = APIRouter()
 
 
 
@@ -88,14 +218,14 @@ app.add_middleware(
 ########## ROUTES
 ####
 
-@app.post("/api/register")
+@router.post("/api/register")
 async def register(data: RegisterRequest):
     name = data.name
     email = data.email
     password = data.password
 
     #input validáció
-    if is_email_taken(supabase, email, -1):
+    if await is_email_taken(get_db(), email, -1):
         raise HTTPException(status_code=400, detail="Email already in use")
     if len(name) < 5:
         raise HTTPException(status_code=400, detail="Name must be at least 5 characters")
@@ -103,7 +233,7 @@ async def register(data: RegisterRequest):
         raise HTTPException(status_code=400, detail="Password must be at least 8 characters")
 
     #jelszavak biztonságos mentése
-    password_hash = hash_password(password)
+    password_hash = await run_bcrypt(hash_password, password)
     
     #új user elmentése
     new_user = {
@@ -113,19 +243,19 @@ async def register(data: RegisterRequest):
         'algo': DEFAULT_ALGO,
         'has_key': False,
     } 
-    response = supabase.table('user').insert(new_user).execute().data
+    response = await get_db().create_user(new_user)
     if not response:
         raise HTTPException(status_code=400, detail="Failed to create user")
 
     return {'message': 'Registration successful'}
 
-@app.post("/api/login")
+@router.post("/api/login")
 async def login(data: LoginRequest, response: Response):
     #felhasználó lekérése email alapján
-    user = get_user_by_email(supabase, data.email)
+    user = await get_user_by_email(get_db(), data.email)
 
     #felhasználó és a jelszó ellenőrzése
-    if not verify_password(data.password, user['password_hash']):
+    if not await run_bcrypt(verify_password, data.password, user['password_hash']):
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
     #session_token beállítása
@@ -134,19 +264,20 @@ async def login(data: LoginRequest, response: Response):
     #user_id visszaadása
     return {"message": "Login successful", 'user_id': user['id']}
 
-@app.post("/api/logout")
-async def logout(response: Response):
-    #session_token törlése
+@router.post("/api/logout")
+async def logout(request: Request, response: Response):
+    #feloldott kulcs zárolása és session_token törlése
+    key_vault.lock(request.cookies.get("session_token"))
     delete_session_cookie(response)
     return {"message": "Logged out successfully"}
 
-@app.get("/api/user")
+@router.get("/api/user")
 async def get_user(request: Request):
     #autentikáció
     user_id = authenticate_user(request.cookies.get("session_token"))
 
     #felhasználó lekérése
-    user = get_user_by_id(supabase, user_id)
+    user = await get_user_by_id(get_db(), user_id)
 
     #user visszaadása
     return {
@@ -156,11 +287,11 @@ async def get_user(request: Request):
         'algo': user['algo'], 
     }
 
-@app.put("/api/user")
+@router.put("/api/user")
 async def edit_user(request: Request, name: Optional[str] = None, email: Optional[EmailStr] = None, password: Optional[str] = None, new_password: Optional[str] = None):
     #autentikáció
     user_id = authenticate_user(request.cookies.get("session_token"))
-    user = get_user_by_id(supabase, user_id)
+    user = await get_user_by_id(get_db(), user_id)
 
     update_data = {}
 
@@ -170,15 +301,15 @@ async def edit_user(request: Request, name: Optional[str] = None, email: Optiona
             raise HTTPException(status_code=400, detail="Name must be at least 5 characters")
         update_data["name"] = name
     if email:
-        if is_email_taken(supabase, email, user_id):
+        if await is_email_taken(get_db(), email, user_id):
             raise HTTPException(status_code=400, detail="Email already in use")
         update_data["email"] = email
     if password and new_password:
-        if not verify_password(password, user['password_hash']):
+        if not await run_bcrypt(verify_password, password, user['password_hash']):
             raise HTTPException(status_code=401, detail="Invalid password")
         if len(new_password) < 8:
             raise HTTPException(status_code=400, detail="New password must be at least 8 characters")
-        hashed_password = hash_password(new_password)
+        hashed_password = await run_bcrypt(hash_password, new_password)
         update_data["password_hash"] = hashed_password
 
     #ha nem érkezett egy valid paraméter sem
@@ -186,57 +317,97 @@ async def edit_user(request: Request, name: Optional[str] = None, email: Optiona
         raise HTTPException(status_code=400, detail="No valid fields provided")
 
     #user frissítése
-    response = supabase.table("user").update(update_data).eq("id", user["id"]).execute().data
+    response = await get_db().update_user(user["id"], update_data)
     if not response:
         raise HTTPException(status_code=500, detail="Failed to update database")
 
     return {"message": "User updated successfully"}
 
-@app.get("/api/files")
-async def get_files(request: Request):
+@router.get("/api/files")
+async def get_files(
+    request: Request,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    sort: str = "created_at",
+    order: str = "asc",
+    fields: Optional[str] = None,
+    format: str = "json",
+):
     #autentikáció
     user_id = authenticate_user(request.cookies.get("session_token"))
 
-    #fájl adatok lekérése és visszaadása
-    try:
-        response = supabase.table('files').select('*').eq('user_id', user_id).execute().data
-        return response
-    except:
-        raise HTTPException(status_code=500, detail=f"Database error")
-
-@app.delete("/api/files")
+    #paraméterek ellenőrzése
+    if sort not in FILE_SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail="Invalid sort")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="Invalid order")
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="Invalid format")
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail="Invalid limit")
+    columns = parse_file_fields(fields)
+    descending = order == "desc"
+    after = decode_cursor(cursor, sort, descending) if cursor else None
+
+    #feltételes lekérés: a user fájl listájának verziója alapján (egy elsődleges kulcsos lekérdezés, gyorsítótár nélkül),
+    #a fájl sorok lekérése nélkül (a verzió a lista előtt kerül beolvasásra, az írások után léptetődik:
+    #elavult tartalom nem kaphat friss ETag-et)
+    files_version = await get_files_version(get_db(), user_id)
+    etag = files_etag(user_id, files_version, limit, cursor, sort, order, columns, format)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    #egy oldal: a következő oldal kurzora az X-Next-Cursor fejlécben
+    if limit is not None or cursor:
+        page, next_cursor = await list_files_page(get_db(), user_id, columns, sort, descending, after, min(limit or FILES_PAGE_SIZE, FILES_MAX_PAGE_SIZE))
+        headers = {"X-Next-Cursor": next_cursor, "ETag": etag} if next_cursor else {"ETag": etag}
+        if format == "ndjson":
+            rows = iterate_files(get_db(), user_id, columns, sort, descending, page, None)
+            return StreamingResponse(files_ndjson(rows), media_type="application/x-ndjson", headers=headers)
+        return JSONResponse(content=page, headers=headers)
+
+    #teljes lista: oldalanként lekérve, folyamként (JSON tömb, vagy soronként egy JSON objektum)
+    page, next_cursor = await list_files_page(get_db(), user_id, columns, sort, descending, None, FILES_PAGE_SIZE)
+    rows = iterate_files(get_db(), user_id, columns, sort, descending, page, next_cursor)
+    if format == "ndjson":
+        return StreamingResponse(files_ndjson(rows), media_type="application/x-ndjson", headers={"ETag": etag})
+    return StreamingResponse(files_json_array(rows), media_type="application/json", headers={"ETag": etag})
+
+@router.delete("/api/files")
 async def delete_file(
     request: Request, 
     filename: str,
     key_hex: Optional[str] = "", 
 ):
     #autentikáció
-    user_id = authenticate_user(request.cookies.get("session_token"))
-    user = get_user_by_id(supabase, user_id)
+    session_token = request.cookies.get("session_token")
+    user_id = authenticate_user(session_token)
     
     #törlés filename alapján
     if filename != "":
-        #fájl lekérése fájlnév alapján
-        result = supabase.table('files').select('*').eq('user_id', user_id).eq('filename', filename).execute().data
+        #felhasználó és a fájl lekérése fájlnév alapján (egy lekérdezésben)
+        user, matched_files = await get_user_with_files(get_db(), user_id, [filename])
+        result = matched_files[0] if matched_files else None
         
         #ha létezik a fájl az adatbázisban
         if result:
-            if result[0]['encrypted'] and not verify_password(key_hex, user['secret_key_hash']):
+            if result['encrypted'] and not (await resolve_secret_key(get_db(), user, key_hex, session_token))[1]:
                 raise HTTPException(status_code=401, detail="Invalid secret key")
 
-            #fájl létezésének ellenőrzése a fájlrendszerben (uuid alapján)
-            file_path = UPLOADS_DIR / str(user_id) / result[0]['uuid']
-            if not file_path.exists():
+            #fájl létezésének ellenőrzése a tárolóban (uuid alapján)
+            if not await run_io(get_store().exists, user_id, result['uuid']):
                 raise HTTPException(status_code=404, detail="File not found")
             
             #fájl törlése az adatbázisból (filename alapján)
-            response = supabase.table("files").delete().eq("user_id", user_id).eq("filename", filename).execute()
+            response = await get_db().delete_file(user_id, filename)
             if not response:
                 raise HTTPException(status_code=500, detail="Failed to delete from database")
+            await get_db().bump_files_version(user_id)
 
-            #fájl törlése a fájlrendszerből (uuid alapján)
+            #fájl törlése a tárolóból (uuid alapján)
             try:
-                os.remove(file_path)
+                if not await run_io(get_store().delete, user_id, result['uuid']):
+                    raise FileNotFoundError(result['uuid'])
                 return {"message": f"File '{filename}' deleted successfully."}
             except Exception as e:
                 raise HTTPException(status_code=500, detail=f"Failed to delete from server")
@@ -247,7 +418,7 @@ async def delete_file(
     else:
         raise HTTPException(status_code=400, detail=f"Invalid filename")
 
-@app.post("/api/upload")
+@router.post("/api/upload")
 async def upload(
     request: Request, 
     encrypted: Optional[bool] = False, 
@@ -255,73 +426,121 @@ async def upload(
     files: List[UploadFile] = File(...) 
 ):
     #autentikáció
-    user_id = authenticate_user(request.cookies.get("session_token"))
-    user = get_user_by_id(supabase, user_id)
-
-    #felhasználó utvonalának meghatározása, és ha kell létrehozása    
-    user_directory = Path("uploads") / str(user["id"])
-    user_directory.mkdir(parents=True, exist_ok=True)
-    
-    file_responses = []
+    session_token = request.cookies.get("session_token")
+    user_id = authenticate_user(session_token)
+
+    #felhasználó és a már létező, azonos nevű fájlok lekérése egy lekérdezésben
+    user, existing_files = await get_user_with_files(get_db(), user_id, [file.filename for file in files])
+    taken_filenames = {existing_file['filename'] for existing_file in existing_files}
+
+    #titkos kulcs (feloldott kulcs esetén nem kell megadni), egyszer ellenőrizve az összes fájlhoz
+    key_valid = False
+    if encrypted and user['has_key']:
+        key_hex, key_valid = await resolve_secret_key(get_db(), user, key_hex, session_token)
+
+    #ütköző fájlnevek a beérkezés sorrendjében (a kérésen belüli ismétlődést is beleértve)
+    duplicate_indexes = set()
+    for index, file in enumerate(files):
+        if file.filename in taken_filenames:
+            duplicate_indexes.add(index)
+        taken_filenames.add(file.filename)
+
+    #egy fájl feldolgozása: ellenőrzés, titkosítás vagy mentés
+    semaphore = asyncio.Semaphore(get_settings().upload_concurrency)
+    async def process_file(index: int, file: UploadFile):
+        async with semaphore:
+            try:
+                wrapped_key = None
 
-    #kapott fájlok feldolgozása
-    for file in files:
-        #fájl mentése
-        try:
-            #filename létezésének ellenőrzése
-            if is_filename_taken(supabase, file.filename, user_id):
-                raise Exception("Filename already in use")
+                #filename létezésének ellenőrzése
+                if index in duplicate_indexes:
+                    raise Exception("Filename already in use")
             
-            #file_path meghatározása (új fájlnév: uuid.kiterjesztés)
-            file_uuid = str(uuid.uuid4())
-            file_extension = Path(file.filename).suffix
-            new_filename = f"{file_uuid}{file_extension}"
-            file_path = user_directory / new_filename
-
-            #titkosított fájl esetén
-            if encrypted:
-                #user-nek nincs kulcsa
-                if not user['has_key']:
-                    raise HTTPException(401, "You don't have secret key")
-                #user-nek van kulcsa
-                elif user['has_key']:
-                    #nem adta meg a kulcsot
-                    if key_hex == "":
-                        raise HTTPException(401, 'Invalid secret key')
-                    #rossz kulcsot adott meg
-                    elif not verify_password(key_hex, user['secret_key_hash']):
-                        raise HTTPException(401, 'Invalid secret key')
-                #user-nek van kulcsa és ezt a kulcsot adta meg
-
-                file_content = await file.read()
-                
-                #fájl titkosítása a felhasználó kulcsával, algoritmusával és mentése a felhasználó mappájába
-                try:
-                    encrypt_file(file_content, file_path, key_hex, user['algo'])
-                except Exception as e:
-                    raise Exception(f"{e}")
+                #új fájlnév: uuid.kiterjesztés (ezen a néven kerül a tárolóba)
+                file_uuid = str(uuid.uuid4())
+                file_extension = Path(file.filename).suffix
+                new_filename = f"{file_uuid}{file_extension}"
+
+                #titkosított fájl esetén
+                if encrypted:
+                    #user-nek nincs kulcsa
+                    if not user['has_key']:
+                        raise HTTPException(401, "You don't have secret key")
+                    #user-nek van kulcsa
+                    elif user['has_key']:
+                        #nem adta meg a kulcsot, vagy rossz kulcsot adott meg
+                        if not key_valid:
+                            raise HTTPException(401, 'Invalid secret key')
+                    #user-nek van kulcsa és ezt a kulcsot adta meg
+
+                    #fájl saját, véletlen adatkulcsa, a felhasználó kulcsával becsomagolva
+                    data_key_hex, wrapped_key = new_data_key(key_hex, user['algo'], new_filename)
+
+                    #fájl titkosítása az adatkulccsal, a felhasználó algoritmusával és mentése a tárolóba
+                    #(a feltöltött fájl blokkonként kerül beolvasásra, nem egyben a memóriába;
+                    #a titkosítás a CPU pool-on, a tárolóba írás az IO pool-on fut)
+                    try:
+                        await file.seek(0)
+                        await encrypt_upload(file.file, get_store(), user_id, new_filename, data_key_hex, user['algo'])
+                    except Exception as e:
+                        raise Exception(f"{e}")
             
-            #sima fájl esetén
-            else:
-                #fájl mentése a felhasználó mappájába
-                with open(file_path, "wb") as f:
-                    shutil.copyfileobj(file.file, f)
+                #sima fájl esetén
+                else:
+                    #fájl mentése a tárolóba (a tartalom hash-e a letöltés ETag-je lesz)
+                    content_hash = await run_io(save_upload, file.file, get_store(), user_id, new_filename)
             
-            #fájl adatainak feltöltése az adatbázisba
-            res = supabase.table('files').insert({"filename": file.filename, "user_id": user_id, "encrypted": encrypted, "uuid": new_filename}).execute()
-            if not res:
-                raise HTTPException(500, 'Database error while updating files')
-            
-            #log
-            file_responses.append({"file": file.filename, "status": "uploaded", "error": ''})
+                #log, és a fájl adatai (az adatbázisba a feldolgozás után, egyetlen beszúrással kerülnek)
+                row = {"filename": file.filename, "user_id": user_id, "encrypted": encrypted, "uuid": new_filename, "wrapped_key": wrapped_key, "algo": user['algo'] if encrypted else None, "key_epoch": user['key_epoch']}
+                if not encrypted:
+                    row["content_hash"] = content_hash
+                return {"file": file.filename, "status": "uploaded", "error": ''}, row
+
+            except Exception as e:
+                return {"file": file.filename, "status": "failed", "error": str(e)}, None
+
+    #kapott fájlok párhuzamos feldolgozása korlátozott számban (egy lassú fájl nem tartja fel a többit)
+    #a válasz sorrendje a beérkezés sorrendje marad
+    results = await asyncio.gather(*(process_file(index, file) for index, file in enumerate(files)))
+    file_responses = [file_response for file_response, _ in results]
+    new_rows = [(index, row) for index, (_, row) in enumerate(results) if row]
 
-        except Exception as e:
-            file_responses.append({"file": file.filename, "status": "failed", "error": str(e)})
+    #fájlok adatainak feltöltése az adatbázisba (egy utasítás az összes sikeres fájlra)
+    if new_rows:
+        try:
+            inserted = await get_db().create_files([row for _, row in new_rows])
+            if len(inserted) != len(new_rows):
+                raise Exception('Database error while updating files')
+        except Exception:
+            #sikertelen tömeges beszúrás: a hiba (pl. időtúllépés) a beszúrás után is jöhetett, ezért a már bekerült
+            #sorok (uuid alapján) nem ismétlődnek, csak a hiányzók kerülnek be soronként (a hibás fájlok elkülönítésére)
+            existing = {file['uuid'] for file in await get_db().get_files_by_uuid(user_id, [row['uuid'] for _, row in new_rows])}
+            for index, row in new_rows:
+                if row['uuid'] in existing:
+                    continue
+                try:
+                    if not await get_db().create_file(row):
+                        raise HTTPException(500, 'Database error while updating files')
+                except Exception as e:
+                    #a sor ekkor is bekerülhetett: a fájl csak akkor törlődik, ha biztosan nincs hozzá sor
+                    #(ha ez nem dönthető el, a fájl marad: legfeljebb árva fájl, de nem vész el feltöltött adat)
+                    try:
+                        created = bool(await get_db().get_files_by_uuid(user_id, [row['uuid']]))
+                    except Exception:
+                        created = None
+                    if created:
+                        continue
+                    file_responses[index] = {"file": row['filename'], "status": "failed", "error": str(e)}
+                    if created is False:
+                        await run_io(get_store().delete, user_id, row['uuid'])
+
+        #fájl lista verziójának léptetése (a korábbi ETag-ek érvénytelenek)
+        await get_db().bump_files_version(user_id)
 
     #logok visszaadása
     return file_responses
 
-@app.get("/api/download")
+@router.get("/api/download")
 async def download(
     request: Request, 
     filename: str,
@@ -329,69 +548,172 @@ async def download(
 ):
     print('download')
     #autentikáció
-    user_id = authenticate_user(request.cookies.get("session_token"))
-    user = get_user_by_id(supabase, user_id)
+    session_token = request.cookies.get("session_token")
+    user_id = authenticate_user(session_token)
     
-    #fájl adatainak lekérése
-    result = supabase.table('files').select('*').eq('user_id', user_id).eq('filename', filename).execute().data
+    #felhasználó és a fájl adatainak lekérése (egy lekérdezésben), majd a fájl megnyitása
+    #(ha a fájlt közben háttérben átalakították új néven, a sor egyszer újraolvasásra kerül)
+    user, matched_files = await get_user_with_files(get_db(), user_id, [filename])
+    result = matched_files[0] if matched_files else None
+
+    #titkosítatlan fájl változatlan tartalommal: 304, a fájl megnyitása nélkül
+    etag = content_etag(result) if result and not result['encrypted'] else None
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    input_file = None
+    for attempt in range(2):
+        if attempt:
+            #a gyorsítótárban lévő sor elavult lehet (pl. egy másik processz alakította át a fájlt)
+            get_db().invalidate_files(user_id)
+            result = await get_db().get_file(user_id, filename)
+        if not result:
+            break
+        try:
+            input_file = await run_io(get_store().open_read, user_id, result['uuid'])
+            break
+        except FileNotFoundError:
+            continue
 
     #ha létezik a fájl az adatbázisban
     if result:
-        #fájl létezésének ellenőrzése a fájlrendszerben
-        file_path = UPLOADS_DIR / str(user_id) / result[0]['uuid']
-        if not file_path.exists():
+        #fájl létezésének ellenőrzése a tárolóban
+        if input_file is None:
             raise HTTPException(status_code=404, detail="File not found")
 
         #titkosított fájl
-        if result[0]['encrypted']:
-            #felhasználó nem adott meg titkos kulcsot
+        if result['encrypted']:
+            #megadott vagy feloldott titkos kulcs
+            key_hex, key_valid = await resolve_secret_key(get_db(), user, key_hex, session_token)
+
+            #felhasználó nem adott meg titkos kulcsot, és nincs feloldott kulcsa
             if key_hex == "":
+                input_file.close()
                 raise HTTPException(status_code=400, detail="Invalid secret key")
             
             #user-nek van titkos kulcsa, de nem egyezik a felhasználó által megadottal
-            if user['secret_key_hash'] and not verify_password(key_hex, user['secret_key_hash']):
+            if user['secret_key_hash'] and not key_valid:
+                input_file.close()
                 raise HTTPException(status_code=401, detail="Invalid secret key")
             #user-nek van titkos kulcs (mivel van titkosított fájlja), és megegyezik a felhasználó által megadottal
             
-            #kititkosítás
+            #kititkosítás folyamként, átmeneti fájl nélkül: a visszafejtett blokkok közvetlenül a kliensnek mennek
+            #(a már megnyitott fájl akkor is végigolvasható, ha közben háttérben átalakítják és törlik)
             try:
-                #átmeneti útvonal meghatározása
-                decrypted_file_path = TEMP_DIR / f"decrypted_{result[0]['uuid']}"
-
-                #fájl kititkosítása a felhasználó mappájából az átmeneti útvonalra
-                decrypt_file(file_path, decrypted_file_path, key_hex, user['algo'])
-
-                #kititkosított fájl visszaadása az átmeneti útvonalról
-                return FileResponse(
-                    decrypted_file_path,  
-                    filename=filename,
-                )
+                #fájl adatkulcsa (régi fájloknál maga a felhasználó kulcsa) és algoritmusa
+                data_key_hex = file_key_hex(result, key_hex)
+                algo = file_algo(result, user)
+                header = await run_io(read_file_header, input_file)
+                size = decrypted_size(input_file, header)
+
+                #Range kérés csak szegmentált konténernél teljesíthető (csak az érintett szegmensek kerülnek visszafejtésre)
+                byte_range = parse_range_header(request.headers.get("range"), size) if header else None
+                if byte_range:
+                    start, end = byte_range
+                    decrypted_chunks = decrypt_file_range(input_file, data_key_hex, header, start, end)
+                else:
+                    decrypted_chunks = decrypt_file_stream(input_file, data_key_hex, algo)
+            except HTTPException:
+                input_file.close()
+                raise
             except Exception as e:
+                input_file.close()
                 raise HTTPException(status_code=400, detail=f"Decryption failed")
-                
+
+            #részleges válasz
+            if byte_range:
+                headers = download_headers(filename, end - start + 1)
+                headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+                headers["Accept-Ranges"] = "bytes"
+                return StreamingResponse(
+                    iterate_decrypted(decrypted_chunks, input_file, decrypt_read_ahead(input_file, header)),
+                    status_code=206,
+                    media_type=guess_media_type(filename),
+                    headers=headers,
+                )
+
+            #régi algoritmusú vagy adatkulcs nélküli fájl: a válasz után háttérben átalakul a user jelenlegi algoritmusára
+            #(kivéve, ha épp fut a user fájljait átalakító job, az úgyis sorra veszi)
+            background = None
+            if (algo != user['algo'] or not result.get('wrapped_key')) and not await run_io(find_unfinished_job, user_id, JOBS_DIR):
+                file = {**result, 'algo': algo}
+                background = BackgroundTask(migrate_file, get_store(), user_id, file, key_hex, user['key_epoch'], user['algo'], finish_file_conversion)
+
+            #teljes válasz
+            headers = download_headers(filename, size)
+            if header:
+                headers["Accept-Ranges"] = "bytes"
+            return StreamingResponse(
+                iterate_decrypted(decrypted_chunks, input_file, decrypt_read_ahead(input_file, header)),
+                media_type=guess_media_type(filename),
+                headers=headers,
+                background=background,
+            )
+
         #sima fájl
         else:
-            #fájl visszaadása a felhasználó mappájából
-            return FileResponse(path=file_path, filename=filename)
+            etag = content_etag(result)
+
+            #helyi fájl: a FileResponse sendfile-lal küldi (a Range kérést is kezeli)
+            file_path = get_store().local_path(input_file)
+            if file_path is not None:
+                input_file.close()
+                return FileResponse(path=file_path, filename=filename, headers={"ETag": etag} if etag else None)
 
-@app.get("/api/algos")
+            #objektumtár: folyamként, tartományos GET-ekkel (Range kérésnél csak a kért rész kerül lekérésre)
+            try:
+                size = blob_size(input_file)
+                byte_range = parse_range_header(request.headers.get("range"), size)
+            except HTTPException:
+                input_file.close()
+                raise
+            start, end = byte_range or (0, size - 1)
+            headers = download_headers(filename, end - start + 1)
+            headers["Accept-Ranges"] = "bytes"
+            if etag:
+                headers["ETag"] = etag
+            if byte_range:
+                headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            return StreamingResponse(
+                iterate_on_io(read_blob_range(input_file, start, end)),
+                status_code=206 if byte_range else 200,
+                media_type=guess_media_type(filename),
+                headers=headers,
+            )
+
+@router.get("/api/algos")
 async def get_algos():
     return ALGOS
 
-@app.get("/api/encrypt-details")
+@router.get("/api/ready")
+async def ready(request: Request):
+    #readiness: csak a bemelegítés (titkosítók, pool-ok, adatbázis kapcsolat) után fogad forgalmat
+    if not request.app.state.ready:
+        return JSONResponse(status_code=503, content={"status": "warming up"})
+    return {"status": "ready"}
+
+@router.get("/api/metrics")
+async def get_metrics():
+    #jelszó hash-elés: sorban állás és hash idő, elutasított kérések
+    #metaadat gyorsítótár: találatok és tévesztések
+    #karbantartás: ez a worker-e a vezető
+    return {"bcrypt": bcrypt_stats(), "cache": get_metadata_cache().stats(), "maintenance": maintenance.stats()}
+
+@router.get("/api/encrypt-details")
 async def get_user_algo(request: Request):
     #autentikáció
     user_id = authenticate_user(request.cookies.get("session_token"))
-    user = get_user_by_id(supabase, user_id)
+    user = await get_user_by_id(get_db(), user_id)
     
     #user algoritmusának és has_key paraméterének visszaadása
     return { "algo": user['algo'], "has_secret_key": user['has_key']}
 
-@app.post("/api/switch-algo")
+@router.post("/api/switch-algo")
 async def switch_algo(request: Request, algo_request: AlgoChangeRequest):
     #autentikáció
-    user_id = authenticate_user(request.cookies.get("session_token"))
-    user = get_user_by_id(supabase, user_id)
+    session_token = request.cookies.get("session_token")
+    user_id = authenticate_user(session_token)
+    user = await get_user_by_id(get_db(), user_id)
     
     #megadott algoritmus ellenőrzése
     allowed_algos = [item['name'] for item in ALGOS]
@@ -399,49 +721,89 @@ async def switch_algo(request: Request, algo_request: AlgoChangeRequest):
         raise HTTPException(status_code=400, detail="Invalid algorithm")
     
     #titkosított fájlok lekérése
-    encrypted_files = supabase.table('files').select('*').eq('user_id', user_id).eq('encrypted', True).execute().data
+    encrypted_files = await get_db().list_encrypted_files(user_id)
     
     #ha user-nek van titkosított fájlja
+    job = None
     if encrypted_files:
-        #megadott titkos kulcs helyes
-        if user['has_key'] and verify_password(algo_request.key_hex, user['secret_key_hash']):
-            try:
-                #user titkos fájljainak kititkosítása
-                decrypt_user_files(user_id, algo_request.key_hex, encrypted_files, user['algo'], UPLOADS_DIR, TEMP_DIR)
-
-                #user titkos fájljainak újratitkosítása
-                encrypt_user_files(user_id, algo_request.key_hex, encrypted_files, algo_request.algo, TEMP_DIR, UPLOADS_DIR)
-
-                #adatbázisban az algo frissítése
-                update_response = supabase.table('user').update({'algo': algo_request.algo}).eq('id', user_id).execute()
-                if not update_response:
-                    raise HTTPException(status_code=400, detail="Failed to update database")
-            except RuntimeError as e:
-                print(f"{e}")
-                raise HTTPException(status_code=400, detail="Failed re-encryption")
-
-            #log
-            return JSONResponse(content={"message": f"Algorithm updated to {algo_request.algo}"})
-        
-        #megadott titkos kulcs helytelen
-        else:
+        #megadott (vagy feloldott) titkos kulcs helytelen
+        if not user['has_key']:
             raise HTTPException(status_code=401, detail="Invalid secret key")
-    
-    #ha user-nek nincs titkosított fájlja
-    else:
-        #adatbázis frissítése
-        update_response = supabase.table('user').update({'algo': algo_request.algo}).eq('id', user_id).execute()
-        if not update_response:
-            raise HTTPException(status_code=500, detail="Failed to update database")
+        key_hex, key_valid = await resolve_secret_key(get_db(), user, algo_request.key_hex, session_token)
+        if not key_valid:
+            raise HTTPException(status_code=401, detail="Invalid secret key")
+
+        #félbeszakadt (pl. újraindítás miatt szüneteltetett) váltás ugyanarra az algoritmusra: folytatás, a már kész fájlok nélkül
+        previous_job = await run_io(find_unfinished_job, user_id, JOBS_DIR)
+        if previous_job and previous_job['status'] == "paused" and previous_job['new_algo'] == algo_request.algo:
+            job = await run_io(
+                start_switch_algo_job, user_id, key_hex, user['key_epoch'], [], previous_job['old_algo'], algo_request.algo,
+                get_store(), get_settings().reencrypt_workers, finish_file_conversion, job=previous_job, jobs_dir=JOBS_DIR,
+            )
+
+        #korábbi, még futó vagy félbeszakadt, más célú átalakítás visszavonása (másik processzben futó nem vonható vissza)
+        elif previous_job and not await run_io(cancel_job, previous_job, JOBS_DIR):
+            raise HTTPException(status_code=409, detail="Algorithm switch already in progress")
+
+        #algoritmus nélküli (régi) sorok: a fájlok a user eddigi algoritmusával vannak titkosítva
+        await get_db().fill_missing_file_algo(user_id, user['algo'])
+        for file in encrypted_files:
+            file['algo'] = file_algo(file, user)
+
+        #más algoritmusú és a régi (adatkulcs nélküli) fájlok átalakítása alacsony prioritású háttér jobban
+        #(a letöltött fájlok ettől függetlenül, lustán is átalakulnak)
+        files_to_convert = [file for file in encrypted_files if file['algo'] != algo_request.algo or not file.get('wrapped_key')]
+        if files_to_convert and job is None:
+            #a job összeállítása fájlonként lekérdezi a tárolót és kiírja a job fájlt: az IO pool-on fut
+            job = await run_io(
+                start_switch_algo_job, user_id, key_hex, user['key_epoch'], files_to_convert, user['algo'], algo_request.algo,
+                get_store(), get_settings().reencrypt_workers, finish_file_conversion, jobs_dir=JOBS_DIR,
+            )
+
+    #adatbázis frissítése: az új algoritmus azonnal érvényes az új feltöltésekre
+    update_response = await get_db().update_user(user_id, {'algo': algo_request.algo})
+    if not update_response:
+        raise HTTPException(status_code=500, detail="Failed to update database")
+    await get_db().bump_files_version(user_id)
 
-        #log
-        return JSONResponse(content={"message": f"Algorithm updated to {algo_request.algo}"})
+    #log
+    content = {"message": f"Algorithm updated to {algo_request.algo}"}
+    if job:
+        content["job_id"] = job['id']
+    return JSONResponse(content=content)
 
-@app.get("/api/gen-sk")
+@router.get("/api/jobs/{job_id}")
+async def get_job(request: Request, job_id: str):
+    #autentikáció
+    user_id = authenticate_user(request.cookies.get("session_token"))
+
+    #job lekérése, csak a saját job-ja látható
+    job = await run_io(load_job, user_id, job_id, JOBS_DIR)
+    if not job or job['user_id'] != user_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    #állapot visszaadása (kész fájlok, bájtok, becsült hátralévő idő)
+    return job_progress(job)
+
+def finish_file_conversion(user_id: int, old_uuid: str, plan: dict) -> bool:
+    #átalakított fájl: a sor az új fájlra, adatkulcsra és algoritmusra mutat
+    #(csak ha még a régi fájlra mutatott; False, ha közben törölték vagy máshol már átalakították)
+    #a fájl listában látható algoritmus megváltozott: a lista verziója is lép
+    updated = get_repo().update_file(user_id, old_uuid, {
+        'uuid': plan['new_uuid'],
+        'wrapped_key': plan['wrapped_key'],
+        'algo': plan['new_algo'],
+        'key_epoch': plan['key_epoch'],
+    })
+    if updated:
+        get_repo().bump_files_version(user_id)
+    return updated
+
+@router.get("/api/gen-sk")
 async def gen_sk(request: Request):
     #autentikáció
     user_id = authenticate_user(request.cookies.get("session_token"))
-    user = get_user_by_id(supabase, user_id)
+    user = await get_user_by_id(get_db(), user_id)
     
     #user-nek már van kulcsa
     if user['has_key']:
@@ -454,18 +816,106 @@ async def gen_sk(request: Request):
         key_hex = key.hex()
 
         #adatbázis frissítése
-        update_response = supabase.table('user').update({'has_key': True, 'secret_key_hash': hash_password(key_hex)}).eq('id', user_id).execute()
+        update_response = await get_db().update_user(user_id, {'has_key': True, 'secret_key_hash': hash_secret_key(key_hex)})
         if not update_response:
             raise HTTPException(status_code=500, detail=f"Failed to update database")
         
         #kulcs visszaadása
         return key_hex
 
-@app.post("/api/verify-secret-key")
+@router.post("/api/rotate-sk")
+async def rotate_sk(request: Request, rotate_request: RotateKeyRequest):
+    #autentikáció
+    session_token = request.cookies.get("session_token")
+    user_id = authenticate_user(session_token)
+    user = await get_user_by_id(get_db(), user_id)
+
+    #megadott (vagy feloldott) titkos kulcs helytelen
+    if not user['has_key']:
+        raise HTTPException(status_code=401, detail="Invalid secret key")
+    key_hex, key_valid = await resolve_secret_key(get_db(), user, rotate_request.key_hex, session_token)
+    if not key_valid:
+        raise HTTPException(status_code=401, detail="Invalid secret key")
+
+    #futó átalakítás a régi kulccsal csomagolná be az új adatkulcsokat
+    if await run_io(find_unfinished_job, user_id, JOBS_DIR):
+        raise HTTPException(status_code=409, detail="Algorithm switch in progress")
+
+    #régi (közvetlenül a titkos kulccsal titkosított) fájlok tartalmát újra kellene titkosítani: előbb háttér jobban
+    #átalakulnak envelope formátumra (az algoritmusuk marad), a kulcscsere a job után ismételhető
+    encrypted_files = await get_db().list_encrypted_files(user_id)
+    legacy_files = [{**file, 'algo': file_algo(file, user)} for file in encrypted_files if not file.get('wrapped_key')]
+    if legacy_files:
+        job = await run_io(
+            start_switch_algo_job, user_id, key_hex, user['key_epoch'], legacy_files, user['algo'], user['algo'],
+            get_store(), get_settings().reencrypt_workers, finish_file_conversion, jobs_dir=JOBS_DIR,
+        )
+        return JSONResponse(status_code=409, content={"detail": "Legacy files are being converted, retry when the job is done", "job_id": job['id']})
+
+    #új kulcs: a hash-e és a kulcs epoch-ja együtt lép, csak ha közben más nem cserélte le a kulcsot
+    #innentől a régi kulccsal becsomagolt adatkulcsot az adatbázis nem fogadja el (folyamatban lévő feltöltés vagy
+    #átalakítás, egy másik worker feloldott vagy gyorsítótárazott régi kulcsa), az ilyen írás hibával leáll
+    new_key_hex = generate_key().hex()
+    key_epoch = await get_db().advance_key_epoch(user_id, user['key_epoch'], hash_secret_key(new_key_hex))
+    if key_epoch is None:
+        raise HTTPException(status_code=409, detail="Secret key changed in the meantime")
+
+    #a léptetés előtt beírt sorok mind kellenek: a fájl lista az adatbázisból (nem a gyorsítótárból)
+    #csak a 32 bájtos adatkulcsok kerülnek újracsomagolásra, a fájlok tartalma változatlan marad
+    updated = []
+    try:
+        get_db().invalidate_files(user_id)
+        encrypted_files = [file for file in await get_db().list_encrypted_files(user_id) if file.get('wrapped_key')]
+        rewrapped_files = await run_cpu(rewrap_file_keys, encrypted_files, key_hex, new_key_hex, user['algo'])
+        for file, rewrapped in zip(encrypted_files, rewrapped_files):
+            if await get_db().update_file(user_id, file['uuid'], {'wrapped_key': rewrapped['wrapped_key'], 'key_epoch': key_epoch}):
+                updated.append(file)
+    except Exception as e:
+        #visszaállás a régi kulcsra egy újabb epoch-kal (a közben elutasított írások a régi kulccsal újrapróbálhatók),
+        #a már frissített sorok a régi adatkulcsukkal
+        print(f"Nem sikerült a kulcscsere: {e}")
+        restored_epoch = await get_db().advance_key_epoch(user_id, key_epoch, user['secret_key_hash'])
+        if restored_epoch is not None:
+            for file in updated:
+                await get_db().update_file(user_id, file['uuid'], {'wrapped_key': file['wrapped_key'], 'key_epoch': restored_epoch})
+        raise HTTPException(status_code=500, detail="Failed to rewrap file keys")
+
+    #a régi kulccsal feloldott session-ök már nem érvényesek
+    key_vault.lock_user(user_id)
+    await get_db().bump_files_version(user_id)
+
+    #új kulcs visszaadása
+    return new_key_hex
+
+@router.post("/api/verify-secret-key")
 async def verify_sicret_key(request: Request, key_hex: str):
     #autentikáció
     user_id = authenticate_user(request.cookies.get("session_token"))
-    user = get_user_by_id(supabase, user_id)
+    user = await get_user_by_id(get_db(), user_id)
     
     #validáció visszaadása
-    return verify_password(key_hex, user['secret_key_hash'])
\ No newline at end of file
+    return await check_secret_key(get_db(), user, key_hex)
+
+@router.post("/api/unlock")
+async def unlock(request: Request, key_hex: str):
+    #autentikáció
+    session_token = request.cookies.get("session_token")
+    user_id = authenticate_user(session_token)
+    user = await get_user_by_id(get_db(), user_id)
+
+    #kulcs ellenőrzése egyszer, utána a session-höz tartozóan a memóriában marad
+    if not user['has_key'] or not await check_secret_key(get_db(), user, key_hex):
+        raise HTTPException(status_code=401, detail="Invalid secret key")
+    key_vault.unlock(session_token, user_id, key_hex, user['key_epoch'])
+
+    return {"message": "Secret key unlocked", "idle_timeout": KEY_VAULT_IDLE_TTL}
+
+@router.post("/api/lock")
+async def lock(request: Request):
+    #autentikáció
+    session_token = request.cookies.get("session_token")
+    authenticate_user(session_token)
+
+    #feloldott kulcs eldobása
+    key_vault.lock(session_token)
+    return {"message": "Secret key locked"}
\ No newline at end of file
@@ -1,13 +1,23 @@
 from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from functools import partial
+import asyncio
+from collections import deque
 import threading
-from supabase import Client
-from security import aes_encrypt_file, aes_decrypt_file, chacha20_encrypt_file, chacha20_decrypt_file
+from repository import Repository, AsyncRepository, FILE_LIST_COLUMNS
+from storage import BlobStore
+from security import STREAM_CHUNK_SIZE, verify_secret_key, hash_secret_key, secret_key_needs_upgrade, calibrate_bcrypt_rounds, warm_up_ciphers, generate_key, wrap_data_key, unwrap_data_key, aes_decrypt_stream, chacha20_decrypt_stream, read_container_header, container_plaintext_size, container_decrypt_range, container_encrypt_chunks, container_segment_offset, key_vault, CONTAINER_HEADER, TAG_SIZE
 from pydantic import EmailStr
 from pathlib import Path
+from typing import AsyncIterator, Awaitable, BinaryIO, Callable, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+import mimetypes
 from fastapi import FastAPI, HTTPException
-from io import BytesIO
-import shutil
+import hashlib
+import base64
+import json
 import time
+import uuid
 import os
 
 
@@ -18,88 +28,587 @@ import os
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("✅ Server: setup ready")
-    
-    thread = threading.Thread(
-        target=cleanup_folder, args=(5,"temp"), daemon=True
-    )
-    thread.start()
+
+    #közös karbantartás (árva ideiglenes fájlok, félbeszakadt és lejárt jobok) csak a kiválasztott workerben
+    maintenance.start([sweep_temp_dir, partial(pause_interrupted_jobs, JOBS_DIR), partial(prune_finished_jobs, JOBS_DIR)])
 
     yield
-    
+
+    maintenance.stop()
+
+    #újratitkosító process pool és a kéréseket kiszolgáló pool-ok leállítása
+    shutdown_reencrypt_pool()
+    shutdown_executors()
+    shutdown_bcrypt_executor()
+
     print("🛑 Server: shutdown complete")
 
-def cleanup_folder(wait_minutes=5, folder=None):
-    if folder is None:
-        return 0
-    while(True):
-        #jelenlegi fájlok lekárdezáse
-        initial_files = {
-            os.path.join(folder, f)
-            for f in os.listdir(folder)
-            if os.path.isfile(os.path.join(folder, f))
-        }
+WARM_UP_MAX_DELAY = 30 # mp, elérhetetlen adatbázis esetén az újrapróbálások közti maximális várakozás
+
+async def warm_up(repo: Repository, db: AsyncRepository):
+    #induláskor, a kérések kiszolgálása mellett: amíg nem fut le, a readiness végpont 503-at ad
+
+    #bcrypt költség kalibrálása a célidőhöz (ha nincs kézzel megadva)
+    if not os.getenv('BCRYPT_ROUNDS'):
+        rounds = await run_cpu(calibrate_bcrypt_rounds, BCRYPT_TARGET_MS)
+        print(f"🔑 bcrypt rounds: {rounds} (target {BCRYPT_TARGET_MS} ms)")
+
+    #titkosító backend-ek és a szál pool-ok
+    await run_cpu(warm_up_ciphers)
+    await run_io(get_bcrypt_executor)
+
+    #adatbázis kapcsolatok (szinkron kliens a háttérszálaknak, aszinkron pool a route-oknak), amíg el nem érhetők
+    attempt = 0
+    while True:
+        try:
+            await run_io(repo.get_user, 0)
+            await db.get_user(0)
+            break
+        except Exception as e:
+            delay = min(2 ** attempt, WARM_UP_MAX_DELAY)
+            print(f"Adatbázis nem érhető el ({e}), újra {delay} mp múlva")
+            await asyncio.sleep(delay)
+            attempt += 1
+    print("✅ Server: warm-up done")
+
+def _reset_after_fork():
+    #fork után (pl. előre betöltött alkalmazás, több worker) a szálak és processzek nem öröklődnek:
+    #a pool-ok és a futó jobok nyilvántartása a gyerek processzben újra, első használatkor jön létre
+    global _cpu_executor, _io_executor, _executors_lock, _bcrypt_executor, _bcrypt_pending, _bcrypt_lock, _reencrypt_pool, _jobs, _jobs_lock
+    _cpu_executor = _io_executor = _bcrypt_executor = _reencrypt_pool = None
+    _executors_lock = threading.Lock()
+    _bcrypt_pending = 0
+    _bcrypt_lock = threading.Lock()
+    _jobs = {}
+    _jobs_lock = threading.Lock()
 
-        #várakozási idő
-        print(f"{len(initial_files)} fájl várakozik törlésre. ({wait_minutes} perc)")
-        time.sleep(wait_minutes * 60)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
 
-        #a wait_minutes perce a mappában lévő fájlok törlése
-        deleted = []
-        for filepath in initial_files:
+
+
+#######
+########## EXECUTORS
+####
+
+#blokkoló műveletek külön, korlátos méretű pool-okon futnak, hogy ne állítsák meg az event loop-ot
+#   CPU: bcrypt, AES/ChaCha titkosítás-visszafejtés
+#   IO:  adatbázis hívások, fájlműveletek
+CPU_WORKERS = int(os.getenv('CPU_WORKERS') or os.cpu_count() or 1)
+IO_WORKERS = int(os.getenv('IO_WORKERS') or 16)
+
+_cpu_executor: Optional[ThreadPoolExecutor] = None
+_io_executor: Optional[ThreadPoolExecutor] = None
+_executors_lock = threading.Lock()
+
+def get_cpu_executor() -> ThreadPoolExecutor:
+    global _cpu_executor
+    with _executors_lock:
+        if _cpu_executor is None:
+            _cpu_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="cpu")
+        return _cpu_executor
+
+def get_io_executor() -> ThreadPoolExecutor:
+    global _io_executor
+    with _executors_lock:
+        if _io_executor is None:
+            _io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
+        return _io_executor
+
+def shutdown_executors():
+    global _cpu_executor, _io_executor
+    with _executors_lock:
+        for executor in (_cpu_executor, _io_executor):
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        _cpu_executor = None
+        _io_executor = None
+
+async def run_cpu(func: Callable, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_cpu_executor(), partial(func, *args, **kwargs))
+
+async def run_io(func: Callable, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_io_executor(), partial(func, *args, **kwargs))
+
+async def iterate_decrypted(chunks: Iterator[bytes], input_file: BinaryIO, read_ahead: int) -> AsyncIterator[bytes]:
+    #visszafejtett blokkok a CPU pool-on; objektumtárból olvasott fájlnál a következő lépés adata előtte az IO pool-on
+    #töltődik le (prefetch), így a CPU szálak csak az AEAD műveletet végzik, nem várnak a hálózatra
+    prefetch = getattr(input_file, "prefetch", None)
+    async def run(func: Callable, *args):
+        if prefetch is not None:
+            await run_io(prefetch, read_ahead)
+        return await run_cpu(func, *args)
+    async for chunk in _iterate_in(run, chunks):
+        yield chunk
+
+async def iterate_on_io(chunks: Iterator[bytes]) -> AsyncIterator[bytes]:
+    #blokkok olvasása (pl. objektumtárból) az IO pool-on (StreamingResponse-hoz)
+    async for chunk in _iterate_in(run_io, chunks):
+        yield chunk
+
+async def _iterate_in(run: Callable[..., Awaitable], chunks: Iterator[bytes]) -> AsyncIterator[bytes]:
+    try:
+        while True:
+            chunk = await run(next, chunks, None)
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        #megszakított letöltésnél is lezárul a generátor (és vele a fájl)
+        #(ha a megszakított blokk még fut, a generátort a szemétgyűjtő zárja le)
+        close = getattr(chunks, "close", None)
+        if close:
             try:
-                os.remove(filepath)
-                deleted.append(filepath)
-            except Exception as e:
-                print(f"Nem sikerült törölni: {filepath} – {e}")
+                await run_io(close)
+            except ValueError:
+                pass
+
+
+
+#######
+########## TEMP FILES
+####
+
+TEMP_DIR = Path("temp")
+TEMP_FILE_TTL = float(os.getenv('TEMP_FILE_TTL') or 600)    # a temp mappában maradt fájlok ennyi mp után törlődnek (karbantartás)
+
+
+
+#######
+########## MAINTENANCE
+####
+
+#több worker (uvicorn --workers N) esetén a közös mappákat karbantartó feladatok csak egy processzben futnak:
+#az a worker a vezető, amelyik megszerzi a zárfájlt (flock); ha leáll, a zárat a kernel elengedi, és egy másik veszi át
+MAINTENANCE_LOCK = TEMP_DIR / ".maintenance.lock"
+MAINTENANCE_INTERVAL = float(os.getenv('MAINTENANCE_INTERVAL') or 60)   # karbantartás, és a vezetői zár újrapróbálásának gyakorisága (mp)
+
+class MaintenanceLeader:
+    def __init__(self, lock_path: Path = MAINTENANCE_LOCK, interval: float = MAINTENANCE_INTERVAL):
+        self.lock_path = Path(lock_path)
+        self.interval = interval
+        self.tasks: List[Callable] = []
+        self.is_leader = False
+        self.runs = 0
+        self._lock_file = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _try_acquire(self) -> bool:
+        try:
+            import fcntl
+        except ImportError:
+            #flock nélküli platform (Windows): egy processzes futtatást feltételezve mindig vezető
+            return True
+        self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+        lock_file = open(self.lock_path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self.is_leader and self._try_acquire():
+                self.is_leader = True
+                print(f"🧹 Maintenance leader: pid {os.getpid()}")
+            if self.is_leader:
+                for task in self.tasks:
+                    try:
+                        task()
+                    except Exception as e:
+                        print(f"Karbantartási hiba: {e}")
+                self.runs += 1
+            self._stop.wait(self.interval)
+
+    def start(self, tasks: List[Callable]):
+        if self._thread is not None:
+            return
+        self.tasks = list(tasks)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        thread, self._thread = self._thread, None
+        self._stop.set()
+        if thread is not None:
+            thread.join()
+        #zár elengedése: egy másik worker átveheti
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+        self.is_leader = False
+
+    def stats(self) -> dict:
+        return {'leader': self.is_leader, 'pid': os.getpid(), 'runs': self.runs}
+
+maintenance = MaintenanceLeader()
+
+def sweep_temp_dir(temp_dir: Path = TEMP_DIR, ttl: float = TEMP_FILE_TTL):
+    #korábbi verziók által a temp mappában hagyott, lejárt fájlok (a zárfájlok maradnak)
+    if not Path(temp_dir).is_dir():
+        return
+    removed = 0
+    for entry in os.scandir(temp_dir):
+        if entry.name.startswith(".") or not entry.is_file():
+            continue
+        try:
+            if time.time() - entry.stat().st_mtime > ttl:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    if removed:
+        print(f"{removed} árva ideiglenes fájl törölve")
+
+
+
+#######
+########## BCRYPT ADMISSION
+####
+
+#jelszó hash-elés (bcrypt) korlátozott párhuzamossággal és korlátos várakozási sorral
+#ha a sor megtelt, a kérés azonnal 429-et kap Retry-After fejléccel, a többi végpont nem lassul be
+BCRYPT_CONCURRENCY = int(os.getenv('BCRYPT_CONCURRENCY') or CPU_WORKERS)
+BCRYPT_QUEUE_DEPTH = int(os.getenv('BCRYPT_QUEUE_DEPTH') or 4 * BCRYPT_CONCURRENCY)
+BCRYPT_TARGET_MS = int(os.getenv('BCRYPT_TARGET_MS') or 250)
+
+_bcrypt_executor: Optional[ThreadPoolExecutor] = None
+_bcrypt_pending = 0
+_bcrypt_lock = threading.Lock()
+bcrypt_metrics = {
+    'completed': 0,
+    'rejected': 0,
+    'queue_wait_seconds_total': 0.0,
+    'queue_wait_seconds_max': 0.0,
+    'hash_seconds_total': 0.0,
+    'hash_seconds_max': 0.0,
+}
+
+def get_bcrypt_executor() -> ThreadPoolExecutor:
+    global _bcrypt_executor
+    with _bcrypt_lock:
+        if _bcrypt_executor is None:
+            _bcrypt_executor = ThreadPoolExecutor(max_workers=max(1, BCRYPT_CONCURRENCY), thread_name_prefix="bcrypt")
+        return _bcrypt_executor
+
+def shutdown_bcrypt_executor():
+    global _bcrypt_executor
+    with _bcrypt_lock:
+        if _bcrypt_executor is not None:
+            _bcrypt_executor.shutdown(wait=False, cancel_futures=True)
+            _bcrypt_executor = None
+
+def _bcrypt_retry_after() -> int:
+    #becslés: a sorban állók ennyi másodperc alatt fogynak el az átlagos hash idővel
+    completed = bcrypt_metrics['completed']
+    average = bcrypt_metrics['hash_seconds_total'] / completed if completed else BCRYPT_TARGET_MS / 1000
+    return max(1, int(_bcrypt_pending * average / max(1, BCRYPT_CONCURRENCY)) + 1)
+
+def _record_bcrypt(queue_wait: float, hash_time: float):
+    with _bcrypt_lock:
+        bcrypt_metrics['completed'] += 1
+        bcrypt_metrics['queue_wait_seconds_total'] += queue_wait
+        bcrypt_metrics['queue_wait_seconds_max'] = max(bcrypt_metrics['queue_wait_seconds_max'], queue_wait)
+        bcrypt_metrics['hash_seconds_total'] += hash_time
+        bcrypt_metrics['hash_seconds_max'] = max(bcrypt_metrics['hash_seconds_max'], hash_time)
+
+async def run_bcrypt(func: Callable, *args):
+    global _bcrypt_pending
+
+    #beengedés: futó + várakozó műveletek száma korlátos
+    with _bcrypt_lock:
+        if _bcrypt_pending >= BCRYPT_CONCURRENCY + BCRYPT_QUEUE_DEPTH:
+            bcrypt_metrics['rejected'] += 1
+            retry_after = _bcrypt_retry_after()
+            raise HTTPException(status_code=429, detail="Too many requests, try again later", headers={"Retry-After": str(retry_after)})
+        _bcrypt_pending += 1
+
+    submitted = time.monotonic()
+
+    def task():
+        #sorban töltött idő és a hash ideje
+        started = time.monotonic()
+        try:
+            return func(*args)
+        finally:
+            _record_bcrypt(started - submitted, time.monotonic() - started)
+
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_bcrypt_executor(), task)
+    finally:
+        with _bcrypt_lock:
+            _bcrypt_pending -= 1
+
+def bcrypt_stats() -> dict:
+    with _bcrypt_lock:
+        return {
+            **bcrypt_metrics,
+            'pending': _bcrypt_pending,
+            'concurrency': BCRYPT_CONCURRENCY,
+            'queue_depth': BCRYPT_QUEUE_DEPTH,
+        }
 
-        print(f"{len(deleted)} fájl sikeresen törölve")
 
 
 #######
 ########## USER FUNCTIONS
 ####
 
-def is_email_taken(supabase: Client, email: EmailStr, user_id: int) -> bool:
+async def is_email_taken(db: AsyncRepository, email: EmailStr, user_id: int) -> bool:
     #email keresése az adatbázisban, a felhasználó kizárásával
-    response = supabase.table("user").select("id").eq("email", email).neq("id", user_id).execute()
-    return len(response.data) > 0 
-
-def is_filename_taken(supabase: Client, filename: str, user_id: int) -> bool:
-    response = (
-        supabase
-        .table("files")
-        .select("id")
-        .eq("filename", filename)
-        .eq("user_id", user_id)
-        .execute()
-    )
-    return len(response.data) > 0
+    return await db.email_exists(email, user_id)
 
-def get_user_by_id(supabase: Client, user_id: str):
+async def get_user_by_id(db: AsyncRepository, user_id: str):
     try:
-        response = supabase.table("user").select("*").eq("id", user_id).execute()
-        users = response.data
+        user = await db.get_user(user_id)
     except:
         raise HTTPException(status_code=500, detail=f"Database error")
 
-    #nincs user az adott id-vel, vagy több is van
-    if not users or len(users)>1:
+    #nincs user az adott id-vel
+    if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    return users[0]
+    return user
+
+async def get_files_version(db: AsyncRepository, user_id: str) -> int:
+    try:
+        files_version = await db.get_files_version(user_id)
+    except:
+        raise HTTPException(status_code=500, detail=f"Database error")
+
+    #nincs user az adott id-vel
+    if files_version is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    return files_version
+
+async def get_user_with_files(db: AsyncRepository, user_id: str, filenames: List[str]) -> Tuple[dict, List[dict]]:
+    #user és a megadott nevű fájljai egy lekérdezésben
+    try:
+        user, files = await db.get_user_with_files(user_id, filenames)
+    except:
+        raise HTTPException(status_code=500, detail=f"Database error")
+
+    #nincs user az adott id-vel
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    return user, files
+
+async def check_secret_key(db: AsyncRepository, user: dict, key_hex: str) -> bool:
+    #titkos kulcs ellenőrzése (régi bcrypt hash esetén lassú, ezért a CPU pool-on)
+    if not await run_cpu(verify_secret_key, key_hex, user.get('secret_key_hash')):
+        return False
+
+    #régi bcrypt hash cseréje gyors key-check value-ra az első sikeres ellenőrzéskor (az írás az IO pool-on)
+    if secret_key_needs_upgrade(user['secret_key_hash']):
+        secret_key_hash = hash_secret_key(key_hex)
+        try:
+            await db.update_user(user['id'], {"secret_key_hash": secret_key_hash})
+            user['secret_key_hash'] = secret_key_hash
+        except Exception as e:
+            print(f"Nem sikerült frissíteni a kulcs hash-t: {e}")
+
+    return True
+
+async def resolve_secret_key(db: AsyncRepository, user: dict, key_hex: str, session_token: str) -> Tuple[str, bool]:
+    #feloldott kulcs a session-höz: nincs szükség újabb ellenőrzésre
+    unlocked_key_hex = key_vault.get(session_token, user['id'], user['key_epoch'])
+    if unlocked_key_hex and (not key_hex or key_hex == unlocked_key_hex):
+        return unlocked_key_hex, True
+
+    #nem adott meg kulcsot
+    if not key_hex:
+        return "", False
+
+    #megadott kulcs ellenőrzése
+    return key_hex, await check_secret_key(db, user, key_hex)
 
-def get_user_by_email(supabase: Client, email: EmailStr):
+async def get_user_by_email(db: AsyncRepository, email: EmailStr):
     try:
-        response = supabase.table("user").select("*").eq("email", email).execute()
-        users = response.data
+        user = await db.get_user_by_email(email)
     except:
         raise HTTPException(status_code=500, detail=f"Database error")
 
-    #nincs user az adott email-lel, vagy több is van
-    if not users or len(users)>1:
+    #nincs user az adott email-lel
+    if not user:
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
-    return users[0]
+    return user
+
+
+
+#######
+########## FILE LISTING
+####
+
+FILES_PAGE_SIZE = 500       # lapméret (alapértelmezett, és a teljes lista folyamos lekérésénél)
+FILES_MAX_PAGE_SIZE = 1000
+FILE_DEFAULT_FIELDS = ['id', 'filename', 'encrypted', 'created_at'] # amit a UI használ
+
+def parse_file_fields(fields: Optional[str]) -> List[str]:
+    #kért oszlopok (vesszővel elválasztva), csak a listázható oszlopok közül
+    if not fields:
+        return list(FILE_DEFAULT_FIELDS)
+    requested = list(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+    if not requested or any(field not in FILE_LIST_COLUMNS for field in requested):
+        raise HTTPException(status_code=400, detail="Invalid fields")
+    return requested
+
+def encode_cursor(sort: str, descending: bool, row: dict) -> str:
+    #átlátszatlan kurzor: rendezés + az utolsó sor (rendezési érték, id) párja
+    raw = json.dumps([sort, descending, row[sort], row['id']]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, sort: str, descending: bool) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, cursor_descending, value, file_id = json.loads(raw)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    #a kurzor csak ugyanazzal a rendezéssel használható
+    if cursor_sort != sort or cursor_descending != descending or not isinstance(file_id, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return value, file_id
+
+def file_page_columns(fields: List[str], sort: str) -> List[str]:
+    #a kurzorhoz az id és a rendezési oszlop mindig kell
+    return list(dict.fromkeys(fields + ['id', sort]))
+
+async def list_files_page(db: AsyncRepository, user_id: int, fields: List[str], sort: str, descending: bool, after: Optional[tuple], limit: int) -> Tuple[List[dict], Optional[str]]:
+    #egy oldal és a következő oldal kurzora (eggyel több sor lekérésével derül ki, van-e még)
+    try:
+        rows = await db.list_files_page(user_id, file_page_columns(fields, sort), sort, descending, after, limit + 1)
+    except:
+        raise HTTPException(status_code=500, detail=f"Database error")
+    next_cursor = encode_cursor(sort, descending, rows[limit - 1]) if len(rows) > limit else None
+    return [{field: row[field] for field in fields} for row in rows[:limit]], next_cursor
+
+async def iterate_files(db: AsyncRepository, user_id: int, fields: List[str], sort: str, descending: bool, first_page: List[dict], next_cursor: Optional[str]) -> AsyncIterator[dict]:
+    #teljes lista oldalanként, a memóriában egyszerre csak egy oldal van
+    for row in first_page:
+        yield row
+    while next_cursor:
+        page, next_cursor = await list_files_page(db, user_id, fields, sort, descending, decode_cursor(next_cursor, sort, descending), FILES_PAGE_SIZE)
+        for row in page:
+            yield row
+
+async def files_json_array(rows: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    yield b"["
+    first = True
+    async for row in rows:
+        yield (b"" if first else b",") + json.dumps(row).encode("utf-8")
+        first = False
+    yield b"]"
+
+async def files_ndjson(rows: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    async for row in rows:
+        yield json.dumps(row).encode("utf-8") + b"\n"
+
+
+
+#######
+########## CONDITIONAL REQUESTS
+####
+
+def files_etag(user_id: int, files_version: int, *params) -> str:
+    #fájl lista: a user fájl listájának verziója + a lekérdezés paraméterei (más oldal, oszlopok, formátum más ETag)
+    params_hash = hashlib.sha256(json.dumps(params).encode("utf-8")).hexdigest()[:16]
+    return f'W/"{user_id}-{files_version}-{params_hash}"'
+
+def content_etag(file: dict) -> Optional[str]:
+    #titkosítatlan fájl: a feltöltéskor számolt tartalom hash (régi soroknál nincs)
+    return f'"{file["content_hash"]}"' if file.get('content_hash') else None
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    #If-None-Match: gyenge összehasonlítás, vesszővel elválasztott lista vagy *
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+
+
+#######
+########## DOWNLOAD
+####
+
+def download_headers(filename: str, size: int) -> dict:
+    #ugyanaz a Content-Disposition formátum, amit a FileResponse is használ
+    quoted_filename = quote(filename)
+    if quoted_filename != filename:
+        content_disposition = f"attachment; filename*=utf-8''{quoted_filename}"
+    else:
+        content_disposition = f'attachment; filename="{filename}"'
+
+    return {
+        "Content-Disposition": content_disposition,
+        "Content-Length": str(size),
+    }
+
+def guess_media_type(filename: str) -> str:
+    return mimetypes.guess_type(filename)[0] or "text/plain"
+
+def blob_size(input_file: BinaryIO) -> int:
+    #a megnyitott fájl mérete (helyi fájl és objektumtárból olvasó fájl esetén is), a fájlmutató marad
+    position = input_file.tell()
+    size = input_file.seek(0, os.SEEK_END)
+    input_file.seek(position)
+    return size
+
+def read_blob_range(input_file: BinaryIO, start: int, end: int) -> Iterator[bytes]:
+    #a [start, end] (zárt) bájttartomány blokkonként, a végén a fájl lezárul
+    with input_file:
+        input_file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = input_file.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def parse_range_header(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    #csak egyetlen "bytes=start-end", "bytes=start-" vagy "bytes=-suffix" tartomány támogatott,
+    #minden más esetben (nincs header, hibás vagy több tartomány) a teljes fájl kerül visszaadásra
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+
+    start_text, separator, end_text = range_header[len("bytes="):].strip().partition("-")
+    if not separator or not (start_text or end_text):
+        return None
+    if (start_text and not start_text.isdigit()) or (end_text and not end_text.isdigit()):
+        return None
+
+    #utolsó N bájt
+    if not start_text:
+        suffix = int(end_text)
+        if suffix == 0 or size == 0:
+            raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+        return max(size - suffix, 0), size - 1
+
+    #fordított tartomány (pl. bytes=5-2): érvénytelen, figyelmen kívül marad (RFC 9110)
+    start = int(start_text)
+    if end_text and int(end_text) < start:
+        return None
+
+    #416 csak akkor, ha a tartomány a fájl vége után kezdődik
+    if start >= size:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    end = min(int(end_text), size - 1) if end_text else size - 1
+
+    return start, end
 
 
 
@@ -107,143 +616,603 @@ def get_user_by_email(supabase: Client, email: EmailStr):
 ########## FILE ENCRYPTION-DECRYPTION
 ####
 
-def encrypt_file(file_content: bytes, output_path: Path, key_hex: str, algo: str):
-    #kulcs átalakítása
-    key_bytes = bytes.fromhex(key_hex)
+def encrypt_chunks(input_file: BinaryIO, key_hex: str, algo: str) -> Iterator[bytes]:
+    #egyéb algoritmus
+    if algo not in ("AES-256", "ChaCha20"):
+        raise ValueError(f"Unsupported algorithm: {algo}")
 
-    #output létrehozása, ha nincs
-    output_path.parent.mkdir(parents=True, exist_ok=True)
+    #AES-256 és ChaCha20: szegmentált konténer, szegmensenként olvas és titkosít
+    return container_encrypt_chunks(input_file, bytes.fromhex(key_hex), algo)
 
-    #AES-256
-    if algo == "AES-256":
-        print('aes')
-        #fájl titkosítása és mentése az output_path-ra
-        try:
-            input_file = BytesIO(file_content)
-            encrypted_file = aes_encrypt_file(input_file, key_bytes)
-            with output_path.open("wb") as f:
-                shutil.copyfileobj(encrypted_file, f)
-        except Exception as e:
-            raise RuntimeError(f"encrypt_file: {e}")
+def _next_batch(chunks: Iterator[bytes], size: int) -> bytes:
+    #a következő blokkok összefűzve, legalább size bájtig (a végén b"")
+    batch = bytearray()
+    for chunk in chunks:
+        batch += chunk
+        if len(batch) >= size:
+            break
+    return bytes(batch)
 
-    #ChaCha20
-    elif algo == "ChaCha20":
-        print('chacha')
-        #fájl titkosítása és mentése az output_path-ra
-        try:
-            encrypted_file = chacha20_encrypt_file(BytesIO(file_content), key_bytes)
-            with output_path.open("wb") as output_file:
-                output_file.write(encrypted_file.read())
-        except Exception as e:
+def encrypt_file(input_file: BinaryIO, store: BlobStore, user_id: int, file_uuid: str, key_hex: str, algo: str):
+    #fájl titkosítása és mentése a tárolóba (hiba esetén a félig kiírt fájlt a tároló törli)
+    try:
+        chunks = encrypt_chunks(input_file, key_hex, algo)
+        with store.open_write(user_id, file_uuid) as output_file:
+            for chunk in chunks:
+                output_file.write(chunk)
+    except Exception as e:
+        raise RuntimeError(f"encrypt_file: {e}")
+
+    #log
+    print(f"{user_id}/{file_uuid} encrypt sikeres.")
+
+async def encrypt_upload(input_file: BinaryIO, store: BlobStore, user_id: int, file_uuid: str, key_hex: str, algo: str):
+    #mint az encrypt_file, de a titkosítás (AEAD) a CPU pool-on, a tárolóba írás (objektumtárnál a részek
+    #feltöltése és a lezárás) az IO pool-on fut, így a CPU szálak nem várnak a hálózatra
+    try:
+        chunks = encrypt_chunks(input_file, key_hex, algo)
+    except Exception as e:
+        raise RuntimeError(f"encrypt_file: {e}")
+    writer = store.open_write(user_id, file_uuid)
+    output_file = await run_io(writer.__enter__)
+    try:
+        while batch := await run_cpu(_next_batch, chunks, STREAM_CHUNK_SIZE):
+            await run_io(output_file.write, batch)
+    except BaseException as e:
+        #a félig kiírt fájlt a tároló törli
+        await run_io(writer.__exit__, type(e), e, e.__traceback__)
+        if isinstance(e, Exception):
             raise RuntimeError(f"encrypt_file: {e}")
-    
+        raise
+    await run_io(writer.__exit__, None, None, None)
+
+    #log
+    print(f"{user_id}/{file_uuid} encrypt sikeres.")
+
+def decrypt_file_stream(input_file: BinaryIO, key_hex: str, algo: str) -> Iterator[bytes]:
     #egyéb algoritmus
-    else:
+    if algo not in ("AES-256", "ChaCha20"):
         raise ValueError(f"Unsupported algorithm: {algo}")
 
-    #log
-    print(f"{output_path} encrypt sikeres.")
+    #kulcs átalakítása (a hibás kulcs még a válasz elküldése előtt kiderül)
+    key_bytes = bytes.fromhex(key_hex)
 
-def encrypt_user_files(user_id: str, key: str, files_to_encrypt: list, algo: str, from_dir:Path, to_dir:Path):
-    #user mappájának ellenőrzése, létrehozása ha nincs
-    user_upload_dir = Path(to_dir) / str(user_id)
-    user_upload_dir.mkdir(parents=True, exist_ok=True)
+    #a megnyitott fájl a visszafejtés végén bezárul (közben törölt/cserélt fájl is végigolvasható)
+    def generate():
+        with input_file:
+            #AES-256 (szegmentált konténer vagy régi, egyben titkosított fájl)
+            if algo == "AES-256":
+                yield from aes_decrypt_stream(input_file, key_bytes)
 
-    #fájlok feldolgozása
-    for file in files_to_encrypt:
-        #fájlnév és útvonalak meghatározása
-        filename = file['uuid']
-        input_path = from_dir / filename
-        output_path = user_upload_dir / filename
+            #ChaCha20 (szegmentált konténer vagy régi, egyben titkosított fájl)
+            elif algo == "ChaCha20":
+                yield from chacha20_decrypt_stream(input_file, key_bytes)
 
-        #fájl létezésének ellenőrzése
-        if not input_path.exists():
-            raise RuntimeError(f"Fájl nem található: {input_path}")
+    return generate()
 
-        #titkosítás
-        try:
-            with input_path.open("rb") as f:
-                file_content = f.read()
-            encrypt_file(file_content, output_path, key, algo)
-            print(f"Sikeresen titkosítva: {filename}")
-        except Exception as e:
-            raise RuntimeError(f"Hiba a {input_path} titkosításakor: {e}")
-        finally:
-            #átmeneti fájl törlése
-            if input_path.exists():
-                input_path.unlink()
-                print(f"Átmeneti fájl törölve: {input_path}")
+def decrypt_file_range(input_file: BinaryIO, key_hex: str, header: dict, start: int, end: int) -> Iterator[bytes]:
+    #kulcs átalakítása (a hibás kulcs még a válasz elküldése előtt kiderül)
+    key_bytes = bytes.fromhex(key_hex)
+    encrypted_size = blob_size(input_file)
 
-    # log
-    print(f"Minden fájl titkosítva ide: {user_upload_dir}")
+    #csak a tartományt lefedő szegmensek kerülnek beolvasásra és visszafejtésre
+    #(a fájlmutató már most az első szegmensre áll, így az előre letöltés is onnan indul)
+    input_file.seek(container_segment_offset(header["segment_size"], start // header["segment_size"]))
+    def generate():
+        with input_file:
+            yield from container_decrypt_range(input_file, key_bytes, header, encrypted_size, start, end)
 
-def decrypt_file(input_path: Path, output_path: Path, key_hex: str, algo: str):
-    #fájl létezésének ellenőrzése
-    if not input_path.exists():
-        print('a')
-        raise FileNotFoundError(f"{input_path} can't be found")
+    return generate()
 
-    #fájl megnyitása az input_path-ról 
-    with input_path.open("rb") as f:
-        file_content = f.read()
+def read_file_header(input_file: BinaryIO) -> Optional[dict]:
+    #szegmentált konténer header-e, régi formátum esetén None (a fájlmutató az elejére áll vissza)
+    header = read_container_header(input_file)
+    input_file.seek(0)
+    return header
 
-    #output létrehozása, ha nincs
-    output_path.parent.mkdir(parents=True, exist_ok=True)
+def decrypt_read_ahead(input_file: BinaryIO, header: Optional[dict]) -> int:
+    #egy visszafejtési lépés által legfeljebb olvasott bájtok (header és két szegmens, egy előre olvasva);
+    #régi, egyben titkosított fájlnál a teljes fájl
+    if header is None:
+        return blob_size(input_file)
+    return CONTAINER_HEADER.size + 2 * (header["segment_size"] + TAG_SIZE)
 
-    #kulcs átalakítása
-    key_bytes = bytes.fromhex(key_hex)
+def decrypted_size(input_file: BinaryIO, header: Optional[dict]) -> int:
+    encrypted_size = blob_size(input_file)
 
-    #AES-256
-    if algo == "AES-256":
-        print("aes")
-        #fájl visszafejtése és mentése az output_path-ra
-        try:
-            decrypted_file = aes_decrypt_file(BytesIO(file_content), key_bytes)
-            with output_path.open("wb") as decrypted_f:
-                decrypted_f.write(decrypted_file.read())
-        except Exception as e:
-            raise RuntimeError(f"encrypt_file: {e}")
-    
-    #ChaCha20
-    elif algo == "ChaCha20":
-        print("chacha")
-        #fájl visszafejtése és mentése az output_path-ra
-        try:
-            decrypted_file = chacha20_decrypt_file(BytesIO(file_content), key_bytes)
-            with output_path.open("wb") as output_file:
-                output_file.write(decrypted_file.read())
-        except Exception as e:
-            raise RuntimeError(f"encrypt_file: {e}")
-    
-    #egyéb algoritmus
+    #szegmentált konténer: a header-ben lévő szegmensméretből számolható
+    if header is not None:
+        return container_plaintext_size(encrypted_size, header["segment_size"])
+
+    #AES-256: 12 bájt iv + 16 bájt tag, régi ChaCha20: 12 bájt nonce + 16 bájt tag
+    return encrypted_size - 28
+
+def save_upload(input_file: BinaryIO, store: BlobStore, user_id: int, file_uuid: str) -> str:
+    #titkosítatlan fájl mentése blokkonként, közben a tartalom hash-e (a letöltés ETag-je)
+    content_hash = hashlib.sha256()
+    with store.open_write(user_id, file_uuid) as f:
+        while chunk := input_file.read(STREAM_CHUNK_SIZE):
+            content_hash.update(chunk)
+            f.write(chunk)
+    return content_hash.hexdigest()
+
+
+
+#######
+########## DATA KEYS
+####
+
+def new_data_key(key_hex: str, algo: str, file_uuid: str) -> Tuple[str, str]:
+    #véletlen adatkulcs a fájl tartalmához, a felhasználó kulcsával becsomagolva (ez kerül az adatbázisba)
+    data_key = generate_key()
+    wrapped_key = wrap_data_key(data_key, bytes.fromhex(key_hex), algo, file_uuid)
+    return data_key.hex(), wrapped_key
+
+def file_key_hex(file: dict, key_hex: str) -> str:
+    #envelope fájl: a tartalom a saját adatkulcsával van titkosítva
+    if file.get('wrapped_key'):
+        return unwrap_data_key(file['wrapped_key'], bytes.fromhex(key_hex), file['uuid']).hex()
+
+    #régi fájl: a tartalom közvetlenül a felhasználó kulcsával van titkosítva
+    return key_hex
+
+def rewrap_file_keys(files: list, old_key_hex: str, new_key_hex: str, new_algo: str) -> list:
+    #csak a 32 bájtos adatkulcsok kerülnek újracsomagolásra, a fájlok tartalma változatlan marad
+    old_key = bytes.fromhex(old_key_hex)
+    new_key = bytes.fromhex(new_key_hex)
+    rewrapped = []
+    for file in files:
+        data_key = unwrap_data_key(file['wrapped_key'], old_key, file['uuid'])
+        rewrapped.append({**file, 'wrapped_key': wrap_data_key(data_key, new_key, new_algo, file['uuid'])})
+    return rewrapped
+
+def file_algo(file: dict, user: dict) -> str:
+    #a fájl saját algoritmusa, régi soroknál (algo nélkül) a felhasználóé
+    return file.get('algo') or user['algo']
+
+
+
+#######
+########## RE-ENCRYPTION
+####
+
+_reencrypt_pool: Optional[ProcessPoolExecutor] = None
+
+def _lower_priority():
+    #az újratitkosítás háttérmunka, a kéréseket kiszolgáló processzek elől nem vehet el CPU-t
+    try:
+        os.nice(10)
+    except OSError:
+        pass
+
+def get_reencrypt_pool(max_workers: int) -> ProcessPoolExecutor:
+    #a process pool csak az első használatkor jön létre, utána újrahasznosítható
+    #(egyszerre indított jobok ne hozzanak létre két pool-t)
+    global _reencrypt_pool
+    with _executors_lock:
+        if _reencrypt_pool is None:
+            _reencrypt_pool = ProcessPoolExecutor(max_workers=max_workers, initializer=_lower_priority)
+        return _reencrypt_pool
+
+def shutdown_reencrypt_pool():
+    #a leállás a worker processzekre vár, ezért a záron kívül
+    global _reencrypt_pool
+    with _executors_lock:
+        pool, _reencrypt_pool = _reencrypt_pool, None
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+
+class ChunkReader:
+    #visszafejtett blokkok iterátorát fájlszerű (read(size)) objektumként adja tovább a titkosításnak
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = chunks
+        self._buffer = bytearray()
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+def reencrypt_file(store: BlobStore, user_id: int, input_uuid: str, output_uuid: str, old_key_hex: str, old_algo: str, new_key_hex: str, new_algo: str) -> int:
+    #régi titkosított fájl -> új titkosított fájl, átmeneti nyílt szöveges fájl nélkül
+    input_file = store.open_read(user_id, input_uuid)
+    size = blob_size(input_file)
+    decrypted_chunks = decrypt_file_stream(input_file, old_key_hex, old_algo)
+    encrypt_file(ChunkReader(decrypted_chunks), store, user_id, output_uuid, new_key_hex, new_algo)
+    return size
+
+def plan_conversion(file: dict, key_hex: str, key_epoch: int, new_algo: str) -> dict:
+    #a fájl új néven, új adatkulccsal és az új algoritmussal (envelope formátumban) készül el
+    #(az adatkulcs a key_epoch-hoz tartozó kulccsal van becsomagolva: kulcscsere után a sor már nem írható vele)
+    new_uuid = f"{uuid.uuid4()}{Path(file['uuid']).suffix}"
+    data_key_hex, wrapped_key = new_data_key(key_hex, new_algo, new_uuid)
+    return {
+        'old_key_hex': file_key_hex(file, key_hex),
+        'old_algo': file['algo'],
+        'new_uuid': new_uuid,
+        'new_key_hex': data_key_hex,
+        'new_algo': new_algo,
+        'wrapped_key': wrapped_key,
+        'key_epoch': key_epoch,
+    }
+
+def finish_conversion(store: BlobStore, user_id: int, file: dict, plan: dict, on_file_converted: Callable[[int, str, dict], bool]):
+    #az adatbázis sor átállítása az egyetlen atomikus lépés (csak akkor sikerül, ha a sor még a régi fájlra mutat),
+    #utána a régi fájl törölhető; a két lépés között leálló szerver legfeljebb egy árva fájlt hagy
+    try:
+        converted = on_file_converted(user_id, file['uuid'], plan)
+    except Exception:
+        store.delete(user_id, plan['new_uuid'])
+        raise
+
+    #közben törölt, vagy már máshol átalakított fájl: az új fájl felesleges
+    #a régi fájl ott törlődik, ahol éppen van (közben áthelyezhette a tárolási elrendezés migrációja)
+    if not converted:
+        store.delete(user_id, plan['new_uuid'])
     else:
-        print('b')
-        raise ValueError(f"Unsupported algorithm: {algo}")
+        store.delete(user_id, file['uuid'])
+    return converted
+
+def migrate_file(store: BlobStore, user_id: int, file: dict, key_hex: str, key_epoch: int, new_algo: str, on_file_converted: Callable[[int, str, dict], bool]):
+    #egyetlen fájl lusta átalakítása (pl. letöltés után háttérben), hiba esetén a régi fájl marad
+    plan = None
+    try:
+        plan = plan_conversion(file, key_hex, key_epoch, new_algo)
+        reencrypt_file(store, user_id, file['uuid'], plan['new_uuid'], plan['old_key_hex'], plan['old_algo'], plan['new_key_hex'], new_algo)
+        if finish_conversion(store, user_id, file, plan, on_file_converted):
+            print(f"Átalakítva: {file['uuid']} ({plan['old_algo']} → {new_algo})")
+    except Exception as e:
+        if plan is not None:
+            store.delete(user_id, plan['new_uuid'])
+        print(f"Nem sikerült átalakítani: {user_id}/{file['uuid']} – {e}")
 
-    #log
-    print(f"{input_path} → {output_path} decrypt sikeres.")
 
-def decrypt_user_files(user_id: str, key: str, encrypted_files: list, algo: str, from_dir:Path, to_dir:Path):
-    # átmeneti mappa ellenőrzése, ha kell létrehozása
-    to_dir.mkdir(parents=True, exist_ok=True)
 
-    # fájlok feldolgozása
-    for file in encrypted_files:
-        # fájlnév és útvonalak meghatározása
-        filename = file['uuid']
-        input_path = Path(from_dir / str(user_id) / filename)
-        output_path = Path(to_dir / filename)
+#######
+########## BACKGROUND JOBS
+####
 
-        # fájl létezésének ellenőrzése
-        if not input_path.exists():
-            raise RuntimeError(f"Fájl nem található: {input_path}")
+JOBS_DIR = Path("jobs")
+JOB_RETENTION = 24 * 3600   # mp, a befejezett job állapota eddig kérdezhető le, utána a karbantartás törli
+JOB_FINISHED = ("done", "cancelled", "failed")
+_jobs: dict = {}    # a jelen processzben futó jobok (job_id -> job)
+_job_locks: dict = {}   # a jelen processzben futó jobok zárolt lock fájljai (job_id -> fájl)
+_jobs_lock = threading.Lock()
 
-        # visszafejtés
+#a job fájljai userenként (jobs/<user_id>/):
+#   <job_id>.json   az állapot a listák nélkül (kicsi, csak állapotváltáskor íródik újra)
+#   <job_id>.files  az átalakítandó fájlok listája (egyszer, induláskor íródik)
+#   <job_id>.done   a kész fájlok, fájlonként egy hozzáfűzött sor ("uuid méret")
+#   <job_id>.lock   amíg a job fut, a futtató processz zárolja (flock); a processz leállásakor a zár feloldódik
+#befejezéskor a lista és a napló törlődik (a becsomagolt kulcsok sem maradnak a lemezen)
+def _job_path(user_id: int, job_id: str, jobs_dir: Path, suffix: str = ".json") -> Path:
+    #csak egész user id és uuid formátumú azonosító fogadható el (útvonal manipuláció ellen)
+    return Path(jobs_dir) / str(int(user_id)) / f"{uuid.UUID(job_id)}{suffix}"
+
+def _write_atomic(path: Path, text: str):
+    #átmeneti fájlon keresztül: olvasáskor mindig egy teljes változat látszik
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_text(text)
+    os.replace(tmp_path, path)
+
+def _save_job(job: dict, jobs_dir: Path):
+    #checkpoint: csak az állapot, a zár csak a másolás idejére (a job_progress olvasók nem várnak az írásra)
+    with _jobs_lock:
+        state = {key: value for key, value in job.items() if key not in ('files', 'done')}
+    _write_atomic(_job_path(job['user_id'], job['id'], jobs_dir), json.dumps(state))
+
+def _append_job_done(job: dict, file: dict, jobs_dir: Path):
+    with _job_path(job['user_id'], job['id'], jobs_dir, ".done").open("a") as f:
+        f.write(f"{file['uuid']} {file['size']}\n")
+
+def _read_job_done(user_id: int, job_id: str, jobs_dir: Path) -> dict:
+    #kész fájlok (uuid -> méret) a naplóból; a leállításkor félbemaradt utolsó sor kimarad
+    done = {}
+    try:
+        with _job_path(user_id, job_id, jobs_dir, ".done").open() as f:
+            for line in f:
+                file_uuid, _, size = line.strip().partition(" ")
+                if size.isdigit():
+                    done[file_uuid] = int(size)
+    except FileNotFoundError:
+        pass
+    return done
+
+def _remove_job_files(user_id: int, job_id: str, jobs_dir: Path, suffixes: Tuple[str, ...] = (".files", ".done", ".lock")):
+    for suffix in suffixes:
+        _job_path(user_id, job_id, jobs_dir, suffix).unlink(missing_ok=True)
+
+def _read_job_state(path: Path) -> Optional[dict]:
+    try:
+        return json.loads(path.read_text())
+    except (ValueError, OSError):
+        return None
+
+def load_job(user_id: int, job_id: str, jobs_dir: Path = JOBS_DIR) -> Optional[dict]:
+    #futó job a memóriából, egyébként a legutóbbi checkpoint a lemezről, a haladás a kész fájlok naplójából
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is not None and job['user_id'] == user_id:
+            return {key: value for key, value in job.items() if key not in ('files', 'done')}
+    try:
+        job = _read_job_state(_job_path(user_id, job_id, jobs_dir))
+    except ValueError:
+        return None
+    if job and job['status'] not in JOB_FINISHED:
+        done = _read_job_done(user_id, job_id, jobs_dir)
+        job['files_done'] = len(done)
+        job['bytes_done'] = sum(done.values())
+    return job
+
+def find_unfinished_job(user_id: int, jobs_dir: Path = JOBS_DIR) -> Optional[dict]:
+    #csak a user saját job-jai között (a befejezetteket a karbantartás törli, így ez néhány kis fájl)
+    #a leállt processz "running" jobja (amit a karbantartás még nem szüneteltetett) "paused"-ként látszik
+    user_dir = Path(jobs_dir) / str(int(user_id))
+    if not user_dir.exists():
+        return None
+    for path in user_dir.glob("*.json"):
+        job = _read_job_state(path)
+        if job and job['status'] in ("running", "paused"):
+            if job['status'] == "running" and not _job_running(job['user_id'], job['id'], jobs_dir):
+                job['status'] = "paused"
+            return job
+    return None
+
+def _lock_job(user_id: int, job_id: str, jobs_dir: Path):
+    #a job lock fájljának zárolása a futás idejére (a zárat a processz leállásakor a kernel oldja fel,
+    #így a pid újrahasznosítása nem tarthat egy leállt jobot "running" állapotban)
+    try:
+        import fcntl
+    except ImportError:
+        #flock nélküli platform (Windows): a futó jobokat csak a _jobs tartja nyilván
+        return None
+    path = _job_path(user_id, job_id, jobs_dir, ".lock")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lock_file = path.open("a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        raise RuntimeError("Job is already running")
+    return lock_file
+
+def _job_running(user_id: int, job_id: str, jobs_dir: Path) -> bool:
+    #fut-e a job valamelyik processzben: a lock fájlja zárolt-e (a jelen processz saját jobjára is helyes)
+    try:
+        import fcntl
+    except ImportError:
+        with _jobs_lock:
+            return job_id in _jobs
+    try:
+        lock_file = _job_path(user_id, job_id, jobs_dir, ".lock").open("rb")
+    except FileNotFoundError:
+        return False
+    with lock_file:
         try:
-            decrypt_file(input_path, output_path, key, algo)
-            print(f"Sikeresen kititkosítva: {filename}")
-        except Exception as e:
-            raise RuntimeError(f"Hiba az {input_path} kititkosításakor: {e}")
+            fcntl.flock(lock_file, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except OSError:
+            return True
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return False
+
+def pause_interrupted_jobs(jobs_dir: Path = JOBS_DIR):
+    #újraindítás után a leállt processz "running" jobjai "paused" állapotba kerülnek:
+    #a titkos kulcs nincs elmentve, ezért a folytatáshoz a felhasználónak újra el kell indítania a váltást
+    if not Path(jobs_dir).exists():
+        return
+    for path in Path(jobs_dir).glob("*/*.json"):
+        job = _read_job_state(path)
+        if job and job['status'] == "running" and not _job_running(job['user_id'], job['id'], jobs_dir):
+            job = load_job(job['user_id'], job['id'], jobs_dir)
+            job['status'] = "paused"
+            _save_job(job, jobs_dir)
+            print(f"Félbeszakadt job: {job['id']} ({job['files_done']}/{job['files_total']} fájl kész)")
+
+def prune_finished_jobs(jobs_dir: Path = JOBS_DIR, retention: float = JOB_RETENTION):
+    #befejezett jobok törlése a megőrzési idő után (a korábbi, nem userenkénti elrendezés fájljaival együtt)
+    if not Path(jobs_dir).exists():
+        return
+    now = time.time()
+    for path in [*Path(jobs_dir).glob("*/*.json"), *Path(jobs_dir).glob("*.json")]:
+        job = _read_job_state(path)
+        if job is None or now - job.get('updated_at', 0) < retention:
+            continue
+        legacy = path.parent == Path(jobs_dir)
+        if not legacy and job['status'] not in JOB_FINISHED:
+            continue
+        path.unlink(missing_ok=True)
+        if not legacy:
+            _remove_job_files(job['user_id'], job['id'], jobs_dir)
+            try:
+                path.parent.rmdir()
+            except OSError:
+                pass
+
+def cancel_job(job: dict, jobs_dir: Path = JOBS_DIR) -> bool:
+    #a jelen processzben futó job a saját szálán áll le, a többi csak a checkpointban kerül visszavonásra
+    with _jobs_lock:
+        running_job = _jobs.get(job['id'])
+        if running_job is not None:
+            running_job['status'] = "cancelled"
+            return True
+    if job['status'] == "running":
+        return False
+
+    job['status'] = "cancelled"
+    job['updated_at'] = time.time()
+    _save_job(job, jobs_dir)
+    _remove_job_files(job['user_id'], job['id'], jobs_dir)
+    return True
+
+def job_progress(job: dict) -> dict:
+    #becsült hátralévő idő az aktuális futás átlagos sebességéből
+    eta = None
+    run_bytes = job['bytes_done'] - job['run_bytes_start']
+    elapsed = time.time() - job['run_started_at']
+    if job['status'] == "running" and run_bytes > 0 and elapsed > 0:
+        eta = round((job['bytes_total'] - job['bytes_done']) / (run_bytes / elapsed), 1)
+    elif job['status'] == "done":
+        eta = 0
+
+    return {
+        'id': job['id'],
+        'type': job['type'],
+        'status': job['status'],
+        'old_algo': job['old_algo'],
+        'new_algo': job['new_algo'],
+        'files_total': job['files_total'],
+        'files_done': job['files_done'],
+        'bytes_total': job['bytes_total'],
+        'bytes_done': job['bytes_done'],
+        'eta_seconds': eta,
+        'error': job['error'],
+    }
+
+def start_switch_algo_job(user_id: int, key_hex: str, key_epoch: int, encrypted_files: list, old_algo: str, new_algo: str, store: BlobStore, max_workers: int, on_file_converted: Callable[[int, str, dict], bool], job: Optional[dict] = None, jobs_dir: Path = JOBS_DIR) -> dict:
+    #új job, vagy egy félbeszakadt job folytatása (job: a checkpoint; a már kész fájlok kimaradnak, az encrypted_files nem számít)
+    if job is None:
+        files = []
+        for file in encrypted_files:
+            files.append({
+                'uuid': file['uuid'],
+                'algo': file['algo'],
+                'wrapped_key': file.get('wrapped_key'),
+                'size': store.size(user_id, file['uuid']) or 0,
+            })
+
+        job = {
+            'id': str(uuid.uuid4()),
+            'type': "switch-algo",
+            'user_id': user_id,
+            'old_algo': old_algo,
+            'new_algo': new_algo,
+            'key_epoch': key_epoch,
+            'files': files,
+            'done': [],
+            'files_total': len(files),
+            'files_done': 0,
+            'bytes_total': sum(file['size'] for file in files),
+            'bytes_done': 0,
+            'created_at': time.time(),
+            'error': None,
+        }
+        _write_atomic(_job_path(user_id, job['id'], jobs_dir, ".files"), json.dumps(files))
+
+    #félbeszakadt job a checkpointból: a fájl lista és a kész fájlok naplója (a kulcs az újra megadott kulcs)
+    else:
+        job['key_epoch'] = key_epoch
+        done = _read_job_done(job['user_id'], job['id'], jobs_dir)
+        job['files'] = json.loads(_job_path(job['user_id'], job['id'], jobs_dir, ".files").read_text())
+        job['done'] = list(done)
+        job['files_done'] = len(done)
+        job['bytes_done'] = sum(done.values())
+
+    #a futás idejére zárolt lock fájl jelzi a többi processznek, hogy a job fut
+    lock_file = _lock_job(user_id, job['id'], jobs_dir)
+    job['status'] = "running"
+    job['run_started_at'] = time.time()
+    job['run_bytes_start'] = job['bytes_done']
+    job['updated_at'] = time.time()
+
+    with _jobs_lock:
+        _jobs[job['id']] = job
+        _job_locks[job['id']] = lock_file
+    _save_job(job, jobs_dir)
+
+    #a job külön szálon fut, a fájlokat a process pool titkosítja újra, így az event loop szabad marad
+    thread = threading.Thread(
+        target=_run_switch_algo_job, args=(job, key_hex, store, max_workers, on_file_converted, jobs_dir), daemon=True
+    )
+    thread.start()
+
+    return job
+
+def _run_switch_algo_job(job: dict, key_hex: str, store: BlobStore, max_workers: int, on_file_converted: Callable[[int, str, dict], bool], jobs_dir: Path):
+    pool = get_reencrypt_pool(max_workers)
+    done = set(job['done'])
+    pending = deque(file for file in job['files'] if file['uuid'] not in done)
+    in_flight = {}
+
+    def mark_done(file: dict):
+        #a checkpoint csak egy hozzáfűzött sor, nem a teljes job újraírása
+        with _jobs_lock:
+            job['done'].append(file['uuid'])
+            job['files_done'] += 1
+            job['bytes_done'] += file['size']
+            job['updated_at'] = time.time()
+        _append_job_done(job, file, jobs_dir)
+
+    try:
+        #visszavont job: a már futó fájlok még befejeződnek, új nem indul
+        while (pending and job['status'] == "running") or in_flight:
+            #legfeljebb max_workers fájl van egyszerre a process pool-ban
+            while pending and job['status'] == "running" and len(in_flight) < max_workers:
+                file = pending.popleft()
+
+                #közben törölt (vagy letöltéskor már átalakított) fájl
+                if not store.exists(job['user_id'], file['uuid']):
+                    mark_done(file)
+                    continue
+
+                #a tároló a process pool-ba is átkerül (objektumtárnál a kliens ott, az első használatkor jön létre)
+                plan = plan_conversion(file, key_hex, job['key_epoch'], job['new_algo'])
+                future = pool.submit(reencrypt_file, store, job['user_id'], file['uuid'], plan['new_uuid'], plan['old_key_hex'], plan['old_algo'], plan['new_key_hex'], plan['new_algo'])
+                in_flight[future] = (file, plan)
+
+            if not in_flight:
+                continue
+
+            #kész fájlok átállítása az új fájlra
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                file, plan = in_flight.pop(future)
+                try:
+                    future.result()
+                except Exception:
+                    store.delete(job['user_id'], plan['new_uuid'])
+                    #közben eltűnt a régi fájl (törölték, vagy máshol átalakították)
+                    if store.exists(job['user_id'], file['uuid']):
+                        raise
+                else:
+                    finish_conversion(store, job['user_id'], file, plan, on_file_converted)
+                mark_done(file)
+
+        if job['status'] == "cancelled":
+            print(f"Job visszavonva: {job['id']} ({job['files_done']}/{job['files_total']} fájl kész)")
+            return
+
+        #minden fájl kész
+        job['status'] = "done"
+        print(f"Job kész: {job['id']} ({job['files_done']} fájl, → {job['new_algo']})")
+
+    except Exception as e:
+        #a még futó fájlok megvárása, majd a félkész új fájlok törlése
+        for future in in_flight:
+            future.cancel()
+        wait(in_flight)
+        for file, plan in in_flight.values():
+            store.delete(job['user_id'], plan['new_uuid'])
+        job['status'] = "failed"
+        job['error'] = str(e)
+        print(f"Job hiba: {job['id']} – {e}")
 
-    # log
-    print(f"Minden fájl kititkosítva ide: {to_dir}")
+    finally:
+        job['updated_at'] = time.time()
+        _save_job(job, jobs_dir)
+        if job['status'] in JOB_FINISHED:
+            _remove_job_files(job['user_id'], job['id'], jobs_dir)
+        #a zár elengedése: innentől a job nem fut (befejezett, vagy visszavont)
+        with _jobs_lock:
+            _jobs.pop(job['id'], None)
+            lock_file = _job_locks.pop(job['id'], None)
+        if lock_file is not None:
+            lock_file.close()
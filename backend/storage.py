@@ -0,0 +1,457 @@
+#######
+########## IMPORTS
+####
+
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, ALL_COMPLETED, FIRST_COMPLETED, wait
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional
+import threading
+import hashlib
+import time
+import io
+import os
+
+
+
+#######
+########## GLOBALS
+####
+
+#feltöltött fájlok helye: uploads/<user_id>/<ab>/<cd>/<uuid.kiterjesztés>, a fájlnév hash-éből képzett almappákban,
+#így nagy fájlszámnál is csak néhány ezer bejegyzés van egy mappában
+UPLOADS_DIR = Path("uploads")
+UPLOADS_FANOUT = int(os.getenv('UPLOADS_FANOUT') or 2)   # almappa szintek száma (0: minden fájl közvetlenül a user mappájában)
+UPLOADS_FANOUT_WIDTH = 2    # hex karakter szintenként (256 almappa)
+UPLOADS_MAX_FANOUT = 4      # eddig a mélységig keresi a korábbi elrendezésben maradt fájlokat
+
+#S3-kompatibilis objektumtár alapértékei
+S3_PART_SIZE = 8 * 1024 * 1024  # multipart feltöltés részmérete (az S3 minimuma 5 MiB, az utolsó rész kivételével)
+S3_UPLOAD_CONCURRENCY = 4       # egy feltöltésből egyszerre küldött részek száma
+S3_READ_SIZE = 4 * 1024 * 1024  # egy tartományos (Range) GET mérete olvasáskor
+S3_NOT_FOUND = ("404", "NoSuchKey", "NotFound")
+
+
+
+#######
+########## INTERFACE
+####
+
+class BlobStore(ABC):
+    #a fájlok tartalmának tárolása (user_id, uuid) kulccsal, a metaadatok a Repository-ban vannak
+
+    #olvasásra megnyitott, kereshető (seek) fájlszerű objektum; ha nincs ilyen fájl: FileNotFoundError
+    @abstractmethod
+    def open_read(self, user_id: int, file_uuid: str) -> BinaryIO: ...
+
+    #írásra megnyitott fájlszerű objektum; a fájl csak a blokk hibátlan lefutása után jelenik meg,
+    #hiba esetén a félig kiírt tartalom törlődik
+    @abstractmethod
+    def open_write(self, user_id: int, file_uuid: str): ...
+
+    #a tárolt fájl mérete, None ha nincs ilyen fájl
+    @abstractmethod
+    def size(self, user_id: int, file_uuid: str) -> Optional[int]: ...
+
+    #fájl törlése, False ha nem volt ilyen fájl
+    @abstractmethod
+    def delete(self, user_id: int, file_uuid: str) -> bool: ...
+
+    #a megnyitott fájl helye a helyi fájlrendszerben (a letöltés sendfile-lal mehet), objektumtárnál None
+    @abstractmethod
+    def local_path(self, blob: BinaryIO) -> Optional[Path]: ...
+
+    def exists(self, user_id: int, file_uuid: str) -> bool:
+        return self.size(user_id, file_uuid) is not None
+
+    #leállításkor (kapcsolatok, háttérszálak)
+    def close(self):
+        pass
+
+
+
+#######
+########## LOCAL
+####
+
+def user_file_path(user_id: int, file_uuid: str, uploads_dir: Path = UPLOADS_DIR, fanout: int = UPLOADS_FANOUT) -> Path:
+    #a fájl helye a jelenlegi elrendezésben (új fájlok ide kerülnek)
+    digest = hashlib.sha256(file_uuid.encode("utf-8")).hexdigest()
+    shards = [digest[level * UPLOADS_FANOUT_WIDTH:(level + 1) * UPLOADS_FANOUT_WIDTH] for level in range(fanout)]
+    return Path(uploads_dir, str(user_id), *shards, file_uuid)
+
+def _user_file_candidates(user_id: int, file_uuid: str, uploads_dir: Path) -> List[Path]:
+    #előbb a jelenlegi helyen, ha ott nincs, a régi elrendezésekben, végül újra a jelenlegi helyen
+    #(a migráció a régi helyről a jelenlegire mozgat, így a keresés közben áthelyezett fájl sem marad ki)
+    current = user_file_path(user_id, file_uuid, uploads_dir)
+    legacy = [user_file_path(user_id, file_uuid, uploads_dir, fanout) for fanout in range(UPLOADS_MAX_FANOUT + 1) if fanout != UPLOADS_FANOUT]
+    return [current, *legacy, current]
+
+def find_user_file(user_id: int, file_uuid: str, uploads_dir: Path = UPLOADS_DIR) -> Optional[Path]:
+    for path in _user_file_candidates(user_id, file_uuid, uploads_dir):
+        if path.is_file():
+            return path
+    return None
+
+def open_user_file(user_id: int, file_uuid: str, uploads_dir: Path = UPLOADS_DIR) -> BinaryIO:
+    for path in _user_file_candidates(user_id, file_uuid, uploads_dir):
+        try:
+            return path.open("rb")
+        except FileNotFoundError:
+            continue
+    raise FileNotFoundError(file_uuid)
+
+def remove_user_file(user_id: int, file_uuid: str, uploads_dir: Path = UPLOADS_DIR) -> bool:
+    for path in _user_file_candidates(user_id, file_uuid, uploads_dir):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            continue
+    return False
+
+def migrate_uploads_layout(uploads_dir: Path = UPLOADS_DIR, fanout: int = UPLOADS_FANOUT, dry_run: bool = False, pause: float = 0.0) -> dict:
+    #meglévő fájlok áthelyezése a jelenlegi elrendezés szerinti helyükre, futó szerver mellett
+    #(átnevezés: ugyanazon a fájlrendszeren atomikus, a már megnyitott fájlok olvashatók maradnak; többször is futtatható)
+    stats = {'moved': 0, 'in_place': 0, 'conflicts': 0}
+    if not Path(uploads_dir).is_dir():
+        return stats
+    for user_dir in sorted(Path(uploads_dir).iterdir()):
+        if not user_dir.is_dir() or not user_dir.name.isdigit():
+            continue
+        for root, _, filenames in os.walk(user_dir):
+            for filename in filenames:
+                #éppen íródó átmeneti fájl
+                if filename.startswith("."):
+                    continue
+                source = Path(root) / filename
+                target = user_file_path(user_dir.name, filename, uploads_dir, fanout)
+                if source == target:
+                    stats['in_place'] += 1
+                    continue
+                if target.exists():
+                    stats['conflicts'] += 1
+                    print(f"Már létezik: {target} (marad: {source})")
+                    continue
+                if not dry_run:
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    try:
+                        os.replace(source, target)
+                    except FileNotFoundError:
+                        #közben törölték vagy átalakították
+                        continue
+                    if pause:
+                        time.sleep(pause)
+                stats['moved'] += 1
+    return stats
+
+class LocalBlobStore(BlobStore):
+    #fájlok a helyi (vagy egy közösen csatolt) fájlrendszerben, a fenti almappás elrendezésben
+    def __init__(self, uploads_dir: Path = UPLOADS_DIR):
+        self.uploads_dir = Path(uploads_dir)
+
+    def open_read(self, user_id: int, file_uuid: str) -> BinaryIO:
+        return open_user_file(user_id, file_uuid, self.uploads_dir)
+
+    @contextmanager
+    def open_write(self, user_id: int, file_uuid: str) -> Iterator[BinaryIO]:
+        #átmeneti (ponttal kezdődő) fájlba ír, és csak a blokk hibátlan lefutása után nevezi át a végleges nevére:
+        #az olvasók és a listázás sosem látnak félig kiírt fájlt
+        path = user_file_path(user_id, file_uuid, self.uploads_dir)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        try:
+            with tmp_path.open("wb") as output_file:
+                yield output_file
+            os.replace(tmp_path, path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+    def size(self, user_id: int, file_uuid: str) -> Optional[int]:
+        for path in _user_file_candidates(user_id, file_uuid, self.uploads_dir):
+            try:
+                return path.stat().st_size
+            except FileNotFoundError:
+                continue
+        return None
+
+    def delete(self, user_id: int, file_uuid: str) -> bool:
+        return remove_user_file(user_id, file_uuid, self.uploads_dir)
+
+    def local_path(self, blob: BinaryIO) -> Optional[Path]:
+        return Path(blob.name)
+
+
+
+#######
+########## S3
+####
+
+def _is_not_found(error: Exception) -> bool:
+    response = getattr(error, "response", None) or {}
+    return str(response.get("Error", {}).get("Code")) in S3_NOT_FOUND
+
+class S3BlobReader(io.RawIOBase):
+    #objektum olvasása tartományos GET-ekkel: a szekvenciális olvasás S3_READ_SIZE-os darabokban halad,
+    #a seek (pl. Range letöltésnél a szegmensre ugrás) csak a szükséges részt kéri le
+    def __init__(self, client, bucket: str, key: str, size: int, read_size: int = S3_READ_SIZE):
+        self._client = client
+        self._bucket = bucket
+        self.key = key
+        self.size = size
+        self._read_size = read_size
+        self._position = 0
+        self._buffer = b""
+        self._buffer_start = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self._position = offset
+        return offset
+
+    def _fetch(self, wanted: int):
+        end = min(self._position + max(wanted, self._read_size), self.size) - 1
+        response = self._client.get_object(Bucket=self._bucket, Key=self.key, Range=f"bytes={self._position}-{end}")
+        with response["Body"] as body:
+            self._buffer = body.read()
+        self._buffer_start = self._position
+        if not self._buffer:
+            raise IOError(f"{self.key}: empty range response")
+
+    def prefetch(self, size: int):
+        #legalább size bájt (legfeljebb a fájl végéig) a pufferbe a jelenlegi pozíciótól: a hívó előre letöltheti
+        #(pl. az IO pool-on), amit a következő olvasások (pl. a CPU pool-on futó visszafejtés) kérni fognak
+        end = min(self._position + size, self.size)
+        offset = self._position - self._buffer_start
+        if self._position >= end or (0 <= offset and self._buffer_start + len(self._buffer) >= end):
+            return
+        self._fetch(end - self._position)
+
+    def readinto(self, buffer) -> int:
+        #a kért méretig olvas (a fájl végéig), így a read(n) rövid olvasást csak a fájl végén ad
+        view = memoryview(buffer).cast("B")
+        written = 0
+        while written < len(view) and self._position < self.size:
+            offset = self._position - self._buffer_start
+            if not 0 <= offset < len(self._buffer):
+                self._fetch(len(view) - written)
+                offset = 0
+            count = min(len(view) - written, len(self._buffer) - offset)
+            view[written:written + count] = self._buffer[offset:offset + count]
+            written += count
+            self._position += count
+        return written
+
+    def close(self):
+        self._buffer = b""
+        super().close()
+
+class S3BlobWriter(io.RawIOBase):
+    #írás multipart feltöltéssel: a beírt adat részenként, párhuzamosan megy fel (egyszerre legfeljebb
+    #upload_concurrency rész van úton, így a memóriahasználat korlátos); a kis fájlok egyetlen PUT-tal
+    def __init__(self, store: "S3BlobStore", key: str):
+        self._store = store
+        self.key = key
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._parts = {}
+        self._in_flight = set()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self._store.part_size:
+            part = bytes(self._buffer[:self._store.part_size])
+            del self._buffer[:self._store.part_size]
+            self._upload_part(part)
+        return len(data)
+
+    def _upload_part(self, data: bytes):
+        client = self._store.client
+        if self._upload_id is None:
+            self._upload_id = client.create_multipart_upload(Bucket=self._store.bucket, Key=self.key)["UploadId"]
+
+        #ha már upload_concurrency rész úton van, megvárja, amíg egy végez (a hibát azonnal továbbadja)
+        while len(self._in_flight) >= self._store.upload_concurrency:
+            self._collect(FIRST_COMPLETED)
+
+        part_number = len(self._parts) + len(self._in_flight) + 1
+        future = self._store.executor.submit(
+            client.upload_part, Bucket=self._store.bucket, Key=self.key, UploadId=self._upload_id, PartNumber=part_number, Body=data
+        )
+        future.part_number = part_number
+        self._in_flight.add(future)
+
+    def _collect(self, return_when):
+        finished, self._in_flight = wait(self._in_flight, return_when=return_when)
+        for future in finished:
+            self._parts[future.part_number] = future.result()["ETag"]
+
+    def commit(self):
+        client = self._store.client
+        if self._upload_id is None:
+            client.put_object(Bucket=self._store.bucket, Key=self.key, Body=bytes(self._buffer))
+        else:
+            if self._buffer:
+                self._upload_part(bytes(self._buffer))
+            self._collect(ALL_COMPLETED)
+            parts = [{'ETag': etag, 'PartNumber': number} for number, etag in sorted(self._parts.items())]
+            client.complete_multipart_upload(Bucket=self._store.bucket, Key=self.key, UploadId=self._upload_id, MultipartUpload={'Parts': parts})
+        self._buffer = bytearray()
+        super().close()
+
+    def abort(self):
+        #úton lévő részek megvárása, majd a befejezetlen multipart feltöltés eldobása (különben a tárhelyen maradna)
+        for future in self._in_flight:
+            future.cancel()
+        wait(self._in_flight)
+        self._in_flight = set()
+        if self._upload_id is not None:
+            try:
+                self._store.client.abort_multipart_upload(Bucket=self._store.bucket, Key=self.key, UploadId=self._upload_id)
+            except Exception as e:
+                print(f"Multipart feltöltés megszakítása sikertelen: {self.key} – {e}")
+        self._buffer = bytearray()
+        super().close()
+
+class S3BlobStore(BlobStore):
+    #fájlok S3-kompatibilis objektumtárban (AWS S3, MinIO, ...): <prefix><user_id>/<uuid> kulccsal
+    #a kliens és a részfeltöltő szálak processzenként, az első használatkor jönnek létre
+    #(a store így átadható a process pool-nak is)
+    def __init__(
+        self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None, region: Optional[str] = None,
+        access_key_id: Optional[str] = None, secret_access_key: Optional[str] = None,
+        part_size: int = S3_PART_SIZE, upload_concurrency: int = S3_UPLOAD_CONCURRENCY, read_size: int = S3_READ_SIZE,
+    ):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self.part_size = part_size
+        self.upload_concurrency = upload_concurrency
+        self.read_size = read_size
+        self._client = None
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state.update(_client=None, _executor=None, _pid=None, _lock=None)
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        import boto3
+        from botocore.config import Config
+
+        #a kapcsolat pool a párhuzamos részfeltöltéseket és a letöltéseket is kiszolgálja
+        config = Config(max_pool_connections=max(10, self.upload_concurrency * 2), retries={'mode': "standard"})
+        self._client = boto3.client(
+            "s3", endpoint_url=self.endpoint_url, region_name=self.region,
+            aws_access_key_id=self.access_key_id, aws_secret_access_key=self.secret_access_key, config=config,
+        )
+        self._executor = ThreadPoolExecutor(max_workers=self.upload_concurrency, thread_name_prefix="s3-upload")
+        self._pid = os.getpid()
+
+    def _ensure_connected(self):
+        with self._lock:
+            if self._client is None or self._pid != os.getpid():
+                self._connect()
+
+    @property
+    def client(self):
+        self._ensure_connected()
+        return self._client
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        self._ensure_connected()
+        return self._executor
+
+    def key(self, user_id: int, file_uuid: str) -> str:
+        return f"{self.prefix}{user_id}/{file_uuid}"
+
+    def _head(self, key: str) -> Optional[dict]:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)
+        except Exception as e:
+            if _is_not_found(e):
+                return None
+            raise
+
+    def open_read(self, user_id: int, file_uuid: str) -> BinaryIO:
+        key = self.key(user_id, file_uuid)
+        head = self._head(key)
+        if head is None:
+            raise FileNotFoundError(file_uuid)
+        return S3BlobReader(self.client, self.bucket, key, head["ContentLength"], self.read_size)
+
+    @contextmanager
+    def open_write(self, user_id: int, file_uuid: str) -> Iterator[BinaryIO]:
+        writer = S3BlobWriter(self, self.key(user_id, file_uuid))
+        try:
+            yield writer
+            writer.commit()
+        except BaseException:
+            writer.abort()
+            raise
+
+    def size(self, user_id: int, file_uuid: str) -> Optional[int]:
+        head = self._head(self.key(user_id, file_uuid))
+        return head["ContentLength"] if head is not None else None
+
+    def delete(self, user_id: int, file_uuid: str) -> bool:
+        #az S3 törlés nem jelzi, ha nem volt ilyen objektum, ezért előtte ellenőrizni kell
+        key = self.key(user_id, file_uuid)
+        if self._head(key) is None:
+            return False
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+        return True
+
+    def local_path(self, blob: BinaryIO) -> Optional[Path]:
+        return None
+
+    def close(self):
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=True)
+        self._client = None
+        self._executor = None
+
+
+
+#######
+########## FACTORY
+####
+
+def create_blob_store(backend: str, uploads_dir: Path = UPLOADS_DIR, s3_bucket: str = None, **s3_options) -> BlobStore:
+    if backend == "local":
+        return LocalBlobStore(uploads_dir)
+    if backend == "s3":
+        if not s3_bucket:
+            raise ValueError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+        return S3BlobStore(s3_bucket, **s3_options)
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
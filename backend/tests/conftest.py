@@ -0,0 +1,21 @@
+from pathlib import Path
+import tempfile
+import atexit
+import shutil
+import sys
+import os
+
+
+
+#a tesztek alapértelmezetten offline, beágyazott SQLite adatbázissal futnak
+#(élő Supabase projekt ellen: DB_BACKEND=supabase)
+TEST_ROOT = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ.setdefault("DB_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_PATH", os.path.join(TEST_ROOT, "test.db"))
+os.environ.setdefault("SESSION_KEY", "test-session-key")
+
+#az uploads, temp és jobs mappák (és a tesztek saját fájljai) futásonként új, ideiglenes munkakönyvtárba kerülnek,
+#így az új adatbázis újrakezdődő user id-jai nem találkoznak egy korábbi futás fájljaival
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.chdir(TEST_ROOT)
+atexit.register(shutil.rmtree, TEST_ROOT, ignore_errors=True)
@@ -1,13 +1,26 @@
 from fastapi.testclient import TestClient
 from pathlib import Path
-from server import app
+from server import app, get_repo, get_store
+from services import encrypt_file
+from security import hash_password
+from io import BytesIO
+import services
+import storage
+import server
 import pytest
 import uuid
+import json
+import hashlib
+import time
+import threading
+import subprocess
+import sys
 import os
 
 
 
 client = TestClient(app)
+repo = get_repo()
 
 
 
@@ -222,7 +235,7 @@ def test_file_upload_download_delete_success(unique_user):
 
     user_id = login_response.json()["user_id"]
     uploads_path = Path("uploads") / str(user_id)
-    uploaded_files = list(uploads_path.glob("*.txt"))
+    uploaded_files = list(uploads_path.rglob("*.txt"))
     assert len(uploaded_files) == 1
 
     os.remove(test_filename)
@@ -277,7 +290,7 @@ def test_encrypted_file_upload_download_delete_success(unique_user):
 
     user_id = login_response.json()["user_id"]
     uploads_path = Path("uploads") / str(user_id)
-    uploaded_files = list(uploads_path.glob("*.txt"))
+    uploaded_files = list(uploads_path.rglob("*.txt"))
     assert len(uploaded_files) == 1
 
     os.remove(test_filename)
@@ -408,7 +421,7 @@ def test_encrypted_download_invalid_sk(unique_user):
 
     user_id = login_response.json()["user_id"]
     uploads_path = Path("uploads") / str(user_id)
-    uploaded_files = list(uploads_path.glob("*.txt"))
+    uploaded_files = list(uploads_path.rglob("*.txt"))
     assert len(uploaded_files) == 1
 
     os.remove(test_filename)
@@ -458,7 +471,7 @@ def test_encrypted_delete_invalid_sk(unique_user):
 
     user_id = login_response.json()["user_id"]
     uploads_path = Path("uploads") / str(user_id)
-    uploaded_files = list(uploads_path.glob("*.txt"))
+    uploaded_files = list(uploads_path.rglob("*.txt"))
     assert len(uploaded_files) == 1
 
     os.remove(test_filename)
@@ -470,6 +483,219 @@ def test_encrypted_delete_invalid_sk(unique_user):
 
 
 
+def test_verify_secret_key_upgrades_bcrypt_hash(unique_user):
+    #regisztráció
+    register_response = client.post("/api/register", json=unique_user)
+    assert register_response.status_code == 200
+
+    #login
+    login_response = client.post("/api/login", json={
+        "email": unique_user["email"],
+        "password": unique_user["password"]
+    })
+    assert login_response.status_code == 200
+
+    #session_token
+    session_token = login_response.cookies["session_token"]
+    client.cookies.set("session_token", session_token)
+
+    #gen-sk
+    response = client.get("/api/gen-sk")
+    assert response.status_code == 200
+    key_hex = response.json()
+
+    #régi, bcrypt-tel hashelt kulcs szimulálása
+    user_id = login_response.json()["user_id"]
+    repo.update_user(user_id, {'secret_key_hash': hash_password(key_hex)})
+
+    #rossz kulcs
+    response = client.post("/api/verify-secret-key", params={"key_hex": "wrong-key-hex"})
+    assert response.json() is False
+
+    #helyes kulcs: az első sikeres ellenőrzés után a hash gyors key-check value-ra cserélődik
+    response = client.post("/api/verify-secret-key", params={"key_hex": key_hex})
+    assert response.json() is True
+    user = repo.get_user(user_id)
+    assert user['secret_key_hash'].startswith("hmac-sha256$")
+
+    response = client.post("/api/verify-secret-key", params={"key_hex": key_hex})
+    assert response.json() is True
+
+
+
+def test_rotate_secret_key_rewraps_data_keys(unique_user):
+    #regisztráció
+    register_response = client.post("/api/register", json=unique_user)
+    assert register_response.status_code == 200
+
+    #login
+    login_response = client.post("/api/login", json={
+        "email": unique_user["email"],
+        "password": unique_user["password"]
+    })
+    assert login_response.status_code == 200
+
+    #session_token
+    session_token = login_response.cookies["session_token"]
+    client.cookies.set("session_token", session_token)
+
+    #gen-sk
+    response = client.get("/api/gen-sk")
+    assert response.status_code == 200
+    key_hex = response.json()
+
+    #upload
+    test_filename = "test_rotate.txt"
+    test_content = b"Kulcscsere teszt."
+    response = client.post(
+        "/api/upload", params={"encrypted": "True", "key_hex": key_hex},
+        files={"files": (test_filename, test_content, "text/plain")}
+    )
+    assert response.status_code == 200
+    user_id = login_response.json()["user_id"]
+    old_file = repo.get_file(user_id, test_filename)
+
+    #rossz kulcs
+    response = client.post("/api/rotate-sk", json={"key_hex": "wrong-key-hex"})
+    assert response.status_code == 401
+
+    #kulcscsere: csak az adatkulcs csomagolása változik, a tárolt fájl ugyanaz marad
+    response = client.post("/api/rotate-sk", json={"key_hex": key_hex})
+    assert response.status_code == 200
+    new_key_hex = response.json()
+    assert len(new_key_hex) == 64 and new_key_hex != key_hex
+    new_file = repo.get_file(user_id, test_filename)
+    assert new_file['uuid'] == old_file['uuid']
+    assert new_file['wrapped_key'] != old_file['wrapped_key']
+
+    #a régi kulcs már nem érvényes, az új igen
+    response = client.post("/api/verify-secret-key", params={"key_hex": key_hex})
+    assert response.json() is False
+    response = client.get("/api/download", params={"filename": test_filename, "key_hex": key_hex})
+    assert response.status_code == 401
+    response = client.get("/api/download", params={"filename": test_filename, "key_hex": new_key_hex})
+    assert response.status_code == 200
+    assert response.content == test_content
+
+def test_rotate_secret_key_rejects_writes_with_the_old_key(unique_user):
+    #regisztráció
+    register_response = client.post("/api/register", json=unique_user)
+    assert register_response.status_code == 200
+
+    #login
+    login_response = client.post("/api/login", json={
+        "email": unique_user["email"],
+        "password": unique_user["password"]
+    })
+    assert login_response.status_code == 200
+
+    #session_token
+    session_token = login_response.cookies["session_token"]
+    client.cookies.set("session_token", session_token)
+
+    #gen-sk, upload
+    key_hex = client.get("/api/gen-sk").json()
+    response = client.post(
+        "/api/upload", params={"encrypted": "True", "key_hex": key_hex},
+        files={"files": ("epoch.txt", b"Epoch teszt.", "text/plain")}
+    )
+    assert response.status_code == 200
+    user_id = login_response.json()["user_id"]
+    old_user = repo.get_user(user_id)
+    old_file = repo.get_file(user_id, "epoch.txt")
+
+    #kulcscsere előtt elindult átalakítás (a régi kulccsal csomagolt adatkulccsal)
+    plan = services.plan_conversion({**old_file, 'algo': "AES-256"}, key_hex, old_user['key_epoch'], "ChaCha20")
+
+    #kulcscsere
+    response = client.post("/api/rotate-sk", json={"key_hex": key_hex})
+    assert response.status_code == 200
+    new_key_hex = response.json()
+    assert repo.get_user(user_id)['key_epoch'] == old_user['key_epoch'] + 1
+
+    #a félbemaradt átalakítás már nem írhatja át a sort
+    with pytest.raises(Exception):
+        server.finish_file_conversion(user_id, old_file['uuid'], plan)
+
+    #egy másik worker elavult (régi kulccsal feloldott) session-je nem használható
+    services.key_vault.unlock(session_token, user_id, key_hex, old_user['key_epoch'])
+    response = client.post(
+        "/api/upload", params={"encrypted": "True"},
+        files={"files": ("stale_vault.txt", b"Epoch teszt.", "text/plain")}
+    )
+    assert response.json()[0]["status"] == "failed"
+
+    #egy másik worker elavult gyorsítótárából (régi hash és epoch) jövő beszúrás
+    data_key_hex, wrapped_key = services.new_data_key(key_hex, "AES-256", "stale.txt")
+    with pytest.raises(Exception):
+        repo.create_files([{"filename": "stale.txt", "user_id": user_id, "encrypted": True, "uuid": "stale.txt", "wrapped_key": wrapped_key, "algo": "AES-256", "key_epoch": old_user['key_epoch']}])
+    assert not repo.get_file(user_id, "stale.txt")
+
+    #a fájl az új kulccsal olvasható
+    response = client.get("/api/download", params={"filename": "epoch.txt", "key_hex": new_key_hex})
+    assert response.status_code == 200
+    assert response.content == b"Epoch teszt."
+
+def test_legacy_files_with_current_algo_are_converted(unique_user):
+    #regisztráció
+    register_response = client.post("/api/register", json=unique_user)
+    assert register_response.status_code == 200
+
+    #login
+    login_response = client.post("/api/login", json={
+        "email": unique_user["email"],
+        "password": unique_user["password"]
+    })
+    assert login_response.status_code == 200
+
+    #session_token
+    session_token = login_response.cookies["session_token"]
+    client.cookies.set("session_token", session_token)
+
+    #gen-sk
+    response = client.get("/api/gen-sk")
+    assert response.status_code == 200
+    key_hex = response.json()
+
+    #két régi formátumú fájl a user jelenlegi algoritmusával (AES-256)
+    user_id = login_response.json()["user_id"]
+    for test_filename in ("a.txt", "b.txt"):
+        response = client.post(
+            "/api/upload", params={"encrypted": "True", "key_hex": key_hex},
+            files={"files": (test_filename, b"Teszt.", "text/plain")}
+        )
+        assert response.status_code == 200
+        file_row = repo.get_file(user_id, test_filename)
+        encrypt_file(BytesIO(b"Teszt."), get_store(), user_id, file_row["uuid"], key_hex, "AES-256")
+        repo.update_file(user_id, file_row['uuid'], {'wrapped_key': None, 'algo': "AES-256"})
+
+    #letöltés után háttérben envelope formátumra alakul, az algoritmus marad
+    response = client.get("/api/download", params={"filename": "a.txt", "key_hex": key_hex})
+    assert response.status_code == 200
+    assert response.content == b"Teszt."
+    file_row = repo.get_file(user_id, "a.txt")
+    assert file_row['wrapped_key'] and file_row['algo'] == "AES-256"
+
+    #kulcscsere: a maradék régi fájl job-ban alakul át, addig 409
+    response = client.post("/api/rotate-sk", json={"key_hex": key_hex})
+    assert response.status_code == 409
+    job_id = response.json()["job_id"]
+    for _ in range(100):
+        if client.get(f"/api/jobs/{job_id}").json()["status"] != "running":
+            break
+        time.sleep(0.1)
+    assert client.get(f"/api/jobs/{job_id}").json()["status"] == "done"
+    assert repo.get_file(user_id, "b.txt")['wrapped_key']
+
+    #a job után a kulcscsere sikerül, mindkét fájl olvasható az új kulccsal
+    response = client.post("/api/rotate-sk", json={"key_hex": key_hex})
+    assert response.status_code == 200
+    new_key_hex = response.json()
+    for test_filename in ("a.txt", "b.txt"):
+        response = client.get("/api/download", params={"filename": test_filename, "key_hex": new_key_hex})
+        assert response.status_code == 200
+        assert response.content == b"Teszt."
+
 def test_algos():
     response = client.get("/api/algos")
     assert response.status_code == 200
@@ -515,10 +741,167 @@ def test_switch_algo_with_encrypted_files_success(unique_user):
     
     os.remove(test_filename)
 
-    #switch algo
+    #switch algo (azonnal érvényes, a meglévő fájlok háttérben alakulnak át)
     response = client.post("/api/switch-algo", json={"algo": "ChaCha20", "key_hex": key_hex})
     assert response.status_code == 200
-    assert response.json() == {"message": "Algorithm updated to ChaCha20"}
+    assert response.json()["message"] == "Algorithm updated to ChaCha20"
+    assert "job_id" in response.json()
+
+    response = client.get("/api/user")
+    assert response.json()["algo"] == "ChaCha20"
+
+    #fájl az új algoritmussal is letölthető
+    response = client.get("/api/download", params={"filename": test_filename, "key_hex": key_hex})
+    assert response.status_code == 200
+    assert response.content == test_content
+
+def test_switch_algo_with_legacy_encrypted_files_job(unique_user):
+    #regisztráció
+    register_response = client.post("/api/register", json=unique_user)
+    assert register_response.status_code == 200
+
+    #login
+    login_response = client.post("/api/login", json={
+        "email": unique_user["email"],
+        "password": unique_user["password"]
+    })
+    assert login_response.status_code == 200
+
+    #session_token
+    session_token = login_response.cookies["session_token"]
+    client.cookies.set("session_token", session_token)
+
+    test_filename = "test_upload.txt"
+    test_content = b"Teszt."
+    with open(test_filename, "wb") as f:
+        f.write(test_content)
+
+    #gen-sk
+    response = client.get("/api/gen-sk")
+    assert response.status_code == 200
+    key_hex = response.json()
+
+    #upload
+    with open(test_filename, "rb") as f:
+        response = client.post(
+            "/api/upload", params={"encrypted":"True", "key_hex":key_hex},
+            files={"files": (test_filename, f, "text/plain")}
+        )
+
+    os.remove(test_filename)
+
+    #régi formátumú fájl szimulálása: tartalom közvetlenül a user kulcsával, becsomagolt adatkulcs és algoritmus nélkül
+    user_id = login_response.json()["user_id"]
+    file_row = repo.get_file(user_id, test_filename)
+    encrypt_file(BytesIO(test_content), get_store(), user_id, file_row["uuid"], key_hex, "AES-256")
+    repo.update_file(user_id, file_row['uuid'], {'wrapped_key': None, 'algo': None})
+
+    #switch algo (azonnal érvényes, a fájl háttér jobban alakul át)
+    response = client.post("/api/switch-algo", json={"algo": "ChaCha20", "key_hex": key_hex})
+    assert response.status_code == 200
+    assert response.json()["message"] == "Algorithm updated to ChaCha20"
+    job_id = response.json()["job_id"]
+
+    #job állapotának lekérdezése, amíg el nem készül
+    for _ in range(100):
+        response = client.get(f"/api/jobs/{job_id}")
+        assert response.status_code == 200
+        if response.json()["status"] != "running":
+            break
+        time.sleep(0.1)
+
+    job = response.json()
+    assert job["status"] == "done"
+    assert job["files_done"] == job["files_total"] == 1
+    assert job["bytes_done"] == job["bytes_total"]
+
+    #átalakított fájl envelope formátumú, rögzíti az új algoritmust és letölthető
+    file_row = repo.get_file(user_id, test_filename)
+    assert file_row['wrapped_key']
+    assert file_row['algo'] == "ChaCha20"
+    response = client.get("/api/download", params={"filename": test_filename, "key_hex": key_hex})
+    assert response.status_code == 200
+    assert response.content == test_content
+    assert len(list((Path("uploads") / str(user_id)).rglob("*.txt"))) == 1
+
+    #befejezett job: csak a kis állapot fájl marad (fájl lista és becsomagolt kulcsok nélkül), a megőrzési idő után törlődik
+    assert [path.name for path in (Path("jobs") / str(user_id)).iterdir()] == [f"{job_id}.json"]
+    services.prune_finished_jobs(Path("jobs"), retention=0)
+    assert client.get(f"/api/jobs/{job_id}").status_code == 404
+
+def test_switch_algo_resumes_paused_job(unique_user):
+    #regisztráció
+    register_response = client.post("/api/register", json=unique_user)
+    assert register_response.status_code == 200
+
+    #login
+    login_response = client.post("/api/login", json={
+        "email": unique_user["email"],
+        "password": unique_user["password"]
+    })
+    assert login_response.status_code == 200
+
+    #session_token
+    session_token = login_response.cookies["session_token"]
+    client.cookies.set("session_token", session_token)
+
+    #gen-sk, két titkosított fájl (AES-256)
+    key_hex = client.get("/api/gen-sk").json()
+    response = client.post(
+        "/api/upload", params={"encrypted": "True", "key_hex": key_hex},
+        files=[("files", ("a.txt", b"Teszt.", "text/plain")), ("files", ("b.txt", b"Teszt.", "text/plain"))]
+    )
+    assert response.status_code == 200
+    user_id = login_response.json()["user_id"]
+    rows = [repo.get_file(user_id, name) for name in ("a.txt", "b.txt")]
+
+    #újraindítás miatt szüneteltetett ChaCha20 váltás, az első fájl már kész a napló szerint
+    job_id = str(uuid.uuid4())
+    files = [{'uuid': row['uuid'], 'algo': "AES-256", 'wrapped_key': row['wrapped_key'], 'size': get_store().size(user_id, row['uuid'])} for row in rows]
+    user_dir = Path("jobs") / str(user_id)
+    user_dir.mkdir(parents=True)
+    (user_dir / f"{job_id}.json").write_text(json.dumps({
+        'id': job_id, 'type': "switch-algo", 'user_id': user_id, 'old_algo': "AES-256", 'new_algo': "ChaCha20",
+        'status': "paused", 'files_total': 2, 'files_done': 1, 'bytes_total': sum(file['size'] for file in files), 'bytes_done': files[0]['size'],
+        'run_started_at': time.time(), 'run_bytes_start': 0, 'created_at': time.time(), 'updated_at': time.time(), 'error': None,
+    }))
+    (user_dir / f"{job_id}.files").write_text(json.dumps(files))
+    (user_dir / f"{job_id}.done").write_text(f"{files[0]['uuid']} {files[0]['size']}\n")
+
+    #ugyanarra az algoritmusra váltás a szüneteltetett jobot folytatja
+    response = client.post("/api/switch-algo", json={"algo": "ChaCha20", "key_hex": key_hex})
+    assert response.status_code == 200
+    assert response.json()["job_id"] == job_id
+    for _ in range(100):
+        if client.get(f"/api/jobs/{job_id}").json()["status"] != "running":
+            break
+        time.sleep(0.1)
+    job = client.get(f"/api/jobs/{job_id}").json()
+    assert job["status"] == "done"
+    assert job["files_done"] == job["files_total"] == 2
+
+    #csak a még nem kész fájl alakult át
+    assert repo.get_file(user_id, "a.txt")['uuid'] == rows[0]['uuid']
+    assert repo.get_file(user_id, "b.txt")['algo'] == "ChaCha20"
+    for name in ("a.txt", "b.txt"):
+        response = client.get("/api/download", params={"filename": name, "key_hex": key_hex})
+        assert response.content == b"Teszt."
+
+def test_get_job_not_found(unique_user):
+    #regisztráció
+    client.post("/api/register", json=unique_user)
+
+    #login
+    login_response = client.post("/api/login", json={"email": unique_user["email"], "password": unique_user["password"]})
+    client.cookies.set("session_token", login_response.cookies["session_token"])
+
+    #nem létező job
+    response = client.get(f"/api/jobs/{uuid.uuid4()}")
+    assert response.status_code == 404
+
+    #érvénytelen job azonosító
+    response = client.get("/api/jobs/not-a-job-id")
+    assert response.status_code == 404
 
 def test_switch_algo_with_encrypted_files_invalid_sk(unique_user):
     #regisztráció
@@ -595,3 +978,724 @@ def test_switch_algo_with_no_encrypted_files(unique_user):
     response = client.post("/api/switch-algo", json={"algo": "ChaCha20"})
     assert response.status_code == 200
     assert response.json() == {"message": "Algorithm updated to ChaCha20"}
+
+def test_encrypted_file_range_download(unique_user):
+    #regisztráció
+    register_response = client.post("/api/register", json=unique_user)
+    assert register_response.status_code == 200
+
+    #login
+    login_response = client.post("/api/login", json={
+        "email": unique_user["email"],
+        "password": unique_user["password"]
+    })
+    assert login_response.status_code == 200
+
+    #session_token
+    session_token = login_response.cookies["session_token"]
+    client.cookies.set("session_token", session_token)
+
+    #több szegmensre kiterjedő fájl
+    test_filename = "test_upload.txt"
+    test_content = os.urandom(200 * 1024)
+    with open(test_filename, "wb") as f:
+        f.write(test_content)
+
+    #gen-sk
+    response = client.get("/api/gen-sk")
+    assert response.status_code == 200
+    key_hex = response.json()
+
+    #upload
+    with open(test_filename, "rb") as f:
+        response = client.post(
+            "/api/upload", params={"encrypted":"True", "key_hex":key_hex},
+            files={"files": (test_filename, f, "text/plain")}
+        )
+    assert response.json()[0]["status"] == "uploaded"
+
+    os.remove(test_filename)
+
+    #részleges letöltés szegmenshatáron át
+    response = client.get("/api/download", params={"filename": test_filename, "key_hex": key_hex}, headers={"Range": "bytes=65000-70000"})
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes 65000-70000/{len(test_content)}"
+    assert response.content == test_content[65000:70001]
+
+    #utolsó bájtok
+    response = client.get("/api/download", params={"filename": test_filename, "key_hex": key_hex}, headers={"Range": "bytes=-10"})
+    assert response.status_code == 206
+    assert response.content == test_content[-10:]
+
+    #teljesíthetetlen tartomány
+    response = client.get("/api/download", params={"filename": test_filename, "key_hex": key_hex}, headers={"Range": f"bytes={len(test_content)}-"})
+    assert response.status_code == 416
+
+    #fordított (érvénytelen) tartomány: figyelmen kívül marad, teljes fájl
+    response = client.get("/api/download", params={"filename": test_filename, "key_hex": key_hex}, headers={"Range": "bytes=5-2"})
+    assert response.status_code == 200
+    assert response.content == test_content
+
+def test_legacy_aes_file_verified_before_output():
+    #régi formátumú (iv | titkosított adat | tag) fájl: a tag ellenőrzéséig nem kerül ki visszafejtett adat
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    from cryptography.exceptions import InvalidTag
+    import security
+    key, iv, content = os.urandom(32), os.urandom(12), os.urandom(1000)
+    legacy = iv + AESGCM(key).encrypt(iv, content, None)
+    assert b"".join(security._aes_decrypt_legacy_stream(BytesIO(legacy), key, chunk_size=64)) == content
+
+    #módosított tag: már az első blokk előtt hiba
+    tampered = legacy[:-1] + bytes([legacy[-1] ^ 1])
+    with pytest.raises(InvalidTag):
+        next(security._aes_decrypt_legacy_stream(BytesIO(tampered), key, chunk_size=64))
+
+def test_unlock_secret_key(unique_user):
+    #regisztráció
+    register_response = client.post("/api/register", json=unique_user)
+    assert register_response.status_code == 200
+
+    #login
+    login_response = client.post("/api/login", json={
+        "email": unique_user["email"],
+        "password": unique_user["password"]
+    })
+    assert login_response.status_code == 200
+
+    #session_token
+    session_token = login_response.cookies["session_token"]
+    client.cookies.set("session_token", session_token)
+
+    #test fájl létrehozása
+    test_filename = "test_upload.txt"
+    test_content = b"Unlocked key test content"
+    with open(test_filename, "wb") as f:
+        f.write(test_content)
+
+    #gen-sk
+    response = client.get("/api/gen-sk")
+    assert response.status_code == 200
+    key_hex = response.json()
+
+    #rossz kulccsal nem oldható fel
+    response = client.post("/api/unlock", params={"key_hex": "00" * 32})
+    assert response.status_code == 401
+
+    #unlock
+    response = client.post("/api/unlock", params={"key_hex": key_hex})
+    assert response.status_code == 200
+
+    #upload kulcs nélkül
+    with open(test_filename, "rb") as f:
+        response = client.post(
+            "/api/upload", params={"encrypted":"True"},
+            files={"files": (test_filename, f, "text/plain")}
+        )
+    assert response.json()[0]["status"] == "uploaded"
+
+    os.remove(test_filename)
+
+    #download kulcs nélkül
+    response = client.get("/api/download", params={"filename": test_filename})
+    assert response.status_code == 200
+    assert response.content == test_content
+
+    #lock
+    response = client.post("/api/lock")
+    assert response.status_code == 200
+
+    #zárolás után újra kell a kulcs
+    response = client.get("/api/download", params={"filename": test_filename})
+    assert response.status_code == 400
+
+    #delete kulccsal
+    response = client.delete("/api/files", params={"filename": test_filename, "key_hex": key_hex})
+    assert response.status_code == 200
+
+def test_login_rejected_when_bcrypt_queue_full(unique_user):
+    #regisztráció
+    register_response = client.post("/api/register", json=unique_user)
+    assert register_response.status_code == 200
+
+    #bcrypt metrikák
+    response = client.get("/api/metrics")
+    assert response.status_code == 200
+    completed = response.json()["bcrypt"]["completed"]
+    assert completed >= 1
+
+    #telített bcrypt sor szimulálása
+    concurrency, queue_depth = services.BCRYPT_CONCURRENCY, services.BCRYPT_QUEUE_DEPTH
+    services.BCRYPT_CONCURRENCY, services.BCRYPT_QUEUE_DEPTH = 0, 0
+    try:
+        login_response = client.post("/api/login", json={
+            "email": unique_user["email"],
+            "password": unique_user["password"]
+        })
+    finally:
+        services.BCRYPT_CONCURRENCY, services.BCRYPT_QUEUE_DEPTH = concurrency, queue_depth
+    assert login_response.status_code == 429
+    assert int(login_response.headers["Retry-After"]) >= 1
+
+    #login a sor felszabadulása után
+    login_response = client.post("/api/login", json={
+        "email": unique_user["email"],
+        "password": unique_user["password"]
+    })
+    assert login_response.status_code == 200
+
+    response = client.get("/api/metrics")
+    assert response.json()["bcrypt"]["completed"] > completed
+    assert response.json()["bcrypt"]["rejected"] >= 1
+
+def test_user_cache_hit_and_invalidation(unique_user):
+    #regisztráció
+    register_response = client.post("/api/register", json=unique_user)
+    assert register_response.status_code == 200
+
+    #login
+    login_response = client.post("/api/login", json={
+        "email": unique_user["email"],
+        "password": unique_user["password"]
+    })
+    assert login_response.status_code == 200
+
+    #session_token
+    session_token = login_response.cookies["session_token"]
+    client.cookies.set("session_token", session_token)
+
+    #első lekérés betölti, a második már a gyorsítótárból jön
+    response = client.get("/api/user")
+    assert response.status_code == 200
+    hits = client.get("/api/metrics").json()["cache"]["user"]["hits"]
+    response = client.get("/api/user")
+    assert response.status_code == 200
+    assert client.get("/api/metrics").json()["cache"]["user"]["hits"] == hits + 1
+
+    #módosítás után a friss adat látszik
+    response = client.put("/api/user", params={"name": "Módosított Név"})
+    assert response.status_code == 200
+    response = client.get("/api/user")
+    assert response.json()["name"] == "Módosított Név"
+
+def test_file_lookups_do_not_load_whole_file_list(unique_user, monkeypatch):
+    #regisztráció
+    register_response = client.post("/api/register", json=unique_user)
+    assert register_response.status_code == 200
+
+    #login
+    login_response = client.post("/api/login", json={
+        "email": unique_user["email"],
+        "password": unique_user["password"]
+    })
+    assert login_response.status_code == 200
+
+    #session_token
+    session_token = login_response.cookies["session_token"]
+    client.cookies.set("session_token", session_token)
+
+    #upload
+    response = client.post("/api/upload", files={"files": ("cached.txt", b"cached", "text/plain")})
+    assert response.status_code == 200
+
+    #letöltés, törlés, feltöltés: csak a kért fájlnevek kerülnek lekérésre, a user teljes fájl listája soha
+    def no_full_list(*args, **kwargs):
+        raise AssertionError("full file list loaded")
+    monkeypatch.setattr(server.get_db().db, "list_files", no_full_list)
+    monkeypatch.setattr(server.get_repo().repo, "list_files", no_full_list)
+    requested = []
+    get_user_with_files = server.get_db().db.get_user_with_files
+    async def record_filenames(user_id, filenames):
+        requested.append(list(filenames))
+        return await get_user_with_files(user_id, filenames)
+    monkeypatch.setattr(server.get_db().db, "get_user_with_files", record_filenames)
+
+    response = client.get("/api/download", params={"filename": "cached.txt"})
+    assert response.status_code == 200
+    assert response.content == b"cached"
+    response = client.post("/api/upload", files={"files": ("cached.txt", b"again", "text/plain")})
+    assert response.json()[0]["status"] == "failed"
+    response = client.delete("/api/files", params={"filename": "cached.txt"})
+    assert response.status_code == 200
+    assert requested and all(filenames == ["cached.txt"] for filenames in requested)
+
+def test_upload_many_files_with_duplicates(unique_user):
+    #regisztráció
+    register_response = client.post("/api/register", json=unique_user)
+    assert register_response.status_code == 200
+
+    #login
+    login_response = client.post("/api/login", json={
+        "email": unique_user["email"],
+        "password": unique_user["password"]
+    })
+    assert login_response.status_code == 200
+
+    #session_token
+    session_token = login_response.cookies["session_token"]
+    client.cookies.set("session_token", session_token)
+
+    #már feltöltött fájl
+    response = client.post("/api/upload", files={"files": ("existing.txt", b"existing", "text/plain")})
+    assert response.json()[0]["status"] == "uploaded"
+
+    #sok fájl egy kérésben: a meglévő név és a kérésen belül ismétlődő név is ütközik
+    filenames = [f"file_{i}.txt" for i in range(250)]
+    filenames[210] = "existing.txt"
+    filenames[220] = "file_0.txt"
+    response = client.post("/api/upload", files=[("files", (filename, filename.encode(), "text/plain")) for filename in filenames])
+    assert response.status_code == 200
+
+    #a válasz sorrendje és formája változatlan
+    results = response.json()
+    assert [result["file"] for result in results] == filenames
+    assert results[210] == {"file": "existing.txt", "status": "failed", "error": "Filename already in use"}
+    assert results[220] == {"file": "file_0.txt", "status": "failed", "error": "Filename already in use"}
+    assert sum(result["status"] == "uploaded" for result in results) == 248
+
+    #minden sikeres fájl bekerült az adatbázisba
+    response = client.get("/api/files")
+    assert len(response.json()) == 249
+    response = client.get("/api/download", params={"filename": "file_249.txt"})
+    assert response.content == b"file_249.txt"
+
+def test_upload_bulk_insert_timeout_after_commit(unique_user, monkeypatch):
+    #regisztráció
+    register_response = client.post("/api/register", json=unique_user)
+    assert register_response.status_code == 200
+
+    #login
+    login_response = client.post("/api/login", json={
+        "email": unique_user["email"],
+        "password": unique_user["password"]
+    })
+    assert login_response.status_code == 200
+
+    #session_token
+    session_token = login_response.cookies["session_token"]
+    client.cookies.set("session_token", session_token)
+    user_id = login_response.json()["user_id"]
+
+    #a tömeges beszúrás lefut, de a válasz időtúllépéssel elvész
+    db = server.get_db().db
+    create_files = db.create_files
+    async def create_files_then_timeout(rows):
+        await create_files(rows)
+        raise TimeoutError("read timeout")
+    monkeypatch.setattr(db, "create_files", create_files_then_timeout)
+
+    response = client.post("/api/upload", files=[("files", (f"t{i}.txt", b"data", "text/plain")) for i in range(3)])
+    assert [result["status"] for result in response.json()] == ["uploaded"] * 3
+
+    #nincs ismétlődő sor, és a fájlok megmaradtak
+    files = repo.list_files(user_id)
+    assert sorted(file["filename"] for file in files) == ["t0.txt", "t1.txt", "t2.txt"]
+    assert all(get_store().exists(user_id, file["uuid"]) for file in files)
+
+def test_get_files_paginated(unique_user):
+    #regisztráció
+    register_response = client.post("/api/register", json=unique_user)
+    assert register_response.status_code == 200
+
+    #login
+    login_response = client.post("/api/login", json={
+        "email": unique_user["email"],
+        "password": unique_user["password"]
+    })
+    assert login_response.status_code == 200
+
+    #session_token
+    session_token = login_response.cookies["session_token"]
+    client.cookies.set("session_token", session_token)
+
+    #fájlok feltöltése (vessző, aposztróf és zárójel is lehet a fájlnévben)
+    filenames = ["a.txt", "b,1.txt", "c'2.txt", "d(3).txt", "e.txt"]
+    response = client.post("/api/upload", files=[("files", (filename, b"content", "text/plain")) for filename in filenames])
+    assert all(result["status"] == "uploaded" for result in response.json())
+
+    #lapozás fájlnév szerint csökkenő sorrendben, 2-es lapokkal
+    pages = []
+    params = {"limit": 2, "sort": "filename", "order": "desc"}
+    while True:
+        response = client.get("/api/files", params=params)
+        assert response.status_code == 200
+        pages.append(response.json())
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert [file["filename"] for page in pages for file in page] == sorted(filenames, reverse=True)
+
+    #alapértelmezetten csak a UI által használt mezők
+    assert set(pages[0][0]) == {"id", "filename", "encrypted", "created_at"}
+
+    #oszlop kiválasztás
+    response = client.get("/api/files", params={"limit": 1, "fields": "filename,algo"})
+    assert set(response.json()[0]) == {"filename", "algo"}
+    response = client.get("/api/files", params={"fields": "wrapped_key"})
+    assert response.status_code == 400
+
+    #más rendezéssel a kurzor nem használható
+    response = client.get("/api/files", params={"cursor": params["cursor"], "sort": "created_at"})
+    assert response.status_code == 400
+
+    #teljes lista NDJSON folyamként
+    response = client.get("/api/files", params={"format": "ndjson", "sort": "filename"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [file["filename"] for file in lines] == sorted(filenames)
+
+    #egy oldal NDJSON-ként, a következő oldal kurzora a fejlécben
+    response = client.get("/api/files", params={"format": "ndjson", "sort": "filename", "limit": 2})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line)["filename"] for line in response.text.splitlines()] == sorted(filenames)[:2]
+    assert "X-Next-Cursor" in response.headers
+
+def test_conditional_get_files_and_download(unique_user):
+    #regisztráció
+    register_response = client.post("/api/register", json=unique_user)
+    assert register_response.status_code == 200
+
+    #login
+    login_response = client.post("/api/login", json={
+        "email": unique_user["email"],
+        "password": unique_user["password"]
+    })
+    assert login_response.status_code == 200
+
+    #session_token
+    session_token = login_response.cookies["session_token"]
+    client.cookies.set("session_token", session_token)
+
+    #fájl feltöltése
+    response = client.post("/api/upload", files=[("files", ("a.txt", b"content", "text/plain"))])
+    assert response.json()[0]["status"] == "uploaded"
+
+    #fájl lista: változatlan lista esetén 304
+    response = client.get("/api/files")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    response = client.get("/api/files", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    #más paraméterekkel más ETag
+    response = client.get("/api/files", params={"format": "ndjson"}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+    #feltöltés után új ETag
+    client.post("/api/upload", files=[("files", ("b.txt", b"other", "text/plain"))])
+    response = client.get("/api/files", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    etag = response.headers["ETag"]
+
+    #törlés után új ETag
+    client.delete("/api/files", params={"filename": "b.txt"})
+    response = client.get("/api/files", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert [file["filename"] for file in response.json()] == ["a.txt"]
+    etag = response.headers["ETag"]
+
+    #másik worker írása (a gyorsítótár megkerülésével): a gyorsítótárazott user sor ellenére új ETag
+    server.get_repo().repo.bump_files_version(login_response.json()["user_id"])
+    response = client.get("/api/files", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+    #letöltés: a tartalom hash-e az ETag, változatlan tartalomnál 304
+    response = client.get("/api/download", params={"filename": "a.txt"})
+    assert response.status_code == 200
+    assert response.headers["ETag"] == f'"{hashlib.sha256(b"content").hexdigest()}"'
+    response = client.get("/api/download", params={"filename": "a.txt"}, headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+    assert response.content == b""
+
+def test_maintenance_runs_in_one_leader(tmp_path):
+    def wait_until(condition, timeout=3):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(0.02)
+        return condition()
+
+    #két "worker" ugyanazzal a zárfájllal
+    runs = {"first": 0, "second": 0}
+    first = services.MaintenanceLeader(tmp_path / ".maintenance.lock", interval=0.05)
+    second = services.MaintenanceLeader(tmp_path / ".maintenance.lock", interval=0.05)
+    first.start([lambda: runs.__setitem__("first", runs["first"] + 1)])
+    assert wait_until(lambda: first.is_leader)
+    second.start([lambda: runs.__setitem__("second", runs["second"] + 1)])
+    try:
+        #csak a vezető futtatja a feladatokat
+        time.sleep(0.3)
+        assert runs["first"] > 0
+        assert runs["second"] == 0
+        assert not second.is_leader
+
+        #a vezető leállása után a másik veszi át
+        first.stop()
+        assert wait_until(lambda: second.is_leader and runs["second"] > 0)
+    finally:
+        first.stop()
+        second.stop()
+
+def test_sweep_temp_dir_removes_orphans(tmp_path):
+    #lejárt fájl törlődik, friss és zárfájl marad
+    old_file = tmp_path / "old"
+    old_file.write_bytes(b"x")
+    lock_file = tmp_path / ".maintenance.lock"
+    lock_file.write_bytes(b"")
+    for path in (old_file, lock_file):
+        os.utime(path, (time.time() - 3600, time.time() - 3600))
+    new_file = tmp_path / "new"
+    new_file.write_bytes(b"x")
+
+    services.sweep_temp_dir(tmp_path, ttl=600)
+    assert new_file.exists() and lock_file.exists()
+    assert not old_file.exists()
+
+def test_create_app_without_clients():
+    #importálás és create_app: Supabase beállítások nélkül sem hibázik, kliens csak első használatkor jön létre
+    env = {key: value for key, value in os.environ.items() if key not in ("SUPABASE_URL", "SUPABASE_KEY")}
+    script = "import server; server.create_app(server.Settings(db_backend='supabase')); assert server._resources is None"
+    result = subprocess.run([sys.executable, "-c", script], cwd=Path(__file__).parent.parent, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+def test_async_supabase_clients_per_event_loop():
+    #loop-onként saját kliens; a lezárt loop kliense új loop-nál kiesik, leálláskor a kapcsolat pool lezárul
+    import asyncio
+    from repository import AsyncSupabaseRepository
+    db = AsyncSupabaseRepository(None, None, "http://localhost:54321", "test-key")
+
+    async def get_clients():
+        return db._get_client(), db._get_client()
+    first, again = asyncio.run(get_clients())
+    assert first is again
+
+    async def get_client_and_close():
+        client = db._get_client()
+        assert len(db._clients) == 1
+        http_client = db._clients[asyncio.get_running_loop()][1]
+        await db.close()
+        return client, http_client
+    second, http_client = asyncio.run(get_client_and_close())
+    assert second is not first
+    assert http_client.is_closed
+    assert db._clients == {}
+
+def test_empty_env_values_use_defaults():
+    #a .env.example üresen hagyott opcionális beállításai: az alapérték marad
+    env = {**os.environ, "BCRYPT_ROUNDS": "", "CPU_WORKERS": "", "KEY_VAULT_IDLE_TTL": "", "UPLOADS_FANOUT": "", "CACHE_TTL": "", "STORAGE_BACKEND": ""}
+    script = "import server; settings = server.Settings.from_env(); assert settings.cache_ttl == 30 and settings.storage_backend == 'local'"
+    result = subprocess.run([sys.executable, "-c", script], cwd=Path(__file__).parent.parent, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+def test_ready_after_warm_up():
+    #a readiness végpont a bemelegítés után ad 200-at
+    with TestClient(app) as ready_client:
+        deadline = time.time() + 30
+        while ready_client.get("/api/ready").status_code != 200 and time.time() < deadline:
+            time.sleep(0.1)
+        assert ready_client.get("/api/ready").json() == {"status": "ready"}
+
+def test_sharded_uploads_and_layout_migration(unique_user):
+    #regisztráció
+    register_response = client.post("/api/register", json=unique_user)
+    assert register_response.status_code == 200
+
+    #login
+    login_response = client.post("/api/login", json={
+        "email": unique_user["email"],
+        "password": unique_user["password"]
+    })
+    assert login_response.status_code == 200
+
+    #session_token
+    session_token = login_response.cookies["session_token"]
+    client.cookies.set("session_token", session_token)
+    user_id = login_response.json()["user_id"]
+
+    #feltöltés: a fájl a uuid hash-e szerinti almappába kerül
+    client.post("/api/upload", files=[("files", ("a.txt", b"content", "text/plain"))])
+    file_row = repo.get_file(user_id, "a.txt")
+    sharded_path = storage.user_file_path(user_id, file_row["uuid"])
+    assert sharded_path.is_file()
+    assert sharded_path.parent.parent.parent == Path("uploads") / str(user_id)
+
+    #régi, lapos elrendezésben lévő fájl is letölthető
+    flat_path = Path("uploads") / str(user_id) / file_row["uuid"]
+    os.replace(sharded_path, flat_path)
+    response = client.get("/api/download", params={"filename": "a.txt"})
+    assert response.status_code == 200
+    assert response.content == b"content"
+
+    #migráció: a fájl a helyére kerül, ismételt futtatás nem mozgat semmit
+    assert storage.migrate_uploads_layout(Path("uploads"))["moved"] >= 1
+    assert sharded_path.is_file() and not flat_path.exists()
+    assert storage.migrate_uploads_layout(Path("uploads"))["moved"] == 0
+
+    #törlés az új helyről
+    response = client.delete("/api/files", params={"filename": "a.txt"})
+    assert response.status_code == 200
+    assert not sharded_path.exists()
+
+def test_local_store_write_is_atomic(tmp_path):
+    store = storage.LocalBlobStore(tmp_path)
+    path = storage.user_file_path(1, "a.bin", tmp_path)
+
+    #írás közben a végleges helyen még nincs fájl, a migráció sem mozgatja az átmeneti fájlt
+    with store.open_write(1, "a.bin") as output_file:
+        output_file.write(b"content")
+        assert not path.exists()
+        assert storage.migrate_uploads_layout(tmp_path, fanout=0)["moved"] == 0
+    assert path.read_bytes() == b"content"
+
+    #hibás írás: a korábbi tartalom megmarad, átmeneti fájl nem marad vissza
+    with pytest.raises(RuntimeError):
+        with store.open_write(1, "a.bin") as output_file:
+            output_file.write(b"partial")
+            raise RuntimeError("upload interrupted")
+    assert path.read_bytes() == b"content"
+    assert sorted(entry.name for entry in path.parent.iterdir()) == ["a.bin"]
+
+@pytest.fixture
+def s3_store():
+    #S3 helyett moto (a boto3 hívások a processzen belül maradnak)
+    moto = pytest.importorskip("moto")
+    with moto.mock_aws():
+        store = storage.S3BlobStore("test-bucket", prefix="files/", region="us-east-1", access_key_id="test", secret_access_key="test", part_size=5 * 1024 * 1024, read_size=256 * 1024)
+        store.client.create_bucket(Bucket="test-bucket")
+        yield store
+        store.close()
+
+def test_s3_store_multipart_upload_and_ranged_reads(s3_store):
+    #a részméretnél nagyobb fájl párhuzamos multipart feltöltéssel, titkosítva
+    key_hex = os.urandom(32).hex()
+    test_content = os.urandom(11 * 1024 * 1024)
+    encrypt_file(BytesIO(test_content), s3_store, 1, "big.bin", key_hex, "AES-256")
+    head = s3_store.client.head_object(Bucket="test-bucket", Key="files/1/big.bin")
+    assert head["ETag"].endswith('-3"')
+
+    #teljes visszafejtés és tartomány (csak az érintett részek kerülnek lekérésre)
+    input_file = s3_store.open_read(1, "big.bin")
+    header = services.read_file_header(input_file)
+    assert services.decrypted_size(input_file, header) == len(test_content)
+    assert b"".join(services.decrypt_file_stream(s3_store.open_read(1, "big.bin"), key_hex, "AES-256")) == test_content
+    start, end = 7 * 1024 * 1024 + 5, 7 * 1024 * 1024 + 70000
+    assert b"".join(services.decrypt_file_range(input_file, key_hex, header, start, end)) == test_content[start:end + 1]
+
+    #hibás írás: a félbehagyott multipart feltöltés eldobódik, objektum nem jön létre
+    with pytest.raises(RuntimeError):
+        with s3_store.open_write(1, "broken.bin") as output_file:
+            output_file.write(os.urandom(6 * 1024 * 1024))
+            raise RuntimeError("upload interrupted")
+    assert not s3_store.exists(1, "broken.bin")
+    assert s3_store.client.list_multipart_uploads(Bucket="test-bucket").get("Uploads", []) == []
+
+    #törlés
+    assert s3_store.delete(1, "big.bin")
+    assert not s3_store.delete(1, "big.bin")
+    with pytest.raises(FileNotFoundError):
+        s3_store.open_read(1, "big.bin")
+
+def test_upload_download_with_s3_store(unique_user, s3_store, monkeypatch):
+    monkeypatch.setitem(server._get_resources(), "store", s3_store)
+
+    #a bucket hívások szálai (a CPU pool csak titkosít és visszafejt, nem vár a hálózatra)
+    s3_threads = []
+    for name in ("get_object", "put_object", "create_multipart_upload", "complete_multipart_upload"):
+        def record(*args, _call=getattr(s3_store.client, name), **kwargs):
+            s3_threads.append(threading.current_thread().name)
+            return _call(*args, **kwargs)
+        monkeypatch.setattr(s3_store.client, name, record)
+
+    #regisztráció
+    register_response = client.post("/api/register", json=unique_user)
+    assert register_response.status_code == 200
+
+    #login
+    login_response = client.post("/api/login", json={
+        "email": unique_user["email"],
+        "password": unique_user["password"]
+    })
+    assert login_response.status_code == 200
+
+    #session_token
+    session_token = login_response.cookies["session_token"]
+    client.cookies.set("session_token", session_token)
+    user_id = login_response.json()["user_id"]
+
+    #gen-sk
+    key_hex = client.get("/api/gen-sk").json()
+
+    #sima és titkosított feltöltés a bucket-be
+    plain_content = os.urandom(300 * 1024)
+    secret_content = os.urandom(200 * 1024)
+    response = client.post("/api/upload", files=[("files", ("plain.bin", plain_content, "application/octet-stream"))])
+    assert response.json()[0]["status"] == "uploaded"
+    response = client.post("/api/upload", params={"encrypted": "True", "key_hex": key_hex}, files=[("files", ("secret.bin", secret_content, "application/octet-stream"))])
+    assert response.json()[0]["status"] == "uploaded"
+    plain_row = repo.get_file(user_id, "plain.bin")
+    assert s3_store.size(user_id, plain_row["uuid"]) == len(plain_content)
+    assert not storage.find_user_file(user_id, plain_row["uuid"])
+
+    #letöltés folyamként, és tartomány az objektumtárból
+    response = client.get("/api/download", params={"filename": "plain.bin"})
+    assert response.status_code == 200
+    assert response.content == plain_content
+    assert response.headers["ETag"] == f'"{hashlib.sha256(plain_content).hexdigest()}"'
+    response = client.get("/api/download", params={"filename": "plain.bin"}, headers={"Range": "bytes=100000-100099"})
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes 100000-100099/{len(plain_content)}"
+    assert response.content == plain_content[100000:100100]
+    response = client.get("/api/download", params={"filename": "secret.bin", "key_hex": key_hex}, headers={"Range": "bytes=65000-70000"})
+    assert response.status_code == 206
+    assert response.content == secret_content[65000:70001]
+    response = client.get("/api/download", params={"filename": "secret.bin", "key_hex": key_hex})
+    assert response.status_code == 200
+    assert response.content == secret_content
+    assert s3_threads and not any(name.startswith("cpu") for name in s3_threads)
+
+    #törlés a bucket-ből
+    response = client.delete("/api/files", params={"filename": "plain.bin"})
+    assert response.status_code == 200
+    assert not s3_store.exists(user_id, plain_row["uuid"])
+
+def test_interrupted_job_progress_from_done_log(tmp_path):
+    #leállt processz jobja (a lock fájlját senki nem zárolja): az állapot fájl a kezdeti, a haladás a kész fájlok naplójából számolódik
+    job_id = str(uuid.uuid4())
+    files = [{'uuid': f"{i}.txt", 'algo': "AES-256", 'wrapped_key': None, 'size': 10} for i in range(3)]
+    job = {
+        'id': job_id, 'type': "switch-algo", 'user_id': 7, 'old_algo': "AES-256", 'new_algo': "ChaCha20",
+        'status': "running", 'files_total': 3, 'files_done': 0,
+        'bytes_total': 30, 'bytes_done': 0, 'run_started_at': time.time(), 'run_bytes_start': 0,
+        'created_at': time.time(), 'updated_at': time.time(), 'error': None,
+    }
+    user_dir = tmp_path / "7"
+    user_dir.mkdir()
+    (user_dir / f"{job_id}.json").write_text(json.dumps(job))
+    (user_dir / f"{job_id}.files").write_text(json.dumps(files))
+    (user_dir / f"{job_id}.done").write_text("0.txt 10\n1.txt 10\n2.t")
+
+    #amíg egy (másik) processz zárolja a lock fájlt, a job fut
+    lock_file = services._lock_job(7, job_id, tmp_path)
+    assert services._job_running(7, job_id, tmp_path)
+    services.pause_interrupted_jobs(tmp_path)
+    assert services.load_job(7, job_id, tmp_path)['status'] == "running"
+    lock_file.close()
+    assert not services._job_running(7, job_id, tmp_path)
+    assert services.find_unfinished_job(7, tmp_path)['status'] == "paused"
+
+    services.pause_interrupted_jobs(tmp_path)
+    job = services.load_job(7, job_id, tmp_path)
+    assert job['status'] == "paused"
+    assert (job['files_done'], job['bytes_done']) == (2, 20)
+    assert services.find_unfinished_job(7, tmp_path)['id'] == job_id
+    assert services.find_unfinished_job(8, tmp_path) is None
+
+    #visszavonás után a lista és a napló törlődik, a lejárt job az állapot fájllal együtt
+    assert services.cancel_job(job, tmp_path)
+    assert [path.name for path in user_dir.iterdir()] == [f"{job_id}.json"]
+    services.prune_finished_jobs(tmp_path, retention=0)
+    assert not user_dir.exists()